@@ -0,0 +1,265 @@
+#!/usr/bin/python3
+
+# benchmarks for tb.py, see the Benchmarks section of README.md
+
+import argparse
+import glob
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+import tb
+
+PROGRAMS = ['sample/*.bas', 'games/*.bas', 'bench/programs/*.bas']
+PARSE_SIZES = [10000, 100000, 1000000]
+SEED = 12345
+
+
+def programs():
+    result = []
+    for pattern in PROGRAMS:
+        result += sorted(glob.glob(os.path.join(ROOT_DIR, pattern)))
+    return result
+
+
+def fixture(path):
+    # the scripted input for a program, bench/inputs/<name>.in
+    name = os.path.splitext(os.path.basename(path))[0]
+    filename = os.path.join(BENCH_DIR, 'inputs', name + '.in')
+    if not os.path.exists(filename):
+        return ''
+    with open(filename) as file:
+        return file.read()
+
+
+def load(path, engine, optimize=False, profile=False):
+    with open(path) as file:
+        raw_lines = file.readlines()
+    tiny_basic = tb.TinyBasic(io.StringIO(fixture(path)), io.StringIO(), io.StringIO(), {}, [], 0, raw_lines)
+    tiny_basic.engine = engine
+    tiny_basic.max_cycles = 0
+    tiny_basic.optimize = optimize
+    tiny_basic.profile = profile
+    tiny_basic.parse_all()
+    return tiny_basic
+
+
+def execute(tiny_basic):
+    # the games ask again until the scripted input runs out
+    tiny_basic.random.seed(SEED)
+    try:
+        tiny_basic.execute()
+    except EOFError:
+        pass
+
+
+def statements(path):
+    # statements a program executes, counted by the profiler of the ast engine
+    tiny_basic = load(path, 'ast', profile=True)
+    execute(tiny_basic)
+    return sum(tiny_basic.profiler.counts)
+
+
+def peak(function):
+    # peak memory in KiB that Python allocated while function ran
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1] // 1024
+    finally:
+        tracemalloc.stop()
+
+
+def best(function, repeat):
+    # fastest of repeat runs of function, which returns the seconds it measured
+    return min(function() for i in range(repeat))
+
+
+def bench_program(path, engines, optimize, repeat):
+    count = statements(path)
+    result = {'statements': count, 'engines': {}}
+    for engine in engines:
+        def run():
+            tiny_basic = load(path, engine, optimize)
+            start = time.perf_counter()
+            execute(tiny_basic)
+            return time.perf_counter() - start
+        seconds = best(run, repeat)
+        name = engine + ('+O' if optimize else '')
+        result['engines'][name] = {
+            'seconds': seconds,
+            'statements_per_sec': count / seconds if seconds else 0.0,
+            'peak_kib': peak(lambda: execute(load(path, engine, optimize)))
+        }
+    return result
+
+
+def synthetic(lines):
+    # a program of the given number of lines using every statement
+    statements = [
+        'LET A = A + B * 2 - (C / 3)',
+        'PRINT "X=";X,TAB(10);Y * 2.5',
+        'IF A < 100 THEN LET B = ABS(A - 7) MOD 13',
+        'FOR I = 1 TO 10 STEP 2',
+        'LET S = SQR(I * I + INT(RND(1) * 100))',
+        'NEXT',
+        'REM nothing to see here',
+        'IF X >= Y THEN GOTO {next}',
+        'GOSUB {next}',
+        'LET Z = -X + 12345 * (Y - 1.5)'
+    ]
+    result = []
+    for i in range(lines):
+        line_number = (i + 1) * 10
+        statement = statements[i % len(statements)].format(next=line_number + 10)
+        result.append(f"{line_number} {statement}\n")
+    result.append(f"{(lines + 1) * 10} END\n")
+    return result
+
+
+def bench_parse(lines, repeat):
+    raw_lines = synthetic(lines)
+    bodies = [raw_line.split(' ', 1)[1] for raw_line in raw_lines]
+    def lex():
+        scanner = tb.Scanner()
+        start = time.perf_counter()
+        for body in bodies:
+            scanner.tokenize(body)
+        return time.perf_counter() - start
+    def parse():
+        tiny_basic = tb.TinyBasic(io.StringIO(), io.StringIO(), io.StringIO(), {}, [], 0, raw_lines)
+        start = time.perf_counter()
+        tiny_basic.parse_all()
+        return time.perf_counter() - start
+    def parse_only():
+        tiny_basic = tb.TinyBasic(io.StringIO(), io.StringIO(), io.StringIO(), {}, [], 0, raw_lines)
+        tiny_basic.parse_all()
+    lex_seconds = best(lex, repeat)
+    parse_seconds = best(parse, repeat)
+    return {
+        'lex_lines_per_sec': len(raw_lines) / lex_seconds,
+        'parse_lines_per_sec': len(raw_lines) / parse_seconds,
+        'peak_kib': peak(parse_only)
+    }
+
+
+def bench_startup(repeat):
+    # seconds to start tb.py and run a small program
+    filename = os.path.join(ROOT_DIR, 'sample', 'factorial.bas')
+    def start():
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(ROOT_DIR, 'tb.py'), filename],
+                       stdout=subprocess.DEVNULL, check=True)
+        return time.perf_counter() - start
+    return {'seconds': best(start, repeat)}
+
+
+def flatten(results, prefix=''):
+    # {'programs/sample/pi.bas/engines/ast/seconds': 0.01, ...} of the numbers in results
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}/{key}" if prefix else str(key)
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(results, baseline):
+    # the metrics of both results, with the change against the baseline
+    current, before = flatten(results['benchmarks']), flatten(baseline['benchmarks'])
+    report = f"{'metric':<60} {'baseline':>14} {'current':>14} {'change':>8}\n"
+    for name in sorted(current):
+        if name not in before or name.endswith('/statements'):
+            continue
+        old, new = before[name], current[name]
+        change = (new - old) * 100 / old if old else 0.0
+        better = change > 0 if name.endswith('_per_sec') else change < 0
+        mark = '+' if better and abs(change) >= 5 else '-' if abs(change) >= 5 else ' '
+        report += f"{name:<60} {old:>14.6g} {new:>14.6g} {change:>7.1f}% {mark}\n"
+    return report
+
+
+def report(results):
+    benchmarks = results['benchmarks']
+    text = f"{'program':<32} {'engine':<10} {'statements':>11} {'seconds':>9} {'stmts/sec':>11} {'peak KiB':>9}\n"
+    for path, program in benchmarks['programs'].items():
+        for engine, result in program['engines'].items():
+            text += f"{path:<32} {engine:<10} {program['statements']:>11} {result['seconds']:>9.4f} " \
+                    f"{result['statements_per_sec']:>11.0f} {result['peak_kib']:>9}\n"
+    text += f"\n{'parse lines':>11} {'lex lines/sec':>14} {'parse lines/sec':>16} {'peak KiB':>9}\n"
+    for lines, result in benchmarks['parse'].items():
+        text += f"{lines:>11} {result['lex_lines_per_sec']:>14.0f} {result['parse_lines_per_sec']:>16.0f} " \
+                f"{result['peak_kib']:>9}\n"
+    text += f"\nstartup: {benchmarks['startup']['seconds']:.4f} seconds\n"
+    return text
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='bench.py', description='Tiny Basic benchmarks')
+    parser.add_argument('--engines', default=','.join(tb.ENGINES),
+                        help='comma separated engines to run the programs on (default all)')
+    parser.add_argument('-O', '--optimize', action='store_true', help='run the programs optimized as well')
+    parser.add_argument('--programs', default=None,
+                        help='run only programs whose path contains this text, for example games/')
+    parser.add_argument('--sizes', default=None,
+                        help='comma separated line counts of the synthetic programs to lex and parse '
+                             '(default ' + ','.join(str(size) for size in PARSE_SIZES) + ')')
+    parser.add_argument('--repeat', type=int, default=None, help='runs per benchmark, the fastest counts (default 3)')
+    parser.add_argument('--quick', action='store_true',
+                        help='one run each and only 10000 line programs to parse, '
+                             'unless --repeat or --sizes say otherwise')
+    parser.add_argument('--save', metavar='FILE', help='write the results to FILE as JSON')
+    parser.add_argument('--baseline', metavar='FILE', help='compare the results with the ones saved in FILE')
+    args = parser.parse_args(argv)
+    if args.repeat is not None:
+        repeat = args.repeat
+    else:
+        repeat = 1 if args.quick else 3
+    engines = args.engines.split(',')
+    if args.sizes is not None:
+        sizes = [int(size) for size in args.sizes.split(',')]
+    else:
+        sizes = PARSE_SIZES[:1] if args.quick else PARSE_SIZES
+
+    benchmarks = {'programs': {}, 'parse': {}}
+    for path in programs():
+        name = os.path.relpath(path, ROOT_DIR)
+        if args.programs and args.programs not in name:
+            continue
+        print(f"running {name}", file=sys.stderr)
+        benchmarks['programs'][name] = bench_program(path, engines, False, repeat)
+        if args.optimize:
+            optimized = bench_program(path, engines, True, repeat)
+            benchmarks['programs'][name]['engines'].update(optimized['engines'])
+    for lines in sizes:
+        print(f"parsing {lines} lines", file=sys.stderr)
+        benchmarks['parse'][str(lines)] = bench_parse(lines, repeat)
+    benchmarks['startup'] = bench_startup(repeat)
+    results = {
+        'python': sys.version,
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'benchmarks': benchmarks
+    }
+
+    print(report(results))
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            print(compare(results, json.load(file)))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,17 @@
+10 REM longest collatz chain for every start below 2000
+20 LET M = 0
+30 FOR S = 1 TO 2000
+40 LET X = S
+50 LET C = 0
+60 IF X = 1 THEN GOTO 120
+70 IF X MOD 2 = 0 THEN GOTO 100
+80 LET X = 3 * X + 1
+90 GOTO 110
+100 LET X = INT(X / 2)
+110 LET C = C + 1
+115 GOTO 60
+120 IF C > M THEN LET B = S
+130 IF C > M THEN LET M = C
+140 NEXT
+150 PRINT "LONGEST CHAIN BELOW 2000 STARTS AT";B;"WITH";M;"STEPS"
+160 END
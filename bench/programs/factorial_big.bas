@@ -0,0 +1,10 @@
+10 REM factorials up to 400, summing the last digits
+20 FOR R = 1 TO 100
+30 LET F = 1
+40 FOR I = 1 TO 400
+50 LET F = F*I
+60 LET D = D + F MOD 10
+70 NEXT
+80 NEXT
+90 PRINT "DIGITS:";D;"LAST:";F MOD 1000000007
+100 END
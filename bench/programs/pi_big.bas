@@ -0,0 +1,11 @@
+10 REM compute PI with 100000 random points
+20 FOR I = 1 TO 100000
+30 LET X = RND(1)
+40 LET Y = RND(1)
+50 IF X*X + Y*Y > 1 THEN GOTO 80
+60 LET C = C + 1
+70 GOTO 100
+80 LET S = S + 1
+100 NEXT
+110 PRINT "PI:",C/(S+C)*4
+120 END
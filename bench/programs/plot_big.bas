@@ -0,0 +1,13 @@
+10 REM plot a parabola and a sine wave, 2000 lines of output
+20 FOR X = -500 TO 499 STEP 1
+30 LET Y = X*X/5000
+40 PRINT "I", TAB(1+Y), "*"
+50 NEXT
+60 FOR I = 0 TO 999
+70 LET A = I/20
+80 REM sin a = a - a^3/3! + a^5/5! - a^7/7!, a reduced to -pi..pi
+90 LET A = A - INT(A/6.283185)*6.283185 - 3.141592
+100 LET S = A - A*A*A/6 + A*A*A*A*A/120 - A*A*A*A*A*A*A/5040
+110 PRINT I;TAB(10);"|";TAB(40+INT(30*S));"*"
+120 NEXT
+130 END
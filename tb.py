@@ -2,9 +2,26 @@
 
 # based on https://ruslanspivak.com/lsbasi-part1/
 
+import argparse
+import array
+import bisect
+import builtins
+import collections.abc
+import copy
+import functools
+import io
+import itertools
+import json
+import os
 import string
 import math
+import operator
 import random
+import re
+import signal
+import sys
+import threading
+import time
 
 ANY = 'any'
 REM = 'REM'
@@ -50,10 +67,77 @@ NEQUALS = '<>'
 LPAREN = '('
 RPAREN = ')'
 EOL = 'EOL'
+LINE = 'LINE'
 
 MAX_CYCLES = 10000
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join('~', '.cache'), 'tinybasic')
+JIT_THRESHOLD = 50
+JIT_MAX_TRACE = 1000
+JIT_MAX_ABORTS = 3
+OUTPUT_BUFFER_SIZE = 8192
+OUTPUT_BUFFER_TIME = 0.5
+SAMPLE_INTERVAL = 0.001
+MEMO_SIZE = 4096
+HOOK_BATCH = 1024
+PARSE_CHUNK = 1000
+RND_BUFFER = 65536
+
+# imported by the first Batch, numpy is only needed to run batches and takes long to import
+numpy = None
+# hashlib, hmac, pickle, multiprocessing and statistics are imported by the few functions that need them,
+# so that running a program does not wait for them either
+
+ENGINES = {
+    'ast':     'run',
+    'closure': 'run_closure',
+    'python':  'run_python',
+    'vm':      'run_vm',
+    'jit':     'run_jit'
+}
+
+OP_COUNT = 0
+OP_MOVE = 1
+OP_ADD = 2
+OP_SUB = 3
+OP_MUL = 4
+OP_DIV = 5
+OP_MOD = 6
+OP_NEG = 7
+OP_SQR = 8
+OP_INT = 9
+OP_ABS = 10
+OP_RND = 11
+OP_IF_EQ = 12
+OP_IF_NE = 13
+OP_IF_LT = 14
+OP_IF_LE = 15
+OP_IF_GT = 16
+OP_IF_GE = 17
+OP_UNLESS_EQ = 18
+OP_UNLESS_NE = 19
+OP_UNLESS_LT = 20
+OP_UNLESS_LE = 21
+OP_UNLESS_GT = 22
+OP_UNLESS_GE = 23
+OP_JUMP = 24
+OP_GOTO = 25
+OP_GOSUB = 26
+OP_GOSUB_TO = 27
+OP_RETURN = 28
+OP_NEXT = 29
+OP_INPUT = 30
+OP_PRINT_STR = 31
+OP_PRINT_VALUE = 32
+OP_PRINT_TAB = 33
+OP_PRINT_END = 34
+OP_HALT = 35
+OP_PRINT_INT = 36
+
+OPCODE_NAMES = {value: name[3:] for name, value in list(globals().items()) if name.startswith('OP_')}
+
 
 class Token(object):
+    __slots__ = ('type', 'value')
 
     def __init__(self, type, value = None):
         self.type = type
@@ -97,6 +181,7 @@ IMMEDIATE_KEYWORDS = {
 
 
 EOLT = Token(EOL)
+ONET = Token(NUMBER, 1)
 
 class Lexer(object):
 
@@ -229,60 +314,181 @@ class Lexer(object):
 
             if token != None:
                 self.skip_whitespace()
-                token.peek_char = self.current_char
                 return token
             
         return EOLT
 
+
+OPERATOR_TOKENS = {
+    '=':  Token(EQUALS, '='),
+    '<>': Token(NEQUALS, '<>'),
+    '<=': Token(LTE, '<='),
+    '<':  Token(LT, '<'),
+    '>=': Token(GTE, '>='),
+    '>':  Token(GT, '>'),
+    ',':  Token(COMMA, ','),
+    ';':  Token(SEMICOLON, ';'),
+    '+':  Token(PLUS, '+'),
+    '-':  Token(MINUS, '-'),
+    '*':  Token(MUL, '*'),
+    '/':  Token(DIV, '/'),
+    '(':  Token(LPAREN, '('),
+    ')':  Token(RPAREN, ')')
+}
+
+# ASCII only, anything else is left to Lexer so the result stays the same
+TOKEN_PATTERN = re.compile(r"""
+    [\x20\t\n\r\x0b\x0c\x1c-\x1f]*
+    (?:
+        (<>|<=|>=|[=<>,;+\-*/()])
+      | ([Rr][Ee][Mm])(?![A-Za-z0-9_]|[^\x00-\x7f])(.*)
+      | ([A-Za-z][A-Za-z0-9_]*)(?![A-Za-z0-9_]|[^\x00-\x7f])
+      | ([0-9](?:[0-9.]|E-?)*)(?![0-9.E]|(?<=E)-|[^\x00-\x7f])
+      | ("[^"]*")
+      | ([^\x20\t\n\r\x0b\x0c\x1c-\x1f])
+    )""", re.VERBOSE | re.DOTALL)
+
+
+class Scanner(object):
+    """Tokenizes with one compiled regex instead of character by character.
+
+    Gives the same tokens as Lexer. Keywords and operators are shared
+    instances and identifiers and numbers are interned per scanner, so
+    tokens must not be modified. Text the pattern does not cover, like
+    non-ASCII letters outside of strings or a missing closing quote, goes
+    through Lexer, which also raises the errors.
+    """
+
+    def __init__(self):
+        self.words = {}
+        self.numbers = {}
+
+    def word(self, value):
+        token = LANGUAGE_KEYWORDS.get(value.upper())
+        if token is None:
+            token = Token(ID, value)
+        self.words[value] = token
+        return token
+
+    def number(self, value):
+        try:
+            token = Token(NUMBER, int(value))
+        except:
+            token = Token(NUMBER, float(value))
+        self.numbers[value] = token
+        return token
+
+    def tokenize(self, text, pos=0, end=None):
+        # tokens of text[pos:end], without the EOL token
+        if end is None:
+            end = len(text)
+        if pos == end:
+            return self.lex(text[pos:end])
+        tokens = []
+        words, numbers = self.words, self.numbers
+        for operator, rem, comment, word, number, string, other in TOKEN_PATTERN.findall(text, pos, end):
+            if operator:
+                tokens.append(OPERATOR_TOKENS[operator])
+            elif word:
+                tokens.append(words.get(word) or self.word(word))
+            elif rem:
+                tokens.append(Token(REM, comment))
+            elif number:
+                tokens.append(numbers.get(number) or self.number(number))
+            elif string:
+                tokens.append(Token(STRING, string[1:-1]))
+            else:
+                return self.lex(text[pos:end])
+        return tokens
+
+    def lex(self, line):
+        tokens = []
+        lexer = Lexer(line)
+        while (True):
+            token = lexer.get_next_token()
+            if token.type == EOL:
+                break
+            tokens.append(token)
+        return tokens
+
 class AST(object):
-    def visit(self):
+    # nodes only hold the program, visit(ctx) gets the vars, stack, input and output of the
+    # interpreter running it from ctx
+    __slots__ = ()
+
+    def visit(self, ctx):
         pass
     def __repr__(self):
         return self.__str__()
 
 class LetStatement(AST):
-    def __init__(self, var, expr, vars):
+    __slots__ = ('var', 'expr')
+
+    def __init__(self, var, expr):
         self.var = var
         self.expr = expr
-        self.vars = vars
 
-    def visit(self):
-        self.vars[self.var.name] = self.expr.visit()        
+    def visit(self, ctx):
+        ctx.vars[self.var.name] = self.expr.visit(ctx)        
 
     def __str__(self):
         return f"LET {self.var} = {self.expr}"
 
 
 class PrintStatement(AST):
-    def __init__(self, output, expr_list):
-        self.output = output
+    __slots__ = ('expr_list', 'parts')
+
+    def __init__(self, expr_list):
         self.expr_list = expr_list
+        self.parts = self.compile([False] * len(expr_list))
 
-    def visit(self):
-        pos = 0
-        for expr in self.expr_list:      
+    def compile(self, ints):
+        # the line as (kind, value) pairs: STRING text, NUMBER and INTEGER exprs, TAB position exprs
+        parts = []
+        text = ''
+        for expr, exact in zip(self.expr_list, ints):
             if isinstance(expr, Token):
                 if expr.type == SEMICOLON:
-                    self.output.write(" ")
-                    pos += 1
-                elif expr.type == COMMA:
-                    pass
-            elif isinstance(expr, Tab):
-                next_pos = int(expr.visit())
-                if next_pos > pos:
-                    self.output.write(" " * (next_pos - pos))
-                    pos = next_pos
+                    text += " "
+            elif isinstance(expr, String):
+                text += expr.value
             else:
-                res = expr.visit()
-                if isinstance(res, float):
-                    s = "{:.2f}".format(res)
+                if text:
+                    parts.append((STRING, text))
+                    text = ''
+                if isinstance(expr, Tab):
+                    parts.append((TAB, expr.expr))
                 else:
-                    s = res
-                pos += len(str(s))
-                self.output.write(str(s))
-        if not(isinstance(expr, Token) and expr.type == COMMA):
-            self.output.write("\n")            
-        self.output.flush()
+                    parts.append((INTEGER if exact else NUMBER, expr))
+        last = self.expr_list[-1]
+        if not(isinstance(last, Token) and last.type == COMMA):
+            text += "\n"
+        if text:
+            parts.append((STRING, text))
+        return parts
+
+    def visit(self, ctx):
+        # the line is written at once, also the part of it before a value that raises
+        line = ''
+        try:
+            for kind, value in self.parts:
+                if kind == STRING:
+                    line += value
+                elif kind == INTEGER:
+                    line += str(value.visit(ctx))
+                elif kind == NUMBER:
+                    res = value.visit(ctx)
+                    if isinstance(res, float):
+                        line += "{:.2f}".format(res)
+                    else:
+                        line += str(res)
+                else:
+                    next_pos = int(value.visit(ctx))
+                    if next_pos > len(line):
+                        line += " " * (next_pos - len(line))
+        finally:
+            ctx.output.write(line)
+            ctx.output.flush()
 
     def __str__(self):
         s = ''
@@ -291,22 +497,36 @@ class PrintStatement(AST):
         return "PRINT {}".format(s)
 
 
+class IntPrintStatement(PrintStatement):
+    """A PRINT that knows which of its values can never be floats.
+
+    ints has a flag for every entry of expr_list, flagged values are
+    written with str() instead of being checked for float formatting.
+    """
+
+    __slots__ = ('ints',)
+
+    def __init__(self, expr_list, ints):
+        self.expr_list = expr_list
+        self.ints = ints
+        self.parts = self.compile(ints)
+
+
 class InputStatement(AST):
-    def __init__(self, input, output, var_list, vars):
-        self.input = input
-        self.output = output
+    __slots__ = ('var_list',)
+
+    def __init__(self, var_list):
         self.var_list = var_list
-        self.vars = vars
 
-    def visit(self):
+    def visit(self, ctx):
         for var in self.var_list:
-            self.output.write("?")
-            self.output.flush()
-            value = self.input.readline()
+            ctx.output.write("?")
+            ctx.output.flush()
+            value = ctx.input.readline()
             if value == '':
                 raise EOFError("no input")
             try:                
-                self.vars[var.name] = int(value.strip())
+                ctx.vars[var.name] = int(value.strip())
             except:
                 raise Exception(f"not an int: {value}")
 
@@ -318,89 +538,137 @@ class InputStatement(AST):
 
 
 class IfStatement(AST):
+    __slots__ = ('bool_expr', 'then_statement')
+
     def __init__(self, bool_expr, then_statement):
         self.bool_expr = bool_expr
         self.then_statement = then_statement
 
-    def visit(self):
-        cond = self.bool_expr.visit()
+    def visit(self, ctx):
+        cond = self.bool_expr.visit(ctx)
         if cond == True:
-            return self.then_statement.visit()
+            return self.then_statement.visit(ctx)
 
     def __str__(self):
         return f"IF {self.bool_expr} THEN {self.then_statement}"
 
 
 class GotoStatement(AST):
+    __slots__ = ('expr',)
+
     def __init__(self, expr):
         self.expr = expr
 
-    def visit(self):
-        return self.expr.visit()
+    def visit(self, ctx):
+        return self.expr.visit(ctx)
 
     def __str__(self):
         return f"GOTO {self.expr}"
 
 
 class GosubStatement(AST):
-    def __init__(self, expr, line_number, stack):
+    __slots__ = ('expr', 'line_number')
+
+    def __init__(self, expr, line_number):
         self.expr = expr
         self.line_number = line_number
-        self.stack = stack
 
-    def visit(self):
-        self.stack.append(self.line_number)
-        return self.expr.visit()
+    def visit(self, ctx):
+        ctx.stack.append(self.line_number)
+        return self.expr.visit(ctx)
 
     def __str__(self):
         return f"GOSUB {self.expr}"
 
 
 class ReturnStatement(AST):
-    def __init__(self, stack):
-        self.stack = stack
+    __slots__ = ()
 
-    def visit(self):
-        return -self.stack.pop()
+    def visit(self, ctx):
+        return -ctx.stack.pop()
 
     def __str__(self):
         return "RETURN"
 
 
+class MemoGosubStatement(GosubStatement):
+    """A GOSUB to a pure subroutine, which is skipped if its cache has the result.
+
+    A skipped call still counts the statements it ran when it was cached
+    in ctx.executed, which TinyBasic.run_memoized keeps up to date.
+    """
+
+    __slots__ = ('cache', 'frames')
+
+    def __init__(self, gosub, cache, frames):
+        super().__init__(gosub.expr, gosub.line_number)
+        self.cache = cache
+        self.frames = frames
+
+    def visit(self, ctx):
+        key = self.cache.key()
+        statements = self.cache.hit(key)
+        if statements is not None:
+            ctx.executed += statements
+            return -self.line_number
+        ctx.stack.append(self.line_number)
+        self.frames.append((len(ctx.stack), self.cache, key, ctx.executed))
+        return self.expr.visit(ctx)
+
+
+class MemoReturnStatement(ReturnStatement):
+    """A RETURN of pure subroutines, which caches the result of a call that missed."""
+
+    __slots__ = ('frames',)
+
+    def __init__(self, frames):
+        self.frames = frames
+
+    def visit(self, ctx):
+        frames = self.frames
+        if frames and frames[-1][0] == len(ctx.stack):
+            depth, cache, key, executed = frames.pop()
+            cache.store(key, ctx.executed - executed)
+        return -ctx.stack.pop()
+
+
 class ForStatement(AST):
-    def __init__(self, line_number, vars, var, from_expr, to_expr, step_expr):
+    # the TO and STEP of a loop that ran are kept by the interpreter running it, in ctx.for_loops
+    __slots__ = ('line_number', 'var', 'from_expr', 'to_expr', 'step_expr')
+
+    def __init__(self, line_number, var, from_expr, to_expr, step_expr):
         self.line_number = line_number
-        self.vars = vars
         self.var = var
         self.from_expr = from_expr
         self.to_expr = to_expr
         self.step_expr = step_expr
 
-    def add_next(self, next_statement):
-        self.next = next_statement
-
-    def visit(self):
-        self.current_from = self.from_expr.visit()
-        self.current_to = self.to_expr.visit()
-        self.current_step = self.step_expr.visit()
-        self.vars[self.var] = self.current_from
+    def visit(self, ctx):
+        current_from = self.from_expr.visit(ctx)
+        ctx.for_loops[self] = (self.to_expr.visit(ctx), self.step_expr.visit(ctx))
+        ctx.vars[self.var] = current_from
 
-    def do_next(self):
-        self.vars[self.var] = self.vars[self.var] + self.current_step
-        v = self.vars[self.var]
-        return self.current_step > 0 and v <= self.current_to or self.current_step <= 0 and v >= self.current_to
+    def do_next(self, ctx):
+        try:
+            current_to, current_step = ctx.for_loops[self]
+        except KeyError:
+            raise Exception(f"{self}, NEXT before its FOR ran")
+        v = ctx.vars[self.var] = ctx.vars[self.var] + current_step
+        return current_step > 0 and v <= current_to or current_step <= 0 and v >= current_to
 
     def __str__(self):
         return f"FOR {self.var} = {self.from_expr} TO {self.to_expr} STEP {self.step_expr}"
 
 
 class NextStatement(AST):
+    __slots__ = ('line_number', 'for_stmt')
+
     def __init__(self, line_number, for_stmt):
         self.line_number = line_number
         self.for_stmt = for_stmt
 
-    def visit(self):
-        if self.for_stmt.do_next():
+    def visit(self, ctx):
+        if self.for_stmt.do_next(ctx):
             return -self.for_stmt.line_number
         return
 
@@ -409,7 +677,9 @@ class NextStatement(AST):
 
 
 class EndStatement(AST):
-    def visit(self):
+    __slots__ = ()
+
+    def visit(self, ctx):
         return 0
 
     def __str__(self):
@@ -417,6 +687,8 @@ class EndStatement(AST):
 
 
 class RemStatement(AST):
+    __slots__ = ('comment',)
+
     def __init__(self, comment):
         self.comment = comment
     def __str__(self):
@@ -424,22 +696,25 @@ class RemStatement(AST):
 
 
 class Var(AST):
-    def __init__(self, name, vars):
+    __slots__ = ('name',)
+
+    def __init__(self, name):
         self.name = name
-        self.vars = vars
 
-    def visit(self):
-        return self.vars.get(self.name, 0)
+    def visit(self, ctx):
+        return ctx.vars.get(self.name, 0)
 
     def __str__(self):
         return self.name
 
 
 class Num(AST):
+    __slots__ = ('value',)
+
     def __init__(self, token):
         self.value = token.value
 
-    def visit(self):
+    def visit(self, ctx):
         return self.value
 
     def __str__(self):
@@ -447,10 +722,12 @@ class Num(AST):
 
 
 class String(AST):
+    __slots__ = ('value',)
+
     def __init__(self, token):
         self.value = token.value
 
-    def visit(self):
+    def visit(self, ctx):
         return self.value
 
     def __str__(self):
@@ -458,26 +735,30 @@ class String(AST):
 
 
 class Tab(AST):
+    __slots__ = ('expr',)
+
     def __init__(self, expr):
         self.expr = expr
 
-    def visit(self):
-        return self.expr.visit()
+    def visit(self, ctx):
+        return self.expr.visit(ctx)
 
     def __str__(self):
         return f"TAB({str(self.expr)})"
 
 
 class Function(AST):
+    __slots__ = ('name', 'expr')
+
     def __init__(self, name, expr):
         self.name = name
         self.expr = expr
 
-    def visit(self):
-        value = self.expr.visit()
+    def visit(self, ctx):
+        value = self.expr.visit(ctx)
         if   self.name == SQR: return math.sqrt(value)
         elif self.name == INT: return int(value)
-        elif self.name == RND: return random.random()
+        elif self.name == RND: return ctx.random.random()
         elif self.name == ABS: return abs(value)
         else: raise Exception(f"unknow function {self.name}")
 
@@ -486,13 +767,15 @@ class Function(AST):
 
 
 class UnOp(AST):
+    __slots__ = ('op', 'factor')
+
     def __init__(self, op, factor):
         self.op = op
         self.factor = factor
 
-    def visit(self):
-        if   self.op.type == PLUS: return self.factor.visit()
-        elif self.op.type == MINUS: return -self.factor.visit()
+    def visit(self, ctx):
+        if   self.op.type == PLUS: return self.factor.visit(ctx)
+        elif self.op.type == MINUS: return -self.factor.visit(ctx)
     
     def __str__(self):
         # return "UnOp {} {}".format(self.op, self.factor)
@@ -500,59 +783,167 @@ class UnOp(AST):
 
 
 class BinOp(AST):
+    __slots__ = ('left', 'op', 'right')
+
     def __init__(self, left, op, right):
         self.left = left
         self.op = op
         self.right = right
         
-    def visit(self):
+    def visit(self, ctx):
         if self.op.type == PLUS:
-            return self.left.visit() + self.right.visit()
+            return self.left.visit(ctx) + self.right.visit(ctx)
         elif self.op.type == MINUS:
-            return self.left.visit() - self.right.visit()
+            return self.left.visit(ctx) - self.right.visit(ctx)
         elif self.op.type == MUL:
-            return self.left.visit() * self.right.visit()
+            return self.left.visit(ctx) * self.right.visit(ctx)
         elif self.op.type == DIV:
-            return self.left.visit() / self.right.visit()
+            return self.left.visit(ctx) / self.right.visit(ctx)
         elif self.op.type == MOD:
-            return self.left.visit() % self.right.visit()
+            return self.left.visit(ctx) % self.right.visit(ctx)
         elif self.op.type == EQUALS:
-            return self.left.visit() == self.right.visit()
+            return self.left.visit(ctx) == self.right.visit(ctx)
         elif self.op.type == NEQUALS:
-            return self.left.visit() != self.right.visit()
+            return self.left.visit(ctx) != self.right.visit(ctx)
         elif self.op.type == LT:
-            return self.left.visit() < self.right.visit()
+            return self.left.visit(ctx) < self.right.visit(ctx)
         elif self.op.type == LTE:
-            return self.left.visit() <= self.right.visit()
+            return self.left.visit(ctx) <= self.right.visit(ctx)
         elif self.op.type == GT:
-            return self.left.visit() > self.right.visit()
+            return self.left.visit(ctx) > self.right.visit(ctx)
         elif self.op.type == GTE:
-            return self.left.visit() >= self.right.visit()
+            return self.left.visit(ctx) >= self.right.visit(ctx)
 
     def __str__(self):
         # return "(BinOp " + str(self.left) + " " +  self.op.value + " " + str(self.right) + ")";
-        return f"{str(self.left)} {self.op.value} {str(self.right)}"
+        return f"{str(self.left)} {self.op} {str(self.right)}"
+
+
+class IntBinOp(BinOp):
+    """A BinOp whose operands are always ints.
+
+    Every operator has its own subclass, so visit() does not dispatch on
+    it, make() picks the right one.
+    """
+
+    __slots__ = ()
+
+    @staticmethod
+    def make(left, op, right):
+        return INT_BINOPS[op.type](left, op, right)
+
+class IntAdd(IntBinOp):
+    __slots__ = ()
+
+    def visit(self, ctx):
+        return self.left.visit(ctx) + self.right.visit(ctx)
+
+class IntSub(IntBinOp):
+    __slots__ = ()
+
+    def visit(self, ctx):
+        return self.left.visit(ctx) - self.right.visit(ctx)
+
+class IntMul(IntBinOp):
+    __slots__ = ()
+
+    def visit(self, ctx):
+        return self.left.visit(ctx) * self.right.visit(ctx)
+
+class IntDiv(IntBinOp):
+    __slots__ = ()
+
+    def visit(self, ctx):
+        return self.left.visit(ctx) / self.right.visit(ctx)
+
+class IntMod(IntBinOp):
+    __slots__ = ()
+
+    def visit(self, ctx):
+        return self.left.visit(ctx) % self.right.visit(ctx)
+
+class IntEquals(IntBinOp):
+    __slots__ = ()
+
+    def visit(self, ctx):
+        return self.left.visit(ctx) == self.right.visit(ctx)
+
+class IntNotEquals(IntBinOp):
+    __slots__ = ()
+
+    def visit(self, ctx):
+        return self.left.visit(ctx) != self.right.visit(ctx)
+
+class IntLess(IntBinOp):
+    __slots__ = ()
+
+    def visit(self, ctx):
+        return self.left.visit(ctx) < self.right.visit(ctx)
+
+class IntLessEquals(IntBinOp):
+    __slots__ = ()
+
+    def visit(self, ctx):
+        return self.left.visit(ctx) <= self.right.visit(ctx)
+
+class IntGreater(IntBinOp):
+    __slots__ = ()
+
+    def visit(self, ctx):
+        return self.left.visit(ctx) > self.right.visit(ctx)
+
+class IntGreaterEquals(IntBinOp):
+    __slots__ = ()
+
+    def visit(self, ctx):
+        return self.left.visit(ctx) >= self.right.visit(ctx)
+
+INT_BINOPS = {
+    PLUS:    IntAdd,
+    MINUS:   IntSub,
+    MUL:     IntMul,
+    DIV:     IntDiv,
+    MOD:     IntMod,
+    EQUALS:  IntEquals,
+    NEQUALS: IntNotEquals,
+    LT:      IntLess,
+    LTE:     IntLessEquals,
+    GT:      IntGreater,
+    GTE:     IntGreaterEquals
+}
 
 
 class Parser(object):
 
-    def __init__(self, input, output, line_number, line, vars, stack, for_stack):
-        self.input = input
-        self.output = output
+    def __init__(self, line_number, line, for_stack):
         self.line_number = line_number
         self.line = line
-        self.vars = vars
-        self.stack = stack
         self.for_stack = for_stack
-        if len(line) == 0:
+        # one Var per name and one Num per number token, shared by all lines, so nodes must not be modified
+        self.names = {}
+        self.numbers = {}
+        self.start(0, len(line))
+
+    def start(self, pos, end):
+        # parse line[pos:end] next
+        self.pos = pos
+        self.end = end
+        if pos == end:
             self.current_token = None
-        else:            
-            self.current_token = line.pop(0)
+        else:
+            self.current_token = self.line[pos]
+
+    def parse_line(self, pos, end):
+        # statement of a line in a token stream where every line starts with a LINE token
+        self.line_number = self.line[pos].value
+        self.start(pos + 1, end)
+        return self.parse_statement()
 
     def eat(self, type):
         if type == self.current_token.type or type == ANY:
-            if len(self.line) > 0:
-                self.current_token = self.line.pop(0)
+            self.pos += 1
+            if self.pos < self.end:
+                self.current_token = self.line[self.pos]
             else:
                 self.current_token = EOLT
         else:
@@ -565,7 +956,16 @@ class Parser(object):
             raise Exception(f"length of variable names must be 1: {name}")
         elif name not in string.ascii_uppercase:
             raise Exception(f"variable name {name} not allowed")
-        return Var(name, self.vars)
+        var = self.names.get(name)
+        if var is None:
+            var = self.names[name] = Var(name)
+        return var
+
+    def number(self, token):
+        num = self.numbers.get(token)
+        if num is None:
+            num = self.numbers[token] = Num(token)
+        return num
 
     def parse_function(self):
         func_name = self.current_token.type
@@ -584,8 +984,8 @@ class Parser(object):
             self.eat(MINUS)
             return UnOp(token, self.parse_factor()) 
         elif token.type == NUMBER:
-            self.eat(NUMBER)            
-            return Num(token)
+            self.eat(NUMBER)
+            return self.number(token)
         elif token.type == ID:
             return self.parse_var()            
         elif token.type in (SQR, INT, RND, ABS):
@@ -657,17 +1057,17 @@ class Parser(object):
         self.eat(EQUALS)
         expr = self.parse_expr()
         if self.current_token != EOLT: raise Exception(f"unexpected: {self.current_token}")        
-        return LetStatement(var, expr, self.vars)
+        return LetStatement(var, expr)
 
     def parse_PRINT(self):
         self.eat(PRINT)
         expr_list = self.parse_expr_list()
         if self.current_token != EOLT: raise Exception(f"unexpected: {self.current_token}")        
-        return PrintStatement(self.output, expr_list)
+        return PrintStatement(expr_list)
 
     def parse_INPUT(self):
         self.eat(INPUT)
-        return InputStatement(self.input, self.output, self.parse_var_list(), self.vars)
+        return InputStatement(self.parse_var_list())
 
     def parse_IF(self):
         self.eat(IF)
@@ -694,12 +1094,12 @@ class Parser(object):
         self.eat(GOSUB)
         expr = self.parse_expr()
         if self.current_token != EOLT: raise Exception(f"unexpected: {self.current_token}")        
-        return GosubStatement(expr, self.line_number, self.stack)
+        return GosubStatement(expr, self.line_number)
 
     def parse_RETURN(self):
         self.eat(RETURN)
         if self.current_token != EOLT: raise Exception(f"unexpected: {self.current_token}")        
-        return ReturnStatement(self.stack)
+        return ReturnStatement()
 
     def parse_FOR(self):
         self.eat(FOR)
@@ -715,13 +1115,17 @@ class Parser(object):
             self.eat(STEP)
             step_expr = self.parse_expr()
         else:
-            step_expr = Num(Token(NUMBER, 1))
-        stmt = ForStatement(self.line_number, self.vars, var, start_expr, to_expr, step_expr)
-        self.for_stack.append(stmt)
+            step_expr = self.number(ONET)
+        stmt = ForStatement(self.line_number, var, start_expr, to_expr, step_expr)
+        if self.for_stack is not None:
+            self.for_stack.append(stmt)
         return stmt
 
     def parse_NEXT(self):
         self.eat(NEXT)
+        if self.for_stack is None:
+            # paired with its FOR by the ProgramStore the line goes into
+            return NextStatement(self.line_number, None)
         if len(self.for_stack) == 0:
             raise Exception("NEXT has no matching FOR")         
         stmt = NextStatement(self.line_number, self.for_stack.pop())
@@ -753,6 +1157,3035 @@ class Parser(object):
         else: raise Exception(f"parsing: {self.current_token}")
         
 
+class ProgramStore(collections.abc.MutableMapping):
+    """The statements of a program by line number, kept in line number order.
+
+    Line numbers are in a sorted array with the statements in a list next
+    to it, which takes far less memory than a dict. A line entered after
+    the last one is appended, any other is found or inserted by bisection,
+    and range() finds the lines between two numbers without sorting. Every
+    NEXT is paired with the closest FOR before it that has no NEXT yet. A
+    line appended at the end is paired right away, after any other change
+    of a FOR or NEXT everything is paired again the next time pair() is
+    called. After freeze() the store refuses any change.
+    """
+
+    def __init__(self):
+        self.line_numbers = array.array('q')
+        self.statements = []
+        self.open = []
+        self.paired = True
+        self.frozen = False
+
+    def change(self):
+        if self.frozen:
+            raise Exception("a Program can not be changed")
+
+    def find(self, line_number):
+        # index of line_number, -1 if there is no such line
+        i = bisect.bisect_left(self.line_numbers, line_number)
+        if i < len(self.line_numbers) and self.line_numbers[i] == line_number:
+            return i
+        return -1
+
+    def __getitem__(self, line_number):
+        i = self.find(line_number)
+        if i < 0:
+            raise KeyError(line_number)
+        return self.statements[i]
+
+    def __setitem__(self, line_number, statement):
+        self.change()
+        line_numbers = self.line_numbers
+        if not line_numbers or line_number > line_numbers[-1]:
+            line_numbers.append(line_number)
+            self.statements.append(statement)
+            if self.paired:
+                self.link(self.loop(statement))
+            return
+        i = bisect.bisect_left(line_numbers, line_number)
+        if line_numbers[i] == line_number:
+            if self.loop(self.statements[i]) or self.loop(statement):
+                self.paired = False
+            self.statements[i] = statement
+        else:
+            line_numbers.insert(i, line_number)
+            self.statements.insert(i, statement)
+            if self.loop(statement):
+                self.paired = False
+
+    def __delitem__(self, line_number):
+        self.change()
+        i = self.find(line_number)
+        if i < 0:
+            raise KeyError(line_number)
+        statement = self.statements.pop(i)
+        del self.line_numbers[i]
+        if self.loop(statement):
+            self.paired = False
+
+    def __contains__(self, line_number):
+        return self.find(line_number) >= 0
+
+    def __iter__(self):
+        return iter(self.line_numbers)
+
+    def __len__(self):
+        return len(self.line_numbers)
+
+    def clear(self):
+        self.change()
+        self.line_numbers = array.array('q')
+        self.statements = []
+        self.open = []
+        self.paired = True
+
+    def range(self, first=None, last=None):
+        # line numbers from first to last, both included
+        start = 0 if first is None else bisect.bisect_left(self.line_numbers, first)
+        stop = len(self.line_numbers) if last is None else bisect.bisect_right(self.line_numbers, last)
+        return self.line_numbers[start:stop].tolist()
+
+    @staticmethod
+    def loop(node):
+        # the FOR or NEXT of a statement, also after THEN
+        while isinstance(node, IfStatement):
+            node = node.then_statement
+        return node if isinstance(node, (ForStatement, NextStatement)) else None
+
+    def link(self, node):
+        # pairs the FOR or NEXT of a line after all others
+        if isinstance(node, ForStatement):
+            self.open.append(node)
+        elif isinstance(node, NextStatement):
+            if self.open:
+                node.for_stmt = self.open.pop()
+            else:
+                self.paired = False
+
+    def pair(self):
+        if self.paired:
+            return
+        self.open = []
+        for statement in self.statements:
+            node = self.loop(statement)
+            if isinstance(node, NextStatement) and not self.open:
+                raise Exception(f"{statement}, NEXT has no matching FOR")
+            self.link(node)
+        self.paired = True
+
+    def freeze(self):
+        # pairs the statements and keeps them as they are from then on
+        self.pair()
+        self.statements = tuple(self.statements)
+        self.frozen = True
+
+
+class LinkedProgram(object):
+    """A program with its control flow resolved before it runs.
+
+    Statements are kept in line number order, so falling through is just
+    the next index and line numbers map to indices in one dict lookup.
+    Constant GOTO and GOSUB targets and the FOR of every NEXT are checked
+    here, so a missing line is reported before the program starts. Line
+    numbers and statements are tuples, as a Program shares them between
+    its runs.
+    """
+
+    def __init__(self, memory, aliases=None):
+        self.aliases = aliases or {}
+        self.line_numbers = tuple(sorted(memory.keys()))
+        self.statements = tuple(memory[line_number] for line_number in self.line_numbers)
+        self.end = len(self.statements)
+        self.index = {}
+        for i, line_number in enumerate(self.line_numbers):
+            self.index[line_number] = i
+        for statement in self.statements:
+            self.check(statement, statement)
+        self.loops = {}
+        for i, statement in enumerate(self.statements):
+            if isinstance(statement, ForStatement) and i not in self.loops:
+                ForLoop.find(self, i)
+
+    def jump(self, result):
+        # index a visit() result leads to, -1 for a line that does not exist
+        if result < 0:
+            if -result not in self.index:
+                raise ValueError(f"{-result!r} is not in list")
+            return self.index[-result] + 1
+        elif result == 0:
+            return self.end
+        index = self.index.get(result)
+        if index is None:
+            if result not in self.aliases:
+                return -1
+            line_number = self.aliases[result]
+            return self.end if line_number is None else self.index[line_number]
+        return index
+
+    def check(self, node, statement):
+        if isinstance(node, IfStatement):
+            self.check(node.then_statement, statement)
+        elif isinstance(node, (GotoStatement, GosubStatement)) and isinstance(node.expr, Num):
+            try:
+                target = self.jump(node.expr.value)
+            except ValueError:
+                target = -1
+            if target < 0:
+                raise Exception(f"{statement}, line number not found")
+        elif isinstance(node, NextStatement):
+            if node.for_stmt is None or node.for_stmt.line_number not in self.index:
+                raise Exception(f"{statement}, NEXT has no matching FOR")
+
+
+class ForLoop(object):
+    """A FOR/NEXT pair that runs as one Python loop.
+
+    Only loops whose body always falls through qualify: no GOTO, GOSUB,
+    RETURN, END or INPUT, and no NEXT but the one closing the loop. Nested
+    loops that qualify themselves run as a single step of the outer body.
+    The cycle count is kept per statement as in the tree walker.
+    """
+
+    def __init__(self, for_stmt, stop, body):
+        self.for_stmt = for_stmt
+        self.stop = stop
+        self.body = body
+
+    @staticmethod
+    def find(program, start):
+        # the loop starting at index start, or None, recorded in program.loops
+        for_stmt = program.statements[start]
+        program.loops[start] = None
+        body = []
+        i = start + 1
+        while i < program.end:
+            statement = program.statements[i]
+            if isinstance(statement, NextStatement) and statement.for_stmt is for_stmt:
+                loop = program.loops[start] = ForLoop(for_stmt, i, body)
+                return loop
+            elif isinstance(statement, ForStatement):
+                inner = program.loops[i] if i in program.loops else ForLoop.find(program, i)
+                if inner is None:
+                    return None
+                body.append(inner)
+                i = inner.stop + 1
+                continue
+            elif not ForLoop.falls_through(statement):
+                return None
+            body.append(statement)
+            i += 1
+        return None
+
+    @staticmethod
+    def falls_through(node):
+        if isinstance(node, IfStatement):
+            return ForLoop.falls_through(node.then_statement)
+        return isinstance(node, (LetStatement, PrintStatement, RemStatement))
+
+    def run(self, ctx, executed, max_cycles):
+        # executed after the last NEXT, which the caller still has to count
+        for_stmt, body = self.for_stmt, self.body
+        try:
+            for_stmt.visit(ctx)
+            while True:
+                executed += 1
+                if executed >= max_cycles:
+                    raise Exception(f"cycles exceeded.")
+                for statement in body:
+                    if type(statement) is ForLoop:
+                        executed = statement.run(ctx, executed, max_cycles)
+                    else:
+                        statement.visit(ctx)
+                    executed += 1
+                    if executed >= max_cycles:
+                        raise Exception(f"cycles exceeded.")
+                if not for_stmt.do_next(ctx):
+                    return executed
+        except Exception:
+            # an inner loop that stopped has counted further
+            ctx.executed = max(ctx.executed, executed)
+            raise
+
+
+class DataFlow(object):
+    """Control flow graph of a program with reaching definitions and liveness.
+
+    Every statement is a node and index end stands for leaving the
+    program, at its end or through an error. RETURN leads to the line
+    after every GOSUB. Sets of variables and of definitions are bits in an
+    int. The first definitions are the values the variables have when the
+    program starts, then there is one per variable a statement assigns.
+    Wherever the program may stop all variables are live, as their values
+    can still be looked at afterwards.
+    """
+
+    def __init__(self, line_numbers, statements, aliases, facts=None):
+        self.line_numbers = line_numbers
+        self.statements = statements
+        self.aliases = aliases
+        self.end = len(statements)
+        self.index = {line_number: i for i, line_number in enumerate(line_numbers)}
+        facts = {} if facts is None else facts
+        for statement in statements:
+            if statement not in facts:
+                facts[statement] = (self.reads(statement), self.writes(statement))
+        self.read = [facts[s][0] for s in statements]
+        self.written = [facts[s][1] for s in statements]
+        names = sorted(set().union(*self.read, *(may for must, may in self.written)))
+        self.bits = {name: 1 << i for i, name in enumerate(names)}
+        self.all = (1 << len(names)) - 1
+        self.returns = [i + 1 for i, s in enumerate(statements) if self.calls(s)] + [self.end]
+        self.successors = [self.successors_of(i, s) for i, s in enumerate(statements)] + [[]]
+        self.predecessors = [[] for i in range(self.end + 1)]
+        for i, successors in enumerate(self.successors):
+            for successor in successors:
+                self.predecessors[successor].append(i)
+
+    def mask(self, names):
+        bits = 0
+        for name in names:
+            bits |= self.bits[name]
+        return bits
+
+    @staticmethod
+    def reads(node):
+        # names of the variables an expression or statement reads
+        if isinstance(node, Var):
+            return {node.name}
+        elif isinstance(node, BinOp):
+            return DataFlow.reads(node.left) | DataFlow.reads(node.right)
+        elif isinstance(node, UnOp):
+            return DataFlow.reads(node.factor)
+        elif isinstance(node, (Function, Tab, LetStatement, GotoStatement, GosubStatement)):
+            return DataFlow.reads(node.expr)
+        elif isinstance(node, PrintStatement):
+            return set().union(*(DataFlow.reads(e) for e in node.expr_list if not isinstance(e, Token)))
+        elif isinstance(node, IfStatement):
+            return DataFlow.reads(node.bool_expr) | DataFlow.reads(node.then_statement)
+        elif isinstance(node, ForStatement):
+            return DataFlow.reads(node.from_expr) | DataFlow.reads(node.to_expr) | DataFlow.reads(node.step_expr)
+        elif isinstance(node, NextStatement):
+            return {node.for_stmt.var}
+        return set()
+
+    @staticmethod
+    def writes(node):
+        # names a statement always assigns and names it may assign
+        if isinstance(node, LetStatement):
+            names = {node.var.name}
+        elif isinstance(node, InputStatement):
+            names = {var.name for var in node.var_list}
+        elif isinstance(node, ForStatement):
+            names = {node.var}
+        elif isinstance(node, NextStatement):
+            names = {node.for_stmt.var}
+        elif isinstance(node, IfStatement):
+            return set(), DataFlow.writes(node.then_statement)[1]
+        else:
+            names = set()
+        return names, names
+
+    @staticmethod
+    def raises(node):
+        # whether evaluating an expression or statement may stop the program with an error
+        if isinstance(node, BinOp):
+            return node.op.type in (DIV, MOD) or DataFlow.raises(node.left) or DataFlow.raises(node.right)
+        elif isinstance(node, UnOp):
+            return DataFlow.raises(node.factor)
+        elif isinstance(node, Function):
+            return node.name in (SQR, INT) or DataFlow.raises(node.expr)
+        elif isinstance(node, Tab):
+            return True
+        elif isinstance(node, LetStatement):
+            return DataFlow.raises(node.expr)
+        elif isinstance(node, PrintStatement):
+            return any(DataFlow.raises(e) for e in node.expr_list if not isinstance(e, Token))
+        elif isinstance(node, IfStatement):
+            return DataFlow.raises(node.bool_expr) or DataFlow.raises(node.then_statement)
+        elif isinstance(node, ForStatement):
+            return DataFlow.raises(node.from_expr) or DataFlow.raises(node.to_expr) or DataFlow.raises(node.step_expr)
+        elif isinstance(node, (GotoStatement, GosubStatement)):
+            return not isinstance(node.expr, Num) or DataFlow.raises(node.expr)
+        return isinstance(node, (InputStatement, ReturnStatement))
+
+    @staticmethod
+    def calls(node):
+        if isinstance(node, IfStatement):
+            return DataFlow.calls(node.then_statement)
+        return isinstance(node, GosubStatement)
+
+    @staticmethod
+    def computed(node):
+        if isinstance(node, IfStatement):
+            return DataFlow.computed(node.then_statement)
+        return isinstance(node, (GotoStatement, GosubStatement)) and not isinstance(node.expr, Num)
+
+    def target(self, value):
+        # index a constant jump leads to, end for leaving the program or a missing line
+        if value < 0:
+            return self.index[-value] + 1 if -value in self.index else self.end
+        line_number = self.aliases.get(value, value)
+        return self.index.get(line_number, self.end)
+
+    def successors_of(self, i, node):
+        if isinstance(node, IfStatement):
+            return sorted({i + 1} | set(self.successors_of(i, node.then_statement)))
+        elif isinstance(node, (GotoStatement, GosubStatement)):
+            if isinstance(node.expr, Num):
+                return [self.target(node.expr.value)]
+            return list(range(self.end + 1))
+        elif isinstance(node, ReturnStatement):
+            return self.returns
+        elif isinstance(node, NextStatement):
+            return sorted({self.target(-node.for_stmt.line_number), i + 1})
+        elif isinstance(node, EndStatement):
+            return [self.end]
+        return [i + 1]
+
+    def liveness(self):
+        # variables live after each statement
+        uses = [self.mask(names) for names in self.read]
+        kills = [self.mask(must) for must, may in self.written]
+        raises = [self.raises(s) for s in self.statements]
+        live_in = [0] * self.end + [self.all]
+        changed = True
+        while changed:
+            changed = False
+            for i in range(self.end - 1, -1, -1):
+                if raises[i]:
+                    live = self.all
+                else:
+                    live = 0
+                    for successor in self.successors[i]:
+                        live |= live_in[successor]
+                    live = uses[i] | (live & ~kills[i])
+                if live != live_in[i]:
+                    live_in[i] = live
+                    changed = True
+        live_out = []
+        for i in range(self.end):
+            live = 0
+            for successor in self.successors[i]:
+                live |= live_in[successor]
+            live_out.append(live)
+        return live_out
+
+    def reaching(self):
+        # definitions, as (index, name) with index None at the start, and the ones reaching each statement
+        definitions = [(None, name) for name in self.bits]
+        gen, kill = [], []
+        for i, (must, may) in enumerate(self.written):
+            bits = 0
+            for name in sorted(may):
+                bits |= 1 << len(definitions)
+                definitions.append((i, name))
+            gen.append(bits)
+            kill.append(self.mask(must))
+        by_name = {name: 0 for name in self.bits}
+        for bit, (i, name) in enumerate(definitions):
+            by_name[name] |= 1 << bit
+        for i, (must, may) in enumerate(self.written):
+            killed = 0
+            for name in must:
+                killed |= by_name[name]
+            kill[i] = killed
+        reach_in = [0] * self.end
+        reach_out = [0] * self.end
+        start = (1 << len(self.bits)) - 1
+        changed = True
+        while changed:
+            changed = False
+            for i in range(self.end):
+                reaching = start if i == 0 else 0
+                for predecessor in self.predecessors[i]:
+                    reaching |= reach_out[predecessor]
+                reach_in[i] = reaching
+                reaching = gen[i] | (reaching & ~kill[i])
+                if reaching != reach_out[i]:
+                    reach_out[i] = reaching
+                    changed = True
+        return definitions, by_name, reach_in
+
+    def blocks(self):
+        # index ranges of the basic blocks
+        starts = [i for i in range(self.end) if i == 0 or self.predecessors[i] != [i - 1]
+                  or self.successors[i - 1] != [i]]
+        return list(zip(starts, starts[1:] + [self.end]))
+
+
+class TypeInference(object):
+    """Finds the types every variable and expression of a program can have.
+
+    Types are sets of int, bool and float. Comparisons give bools, which
+    PRINT shows as True or False, so they are kept apart from ints. The
+    inference does not follow the control flow: a variable can have every
+    type one of its assignments or its value before the run gives it,
+    which also holds with computed jumps. For every variable that can hold
+    more than ints, reasons keeps the first line that made it so, None if
+    it was its value before the run.
+    """
+
+    INTS = frozenset([int])
+    FLOATS = frozenset([float])
+    BOOLS = frozenset([bool])
+
+    def __init__(self, line_numbers, statements, vars):
+        self.line_numbers = line_numbers
+        self.statements = statements
+        self.vars = vars
+        self.types = {}
+        self.reasons = {}
+
+    def infer(self):
+        assignments = []
+        for line_number, statement in zip(self.line_numbers, self.statements):
+            self.assignments(statement, line_number, statement, assignments)
+        names = set().union(*(DataFlow.reads(s) for s in self.statements))
+        names.update(name for line_number, statement, name, expr in assignments)
+        for name in names:
+            self.types[name] = self.INTS
+            self.assign(name, frozenset([type(self.vars.get(name, 0))]), None)
+        changed = True
+        while changed:
+            changed = False
+            for line_number, statement, name, expr in assignments:
+                types = expr if isinstance(expr, frozenset) else self.type(expr)
+                changed = self.assign(name, types, (line_number, statement)) or changed
+        return self.types
+
+    def assign(self, name, types, reason):
+        # adds types to the variable, True if that changed them
+        known = self.types.get(name, self.INTS)
+        if types <= known:
+            return False
+        self.types[name] = known | types
+        if name not in self.reasons and self.types[name] != self.INTS:
+            self.reasons[name] = reason
+        return True
+
+    def assignments(self, node, line_number, statement, assignments):
+        # (line_number, statement, name, expr or types) for every assignment in node
+        if isinstance(node, LetStatement):
+            assignments.append((line_number, statement, node.var.name, node.expr))
+        elif isinstance(node, InputStatement):
+            for var in node.var_list:
+                assignments.append((line_number, statement, var.name, self.INTS))
+        elif isinstance(node, ForStatement):
+            assignments.append((line_number, statement, node.var, node.from_expr))
+        elif isinstance(node, NextStatement):
+            for_stmt = node.for_stmt
+            step = BinOp(Var(for_stmt.var), Token(PLUS, PLUS), for_stmt.step_expr)
+            assignments.append((line_number, statement, for_stmt.var, step))
+        elif isinstance(node, IfStatement):
+            self.assignments(node.then_statement, line_number, statement, assignments)
+
+    def type(self, node):
+        if isinstance(node, Var):
+            return self.types.get(node.name, self.INTS)
+        elif isinstance(node, Num):
+            return frozenset([type(node.value)])
+        elif isinstance(node, BinOp):
+            if node.op.type == DIV:
+                return self.FLOATS
+            elif node.op.type not in (PLUS, MINUS, MUL, MOD):
+                return self.BOOLS
+            left, right = self.type(node.left), self.type(node.right)
+            types = self.FLOATS if float in left or float in right else frozenset()
+            if left - self.FLOATS and right - self.FLOATS:
+                types |= self.INTS
+            return types
+        elif isinstance(node, UnOp):
+            factor = self.type(node.factor)
+            if node.op.type == MINUS and bool in factor:
+                return factor - self.BOOLS | self.INTS
+            return factor
+        elif isinstance(node, Function):
+            if node.name == INT:
+                return self.INTS
+            elif node.name == ABS:
+                factor = self.type(node.expr)
+                return factor - self.BOOLS | self.INTS if bool in factor else factor
+            return self.FLOATS
+        return frozenset([int, bool, float])
+
+    def integer(self, node):
+        # True if node can only give ints or bools
+        return float not in self.type(node)
+
+    def report(self):
+        result = ''
+        for name in sorted(self.types):
+            types = self.types[name]
+            if types == self.INTS:
+                result += f"{name} int\n"
+                continue
+            names = ', '.join(t.__name__ for t in (int, bool, float) if t in types)
+            reason = self.reasons.get(name)
+            if reason is None:
+                result += f"{name} {names}, not specialized: value before the run\n"
+            else:
+                line_number, statement = reason
+                result += f"{name} {names}, not specialized: {line_number} {statement}\n"
+        return result
+
+
+class Optimizer(object):
+    """Rewrites a program before it runs without changing what it does.
+
+    Constant subexpressions are folded, except for RND and where evaluating
+    them raises. REM lines are left out of the program that runs, a jump to
+    one of them goes on to the next line, which is what the aliases map
+    records. GOTO and GOSUB targets that are a GOTO themselves are
+    followed to the end of the chain. Statements are copied rather than
+    changed, so LIST still shows the program as it was entered, and so do
+    the error messages about them, see TinyBasic.explain.
+
+    Unless the program has computed jumps, DataFlow then drives three
+    more passes: variables whose only reaching definition assigns a
+    constant are replaced by it, an expression that a LET earlier in the
+    same basic block assigned is read back from its variable, and a LET
+    of a plain value to a variable that is not live afterwards is left
+    out like a REM.
+
+    Last, TypeInference finds the expressions that only give ints.
+    Operators on them become IntBinOps, INT() of them is left out and a
+    PRINT that has values which are never floats becomes an
+    IntPrintStatement. The types depend on the variables before the run,
+    so vars are the ones the program is about to run with.
+
+    REM lines, left out LETs and skipped GOTOs no longer count towards the
+    cycle limit, so a program stopped by it may have done more work.
+    """
+
+    FOLDED = (PLUS, MINUS, MUL, DIV, MOD)
+
+    def __init__(self, memory, computed=False, vars=None):
+        self.memory = memory
+        self.computed = computed
+        self.vars = {} if vars is None else vars
+        self.fors = {}
+        self.copies = set()
+        self.facts = {}
+
+    def optimize(self):
+        # optimized memory and the aliases of the lines that were left out
+        line_numbers = sorted(self.memory.keys())
+        self.aliases = self.skip(line_numbers, {n for n in line_numbers if isinstance(self.memory[n], RemStatement)})
+        kept = [n for n in line_numbers if n not in self.aliases]
+        if not kept:
+            return dict(self.memory), {}
+        statements = [self.rewrite(self.memory[n], self.fold) for n in kept]
+        if not self.computed and not any(DataFlow.computed(s) for s in statements):
+            statements = self.propagate(DataFlow(kept, statements, self.aliases, self.facts))
+            statements = self.eliminate_common(DataFlow(kept, statements, self.aliases, self.facts))
+            dead = self.dead_stores(DataFlow(kept, statements, self.aliases, self.facts))
+            if len(dead) < len(kept):
+                self.aliases = self.skip(line_numbers, set(self.aliases) | dead)
+                statements = [s for n, s in zip(kept, statements) if n not in dead]
+                kept = [n for n in kept if n not in dead]
+        self.program = dict(zip(kept, statements))
+        statements = [self.thread_targets(s) for s in statements]
+        self.inference = TypeInference(kept, statements, self.vars)
+        self.inference.infer()
+        return {n: self.typed(s) for n, s in zip(kept, statements)}, self.aliases
+
+    def skip(self, line_numbers, left_out):
+        # aliases from the lines left out to the line after them, None past the end
+        aliases = {}
+        following = None
+        for line_number in reversed(line_numbers):
+            if line_number in left_out:
+                aliases[line_number] = following
+            else:
+                following = line_number
+        return aliases
+
+    def rewrite(self, node, fn):
+        # the statement with fn applied to its expressions, FORs and NEXTs are always copied
+        if isinstance(node, LetStatement):
+            node = self.replace(node, expr=fn(node.expr))
+        elif isinstance(node, PrintStatement):
+            expr_list = [e if isinstance(e, Token) else fn(e) for e in node.expr_list]
+            if any(e is not f for e, f in zip(expr_list, node.expr_list)):
+                node = PrintStatement(expr_list)
+        elif isinstance(node, IfStatement):
+            node = self.replace(node, bool_expr=fn(node.bool_expr),
+                                then_statement=self.rewrite(node.then_statement, fn))
+        elif isinstance(node, (GotoStatement, GosubStatement)):
+            node = self.replace(node, expr=self.target(node.expr, fn(node.expr)))
+        elif isinstance(node, ForStatement):
+            node = self.for_statement(node)
+            node.from_expr = fn(node.from_expr)
+            node.to_expr = fn(node.to_expr)
+            node.step_expr = fn(node.step_expr)
+            self.facts.pop(node, None)
+        elif isinstance(node, NextStatement) and node.for_stmt not in self.copies:
+            node = copy.copy(node)
+            node.for_stmt = self.for_statement(node.for_stmt)
+        return node
+
+    def for_statement(self, node):
+        # one copy per FOR, shared by its NEXT
+        if node in self.copies:
+            return node
+        if node not in self.fors:
+            self.fors[node] = copy.copy(node)
+            self.copies.add(self.fors[node])
+        return self.fors[node]
+
+    def fold(self, node):
+        if isinstance(node, BinOp):
+            node = self.replace(node, left=self.fold(node.left), right=self.fold(node.right))
+            if node.op.type in self.FOLDED and isinstance(node.left, Num) and isinstance(node.right, Num):
+                return self.constant(node)
+        elif isinstance(node, UnOp):
+            node = self.replace(node, factor=self.fold(node.factor))
+            if isinstance(node.factor, Num):
+                return self.constant(node)
+        elif isinstance(node, Function):
+            node = self.replace(node, expr=self.fold(node.expr))
+            if node.name != RND and isinstance(node.expr, Num):
+                return self.constant(node)
+        elif isinstance(node, Tab):
+            node = self.replace(node, expr=self.fold(node.expr))
+        return node
+
+    def replace(self, node, **children):
+        # node with the given children, copied only if one of them changed
+        if all(getattr(node, name) is child for name, child in children.items()):
+            return node
+        node = copy.copy(node)
+        for name, child in children.items():
+            setattr(node, name, child)
+        return node
+
+    def constant(self, node):
+        try:
+            return Num(Token(NUMBER, node.visit(None)))
+        except Exception:
+            return node
+
+    def target(self, expr, new):
+        # new for a GOTO or GOSUB target expr, unless it makes a missing line constant
+        if isinstance(new, Num) and not isinstance(expr, Num):
+            value = new.value
+            if isinstance(value, bool) or value <= 0 or value not in self.memory:
+                return expr
+        return new
+
+    def substitute(self, node, constants):
+        if isinstance(node, Var) and node.name in constants:
+            return constants[node.name]
+        elif isinstance(node, BinOp):
+            return self.replace(node, left=self.substitute(node.left, constants),
+                                right=self.substitute(node.right, constants))
+        elif isinstance(node, UnOp):
+            return self.replace(node, factor=self.substitute(node.factor, constants))
+        elif isinstance(node, (Function, Tab)):
+            return self.replace(node, expr=self.substitute(node.expr, constants))
+        return node
+
+    def propagate(self, flow):
+        # replaces variables by the constant their only reaching definition assigns
+        definitions, by_name, reach_in = flow.reaching()
+        statements = []
+        for i, statement in enumerate(flow.statements):
+            constants = {}
+            for name in flow.read[i]:
+                reaching = reach_in[i] & by_name[name]
+                if reaching & (reaching - 1) == 0 and reaching:
+                    index = definitions[reaching.bit_length() - 1][0]
+                    definition = flow.statements[index] if index is not None else None
+                    if isinstance(definition, LetStatement) and isinstance(definition.expr, Num):
+                        constants[name] = definition.expr
+            if constants:
+                statement = self.rewrite(statement, lambda e: self.fold(self.substitute(e, constants)))
+            statements.append(statement)
+        return statements
+
+    def key(self, node):
+        # the structure of an expression without side effects, None for anything else
+        if isinstance(node, Num):
+            value = node.value
+            if type(value) is float:
+                # -0.0 equals 0.0 but prints differently
+                return (NUMBER, float, value, math.copysign(1.0, value))
+            return (NUMBER, type(value), value)
+        elif isinstance(node, Var):
+            return (ID, node.name)
+        elif isinstance(node, BinOp):
+            left, right = self.key(node.left), self.key(node.right)
+            if left is not None and right is not None:
+                return (node.op.type, left, right)
+        elif isinstance(node, UnOp):
+            factor = self.key(node.factor)
+            if factor is not None:
+                return (UnOp, node.op.type, factor)
+        elif isinstance(node, Function) and node.name != RND:
+            expr = self.key(node.expr)
+            if expr is not None:
+                return (node.name, expr)
+        return None
+
+    def reuse(self, node, available):
+        # the expression with subexpressions that are still in a variable read from it
+        if isinstance(node, (BinOp, UnOp, Function)):
+            key = self.key(node)
+            if key in available:
+                return Var(available[key][0])
+            if isinstance(node, BinOp):
+                return self.replace(node, left=self.reuse(node.left, available),
+                                    right=self.reuse(node.right, available))
+            elif isinstance(node, UnOp):
+                return self.replace(node, factor=self.reuse(node.factor, available))
+            return self.replace(node, expr=self.reuse(node.expr, available))
+        elif isinstance(node, Tab):
+            return self.replace(node, expr=self.reuse(node.expr, available))
+        return node
+
+    def eliminate_common(self, flow):
+        # reuses expressions assigned by a LET earlier in the same basic block
+        statements = list(flow.statements)
+        for start, stop in flow.blocks():
+            available = {}
+            for i in range(start, stop):
+                statement = statements[i]
+                if available:
+                    statement = statements[i] = self.rewrite(statement, lambda e: self.reuse(e, available))
+                written = flow.written[i][1]
+                for key, (name, reads) in list(available.items()):
+                    if name in written or reads & written:
+                        del available[key]
+                if isinstance(statement, LetStatement) and isinstance(statement.expr, (BinOp, UnOp, Function)):
+                    key = self.key(statement.expr)
+                    reads = flow.reads(statement.expr)
+                    if key is not None and statement.var.name not in reads:
+                        available.setdefault(key, (statement.var.name, reads))
+        return statements
+
+    def dead_stores(self, flow):
+        # line numbers of LETs of a plain value to a variable nobody reads afterwards
+        live_out = flow.liveness()
+        dead = set()
+        for i, statement in enumerate(flow.statements):
+            if isinstance(statement, LetStatement) and self.plain(statement.expr) \
+                    and not live_out[i] & flow.bits[statement.var.name]:
+                dead.add(flow.line_numbers[i])
+        return dead
+
+    def plain(self, node):
+        # an expression that can neither fail nor change anything
+        if isinstance(node, UnOp):
+            return self.plain(node.factor)
+        elif isinstance(node, Function):
+            return node.name == ABS and self.plain(node.expr)
+        return isinstance(node, (Num, Var))
+
+    def typed(self, node):
+        # the statement with the expressions on ints specialized
+        if isinstance(node, IfStatement):
+            return self.replace(node, bool_expr=self.specialize(node.bool_expr),
+                                then_statement=self.typed(node.then_statement))
+        node = self.rewrite(node, self.specialize)
+        if isinstance(node, PrintStatement):
+            ints = [not isinstance(e, (Token, Tab, String)) and self.inference.integer(e) for e in node.expr_list]
+            if any(ints):
+                node = IntPrintStatement(node.expr_list, ints)
+        return node
+
+    def specialize(self, node):
+        if isinstance(node, BinOp):
+            node = self.replace(node, left=self.specialize(node.left), right=self.specialize(node.right))
+            if self.inference.integer(node.left) and self.inference.integer(node.right):
+                return IntBinOp.make(node.left, node.op, node.right)
+        elif isinstance(node, UnOp):
+            return self.replace(node, factor=self.specialize(node.factor))
+        elif isinstance(node, Function):
+            node = self.replace(node, expr=self.specialize(node.expr))
+            if node.name == INT and self.inference.type(node.expr) == TypeInference.INTS:
+                return node.expr
+        elif isinstance(node, Tab):
+            return self.replace(node, expr=self.specialize(node.expr))
+        return node
+
+    def thread_targets(self, node):
+        if isinstance(node, IfStatement):
+            then = self.thread_targets(node.then_statement)
+            if then is not node.then_statement:
+                node = copy.copy(node)
+                node.then_statement = then
+        elif isinstance(node, (GotoStatement, GosubStatement)) and isinstance(node.expr, Num):
+            value = node.expr.value
+            if not isinstance(value, bool) and value > 0:
+                line_number = self.thread(value)
+                if line_number is not None and line_number != value:
+                    node = copy.copy(node)
+                    node.expr = Num(Token(NUMBER, line_number))
+        return node
+
+    def thread(self, line_number):
+        # the line a jump to line_number ends up on, None if it leaves the program or the line is missing
+        seen = set()
+        while True:
+            if line_number in self.aliases:
+                line_number = self.aliases[line_number]
+                if line_number is None:
+                    return None
+            if line_number not in self.program:
+                return None
+            statement = self.program[line_number]
+            if line_number in seen or not isinstance(statement, GotoStatement) \
+                    or not isinstance(statement.expr, Num):
+                return line_number
+            target = statement.expr.value
+            if isinstance(target, bool) or target <= 0 or \
+                    (target not in self.program and self.aliases.get(target) is None):
+                return line_number
+            seen.add(line_number)
+            line_number = target
+
+
+class SubroutineCache(object):
+    """What calls of one pure subroutine assigned, by the values of the variables they read.
+
+    Ints, floats and -0.0 are told apart in the keys, as they print
+    differently. Along with the values it assigned, a result keeps how
+    many statements the call ran, from its GOSUB up to its RETURN. When
+    it holds more than size results, the one used longest ago is dropped.
+    """
+
+    def __init__(self, line_number, reads, writes, vars, size=MEMO_SIZE):
+        self.line_number = line_number
+        self.reads = reads
+        self.writes = writes
+        self.vars = vars
+        self.size = size
+        self.results = collections.OrderedDict()
+        self.calls = 0
+        self.hits = 0
+        self.evictions = 0
+
+    def key(self):
+        get = self.vars.get
+        return tuple(value if type(value) is int else (value, math.copysign(1.0, value))
+                     for value in [get(name, 0) for name in self.reads])
+
+    def hit(self, key):
+        # assigns what the call with key assigned and gives the statements it ran, None if it is not cached
+        self.calls += 1
+        result = self.results.get(key)
+        if result is None:
+            return None
+        self.results.move_to_end(key)
+        values, statements = result
+        self.vars.update(zip(self.writes, values))
+        self.hits += 1
+        return statements
+
+    def store(self, key, statements):
+        get = self.vars.get
+        self.results[key] = (tuple(get(name, 0) for name in self.writes), statements)
+        if len(self.results) > self.size:
+            self.results.popitem(last=False)
+            self.evictions += 1
+
+
+class Memoizer(object):
+    """Finds the pure subroutines of a program and caches what calls to them do.
+
+    A subroutine is the code a constant GOSUB can run until it returns.
+    It is pure if all it does is assign variables: no PRINT, INPUT, RND or
+    END, no computed GOTO or GOSUB and only GOSUBs to pure subroutines.
+    What a call assigns then only depends on the variables it reads before
+    assigning them and on those it assigns on some paths only, which
+    otherwise keep their value. FOR loop state counts as a variable, so
+    a loop in a pure subroutine has its FOR and all its NEXTs in there.
+
+    GOSUBs to pure subroutines become MemoGosubStatements and the RETURNs
+    of these subroutines MemoReturnStatements, sharing a SubroutineCache
+    per subroutine. A call whose result is cached is skipped, its
+    statements still count as cycles, as many as it ran when it was cached.
+    """
+
+    def __init__(self, memory, aliases, vars, size=MEMO_SIZE):
+        self.line_numbers = sorted(memory.keys())
+        self.statements = [memory[line_number] for line_number in self.line_numbers]
+        self.flow = DataFlow(self.line_numbers, self.statements, aliases)
+        self.vars = vars
+        self.size = size
+        self.frames = []
+        self.subroutines = {}
+        self.caches = {}
+        self.nexts = collections.defaultdict(set)
+        for i, statement in enumerate(self.statements):
+            node = ProgramStore.loop(statement)
+            if isinstance(node, NextStatement):
+                self.nexts[node.for_stmt.line_number].add(i)
+
+    @staticmethod
+    def random(node):
+        # whether an expression calls RND
+        if isinstance(node, Function):
+            return node.name == RND or Memoizer.random(node.expr)
+        elif isinstance(node, BinOp):
+            return Memoizer.random(node.left) or Memoizer.random(node.right)
+        elif isinstance(node, UnOp):
+            return Memoizer.random(node.factor)
+        return False
+
+    @staticmethod
+    def state(for_stmt):
+        # the name the state of a FOR loop goes by, which no variable can have
+        return f"FOR {for_stmt.line_number}"
+
+    def effect(self, i, node):
+        # names a statement reads, always assigns and may assign and the indices it goes on to,
+        # None for returning, or why a subroutine with it is not pure
+        if isinstance(node, IfStatement):
+            then = self.effect(i, node.then_statement)
+            if isinstance(then, str):
+                return then
+            if self.random(node.bool_expr):
+                return "uses RND"
+            reads, must, may, successors = then
+            return DataFlow.reads(node.bool_expr) | reads, set(), may, successors + [i + 1]
+        elif isinstance(node, LetStatement):
+            if self.random(node.expr):
+                return "uses RND"
+            return DataFlow.reads(node), {node.var.name}, {node.var.name}, [i + 1]
+        elif isinstance(node, ForStatement):
+            if any(self.random(expr) for expr in (node.from_expr, node.to_expr, node.step_expr)):
+                return "uses RND"
+            names = {node.var, self.state(node)}
+            return DataFlow.reads(node), names, names, [i + 1]
+        elif isinstance(node, NextStatement):
+            names = {node.for_stmt.var}
+            successors = [self.flow.target(-node.for_stmt.line_number), i + 1]
+            return names | {self.state(node.for_stmt)}, names, names, successors
+        elif isinstance(node, (GotoStatement, GosubStatement)) and not isinstance(node.expr, Num):
+            return "jumps to a computed line"
+        elif isinstance(node, GotoStatement):
+            return set(), set(), set(), [self.flow.target(node.expr.value)]
+        elif isinstance(node, GosubStatement):
+            start = self.flow.target(node.expr.value)
+            if start == self.flow.end:
+                return "ends the program"
+            subroutine = self.analyze(start)
+            if subroutine is None:
+                return f"calls line {self.line_numbers[start]} recursively"
+            elif isinstance(subroutine, str):
+                return f"calls line {self.line_numbers[start]}, which is not pure"
+            reads, must, may, returns = subroutine
+            return set(reads), must, may, [i + 1]
+        elif isinstance(node, ReturnStatement):
+            return set(), set(), set(), [None]
+        elif isinstance(node, RemStatement):
+            return set(), set(), set(), [i + 1]
+        elif isinstance(node, PrintStatement):
+            return "prints"
+        elif isinstance(node, InputStatement):
+            return "reads input"
+        return "ends the program"
+
+    def analyze(self, start):
+        # what the subroutine at index start reads, always assigns and may assign and the indices
+        # it returns from, why it is not pure, or None while it is being analyzed
+        if start not in self.subroutines:
+            self.subroutines[start] = None
+            self.subroutines[start] = self.purity(start)
+        return self.subroutines[start]
+
+    def purity(self, start):
+        effects = {}
+        todo = [start]
+        while todo:
+            i = todo.pop()
+            if i in effects:
+                continue
+            if i == self.flow.end:
+                return "it can run past the last line"
+            effect = self.effect(i, self.statements[i])
+            if isinstance(effect, str):
+                return f"line {self.line_numbers[i]} {effect}"
+            effects[i] = effect
+            todo += [successor for successor in effect[3] if successor is not None]
+        body = sorted(effects)
+
+        # names read before they are assigned, backwards from the RETURNs
+        live = {i: set() for i in body}
+        changed = True
+        while changed:
+            changed = False
+            for i in reversed(body):
+                reads, must, may, successors = effects[i]
+                names = reads | (set().union(*(live[s] for s in successors if s is not None)) - must)
+                if names != live[i]:
+                    live[i] = names
+                    changed = True
+
+        # names assigned on every path from the GOSUB
+        assigned = {start: set()}
+        changed = True
+        while changed:
+            changed = False
+            for i in body:
+                if i not in assigned:
+                    continue
+                names = assigned[i] | effects[i][1]
+                for successor in effects[i][3]:
+                    if successor is None:
+                        continue
+                    meet = names & assigned[successor] if successor in assigned else names
+                    if assigned.get(successor) != meet:
+                        assigned[successor] = meet
+                        changed = True
+
+        returns = [i for i in body if None in effects[i][3]]
+        if not returns:
+            return "it never returns"
+        must = set.intersection(*(assigned[i] | effects[i][1] for i in returns))
+        may = set().union(*(effects[i][2] for i in body))
+        states = {name for name in may if name.startswith('FOR ')}
+        reads = live[start] | (may - must)
+        if any(name.startswith('FOR ') for name in reads):
+            return "runs a NEXT whose FOR may not have run in it"
+        for name in states:
+            if not self.nexts[int(name[4:])] <= effects.keys():
+                return f"line {name[4:]} has a NEXT outside of it"
+        return sorted(reads), must - states, may - states, returns
+
+    def replace(self, node, replacement):
+        if isinstance(node, IfStatement):
+            then_statement = self.replace(node.then_statement, replacement)
+            if then_statement is not node.then_statement:
+                node = copy.copy(node)
+                node.then_statement = then_statement
+            return node
+        return replacement(node)
+
+    def call(self, node):
+        if not isinstance(node, GosubStatement) or not isinstance(node.expr, Num):
+            return node
+        start = self.flow.target(node.expr.value)
+        if start == self.flow.end or not isinstance(self.analyze(start), tuple):
+            return node
+        if start not in self.caches:
+            reads, must, may, returns = self.subroutines[start]
+            self.caches[start] = SubroutineCache(self.line_numbers[start], reads, sorted(may), self.vars,
+                                                 self.size)
+        return MemoGosubStatement(node, self.caches[start], self.frames)
+
+    def returning(self, node):
+        if isinstance(node, ReturnStatement):
+            return MemoReturnStatement(self.frames)
+        return node
+
+    def memoize(self):
+        # the program with the GOSUBs to pure subroutines and the RETURNs they reach replaced
+        memory = {}
+        for line_number, statement in zip(self.line_numbers, self.statements):
+            memory[line_number] = self.replace(statement, self.call)
+        for start, subroutine in self.subroutines.items():
+            if isinstance(subroutine, tuple):
+                for i in subroutine[3]:
+                    line_number = self.line_numbers[i]
+                    memory[line_number] = self.replace(memory[line_number], self.returning)
+        return memory
+
+    def report(self):
+        # a line per subroutine a constant GOSUB calls, with how often the result was cached
+        result = ''
+        for start, subroutine in sorted(self.subroutines.items()):
+            line_number = self.line_numbers[start]
+            if not isinstance(subroutine, tuple):
+                result += f"GOSUB {line_number}: not cached, {subroutine}\n"
+                continue
+            cache = self.caches[start]
+            rate = cache.hits * 100 / cache.calls if cache.calls else 0.0
+            result += f"GOSUB {line_number}: {cache.calls} calls, {cache.hits} hits ({rate:.1f}%), " \
+                      f"{len(cache.results)} cached, {cache.evictions} evicted, " \
+                      f"reads {','.join(cache.reads) or 'nothing'}, assigns {','.join(cache.writes) or 'nothing'}\n"
+        return result
+
+
+OPERATORS = {
+    PLUS:    operator.add,
+    MINUS:   operator.sub,
+    MUL:     operator.mul,
+    DIV:     operator.truediv,
+    MOD:     operator.mod,
+    EQUALS:  operator.eq,
+    NEQUALS: operator.ne,
+    LT:      operator.lt,
+    LTE:     operator.le,
+    GT:      operator.gt,
+    GTE:     operator.ge
+}
+
+FUNCTIONS = {
+    SQR: math.sqrt,
+    INT: int,
+    ABS: abs
+}
+
+
+class ClosureCompiler(object):
+    """Compiles parsed statements into nested closures.
+
+    Operators and functions are looked up once at compile time and every
+    variable gets a slot in a flat list, so running a compiled statement
+    never dispatches on node types or touches the vars dict. The slots are
+    loaded from vars when they are allocated and written back with store().
+    Each compiled statement returns the index of the statement to run
+    next in the linked program, constant jumps are resolved up front.
+    """
+
+    def __init__(self, program, vars, stack, input, output, random, for_loops):
+        self.program = program
+        self.vars = vars
+        self.stack = stack
+        self.input = input
+        self.output = output
+        self.random = random
+        self.for_loops = for_loops
+        self.slots = []
+        self.names = {}
+        self.statements = {
+            LetStatement:    self.compile_let,
+            PrintStatement:  self.compile_print,
+            IntPrintStatement: self.compile_print,
+            InputStatement:  self.compile_input,
+            IfStatement:     self.compile_if,
+            GotoStatement:   self.compile_goto,
+            GosubStatement:  self.compile_gosub,
+            ReturnStatement: self.compile_return,
+            ForStatement:    self.compile_for,
+            NextStatement:   self.compile_next,
+            EndStatement:    self.compile_end,
+            RemStatement:    self.compile_rem
+        }
+
+    def slot(self, name):
+        index = self.names.get(name)
+        if index is None:
+            index = len(self.slots)
+            self.names[name] = index
+            self.slots.append(self.vars.get(name, 0))
+        return index
+
+    def store(self):
+        for name, index in self.names.items():
+            self.vars[name] = self.slots[index]
+
+    def compile_line(self, index):
+        return self.compile_statement(self.program.statements[index], index + 1)
+
+    def compile_statement(self, node, next):
+        compile = self.statements.get(type(node))
+        if compile is None:
+            raise Exception(f"can not compile {node}")
+        return compile(node, next)
+
+    def compile_expr(self, node):
+        slots = self.slots
+        if isinstance(node, Var):
+            index = self.slot(node.name)
+            return lambda: slots[index]
+        elif isinstance(node, (Num, String)):
+            value = node.value
+            return lambda: value
+        elif isinstance(node, Function):
+            return self.compile_function(node)
+        elif isinstance(node, UnOp):
+            factor = self.compile_expr(node.factor)
+            if node.op.type == MINUS:
+                return lambda: -factor()
+            return factor
+        elif isinstance(node, BinOp):
+            return self.compile_binop(node)
+        raise Exception(f"can not compile {node}")
+
+    def compile_function(self, node):
+        expr = self.compile_expr(node.expr)
+        if node.name == RND:
+            rnd = self.random.random
+            def function():
+                expr()
+                return rnd()
+            return function
+        function = FUNCTIONS[node.name]
+        return lambda: function(expr())
+
+    def compile_binop(self, node):
+        op = OPERATORS[node.op.type]
+        slots = self.slots
+        left, right = node.left, node.right
+        if isinstance(left, Var) and isinstance(right, Num):
+            index, value = self.slot(left.name), right.value
+            return lambda: op(slots[index], value)
+        elif isinstance(left, Var) and isinstance(right, Var):
+            index, other = self.slot(left.name), self.slot(right.name)
+            return lambda: op(slots[index], slots[other])
+        elif isinstance(right, Num):
+            left, value = self.compile_expr(left), right.value
+            return lambda: op(left(), value)
+        elif isinstance(right, Var):
+            left, index = self.compile_expr(left), self.slot(right.name)
+            return lambda: op(left(), slots[index])
+        left, right = self.compile_expr(left), self.compile_expr(right)
+        return lambda: op(left(), right())
+
+    def compile_let(self, node, next):
+        slots = self.slots
+        index = self.slot(node.var.name)
+        expr = self.compile_expr(node.expr)
+        def let():
+            slots[index] = expr()
+            return next
+        return let
+
+    def compile_print(self, node, next):
+        write, flush = self.output.write, self.output.flush
+        pieces = [self.compile_piece(kind, value) for kind, value in node.parts]
+        def print_():
+            line = ''
+            try:
+                for piece in pieces:
+                    line += piece(line)
+            finally:
+                write(line)
+                flush()
+            return next
+        return print_
+
+    def compile_piece(self, kind, value):
+        # a function giving the text a part of a PRINT adds to the line so far
+        if kind == STRING:
+            return lambda line: value
+        expr = self.compile_expr(value)
+        if kind == INTEGER:
+            return lambda line: str(expr())
+        elif kind == TAB:
+            return lambda line: " " * (int(expr()) - len(line))
+        def number(line):
+            res = expr()
+            if isinstance(res, float):
+                return "{:.2f}".format(res)
+            return str(res)
+        return number
+
+    def compile_input(self, node, next):
+        input, output, slots = self.input, self.output, self.slots
+        indices = [self.slot(var.name) for var in node.var_list]
+        def input_():
+            for index in indices:
+                output.write("?")
+                output.flush()
+                value = input.readline()
+                if value == '':
+                    raise EOFError("no input")
+                try:
+                    slots[index] = int(value.strip())
+                except:
+                    raise Exception(f"not an int: {value}")
+            return next
+        return input_
+
+    def compile_if(self, node, next):
+        cond = self.compile_expr(node.bool_expr)
+        then = self.compile_statement(node.then_statement, next)
+        def if_():
+            if cond():
+                return then()
+            return next
+        return if_
+
+    def compile_jump(self, node):
+        jump = self.program.jump
+        if isinstance(node.expr, Num):
+            target = jump(node.expr.value)
+            return lambda: target
+        expr = self.compile_expr(node.expr)
+        return lambda: jump(expr())
+
+    def compile_goto(self, node, next):
+        return self.compile_jump(node)
+
+    def compile_gosub(self, node, next):
+        stack, line_number = self.stack, node.line_number
+        jump = self.compile_jump(node)
+        def gosub():
+            stack.append(line_number)
+            return jump()
+        return gosub
+
+    def compile_return(self, node, next):
+        stack, jump = self.stack, self.program.jump
+        return lambda: jump(-stack.pop())
+
+    def compile_for(self, node, next):
+        slots, for_loops = self.slots, self.for_loops
+        index = self.slot(node.var)
+        from_expr = self.compile_expr(node.from_expr)
+        to_expr = self.compile_expr(node.to_expr)
+        step_expr = self.compile_expr(node.step_expr)
+        def for_():
+            current_from = from_expr()
+            for_loops[node] = (to_expr(), step_expr())
+            slots[index] = current_from
+            return next
+        return for_
+
+    def compile_next(self, node, next):
+        slots, for_loops = self.slots, self.for_loops
+        for_stmt = node.for_stmt
+        index = self.slot(for_stmt.var)
+        back = self.program.jump(-for_stmt.line_number)
+        def next_():
+            try:
+                to, step = for_loops[for_stmt]
+            except KeyError:
+                raise Exception(f"{for_stmt}, NEXT before its FOR ran")
+            v = slots[index] = slots[index] + step
+            if step > 0 and v <= to or step <= 0 and v >= to:
+                return back
+            return next
+        return next_
+
+    def compile_end(self, node, next):
+        end = self.program.end
+        return lambda: end
+
+    def compile_rem(self, node, next):
+        return lambda: next
+
+
+class PythonCodegen(object):
+    """Generates Python source for expressions and statements without jumps.
+
+    Variables become locals named after them, the generated code expects
+    write, flush and the helpers(random) in its namespace.
+    """
+
+    def __init__(self, max_cycles):
+        self.max_cycles = max_cycles
+        self.names = {}
+
+    def name(self, name):
+        if name not in self.names:
+            local = 'v_' + name
+            if not local.isidentifier():
+                local = f"v__{len(self.names)}"
+            self.names[name] = local
+        return self.names[name]
+
+    def expr(self, node):
+        if isinstance(node, Var):
+            return self.name(node.name)
+        elif isinstance(node, (Num, String)):
+            if isinstance(node.value, float) and not math.isfinite(node.value):
+                return f"float('{node.value}')"
+            return f"({node.value!r})"
+        elif isinstance(node, Function):
+            function = {SQR: '_sqrt', INT: 'int', RND: '_rnd', ABS: 'abs'}[node.name]
+            return f"{function}({self.expr(node.expr)})"
+        elif isinstance(node, UnOp):
+            if node.op.type == MINUS:
+                return f"(-{self.expr(node.factor)})"
+            return self.expr(node.factor)
+        elif isinstance(node, BinOp):
+            op = '%' if node.op.type == MOD else '==' if node.op.type == EQUALS else \
+                 '!=' if node.op.type == NEQUALS else '>=' if node.op.type == GTE else node.op.type
+            return f"({self.expr(node.left)} {op} {self.expr(node.right)})"
+        raise Exception(f"can not transpile {node}")
+
+    def count(self):
+        if not self.max_cycles:
+            return []
+        return ["n += 1",
+                f"if n >= {self.max_cycles}: raise Exception('cycles exceeded.')"]
+
+    def print_(self, node):
+        # the line is written at once, built up in _s if a TAB needs its length or text before
+        # a value has to be written when the value raises
+        values = [i for i, (kind, value) in enumerate(node.parts) if kind != STRING]
+        if values in ([], [0]) and node.parts[0][0] != TAB:
+            return [f"write({' + '.join(self.piece(kind, value) for kind, value in node.parts) or repr('')})",
+                    "flush()"]
+        code = []
+        for kind, value in node.parts:
+            if kind == TAB:
+                code.append(f"_s += ' ' * (int({self.expr(value)}) - len(_s))")
+            else:
+                code.append(f"_s += {self.piece(kind, value)}")
+        return ["_s = ''", "try:"] + ["    " + c for c in code] + ["finally:", "    write(_s)", "    flush()"]
+
+    def piece(self, kind, value):
+        if kind == STRING:
+            return repr(value)
+        elif kind == INTEGER:
+            return f"str({self.expr(value)})"
+        return f"_fmt({self.expr(value)})"
+
+    def comment(self, statement):
+        return ''.join(c if c.isprintable() else ' ' for c in str(statement))
+
+    def helpers(self, random):
+        # RND draws from random, the generator of the interpreter running the code
+        draw = random.random
+        def rnd(value):
+            return draw()
+        def fmt(res):
+            if isinstance(res, float):
+                return "{:.2f}".format(res)
+            return str(res)
+        return {
+            '_fmt':  fmt,
+            '_sqrt': math.sqrt,
+            '_rnd':  rnd
+        }
+
+
+class PythonTranspiler(PythonCodegen):
+    """Translates a whole program into the source of one Python function.
+
+    The function keeps the variables in locals, dispatches on the current
+    line number with a binary tree of comparisons over the lines that can
+    be jumped to and uses the interpreter's stack for GOSUB and RETURN.
+    Lines between two jump targets run straight through without any
+    dispatching. Computed GOTOs make every line a jump target.
+    """
+
+    def __init__(self, program, max_cycles, computed=False):
+        super().__init__(max_cycles)
+        self.program = program
+        self.line_numbers = program.line_numbers
+        self.successors = dict(zip(self.line_numbers, self.line_numbers[1:] + (None,)))
+        self.computed = computed
+        self.loops = {}
+        self.leaders = {self.line_numbers[0]}
+        for line_number, statement in zip(self.line_numbers, program.statements):
+            self.scan(statement, line_number)
+        if self.computed:
+            self.leaders.update(self.line_numbers)
+
+    def successor(self, line_number):
+        return self.successors.get(line_number)
+
+    def statement_at(self, line_number):
+        return self.program.statements[self.program.index[line_number]]
+
+    def loop(self, for_stmt):
+        if for_stmt not in self.loops:
+            self.loops[for_stmt] = f"f{len(self.loops)}"
+        return self.loops[for_stmt]
+
+    def add_leader(self, line_number):
+        if line_number is not None and line_number in self.successors:
+            self.leaders.add(line_number)
+
+    def scan(self, node, line_number):
+        if isinstance(node, (GotoStatement, GosubStatement)):
+            if isinstance(node.expr, Num):
+                target = node.expr.value
+                if target < 0:
+                    self.add_leader(self.successor(-target))
+                else:
+                    self.add_leader(target)
+            else:
+                self.computed = True
+            if isinstance(node, GosubStatement):
+                self.add_leader(self.successor(node.line_number))
+        elif isinstance(node, IfStatement):
+            self.scan(node.then_statement, line_number)
+        elif isinstance(node, ForStatement):
+            self.add_leader(self.successor(node.line_number))
+
+    def goto(self, target, line_number):
+        # constant targets have been checked by LinkedProgram
+        index = self.program.jump(target)
+        if index == self.program.end:
+            return ["return"]
+        return self.count() + [f"line = {self.line_numbers[index]!r}", "continue"]
+
+    def jump(self, value, line_number, check=True):
+        message = f"{self.statement_at(line_number)}, line number not found"
+        code = [f"line = _jump({value})", "if line is None: return"] + self.count()
+        if check:
+            code.append(f"if line not in _lines: raise Exception({message!r})")
+        return code + ["continue"]
+
+    def statement(self, node, line_number):
+        if isinstance(node, LetStatement):
+            return [f"{self.name(node.var.name)} = {self.expr(node.expr)}"]
+        elif isinstance(node, PrintStatement):
+            return self.print_(node)
+        elif isinstance(node, InputStatement):
+            code = []
+            for var in node.var_list:
+                code += ['write("?")',
+                         "flush()",
+                         "_v = input.readline()",
+                         "if _v == '': raise EOFError('no input')",
+                         "try:",
+                         f"    {self.name(var.name)} = int(_v.strip())",
+                         "except:",
+                         "    raise Exception(f'not an int: {_v}')"]
+            return code
+        elif isinstance(node, IfStatement):
+            then = self.statement(node.then_statement, line_number) or ["pass"]
+            return [f"if {self.expr(node.bool_expr)}:"] + ["    " + c for c in then]
+        elif isinstance(node, (GotoStatement, GosubStatement)):
+            code = []
+            if isinstance(node, GosubStatement):
+                code.append(f"stack.append({node.line_number!r})")
+            if isinstance(node.expr, Num):
+                return code + self.goto(node.expr.value, line_number)
+            return code + self.jump(self.expr(node.expr), line_number)
+        elif isinstance(node, ReturnStatement):
+            return self.jump("-stack.pop()", line_number, check=False)
+        elif isinstance(node, ForStatement):
+            loop = self.loop(node)
+            return [f"{loop}_from = {self.expr(node.from_expr)}",
+                    f"{loop}_to = {self.expr(node.to_expr)}",
+                    f"{loop}_step = {self.expr(node.step_expr)}",
+                    f"{self.name(node.var)} = {loop}_from"]
+        elif isinstance(node, NextStatement):
+            loop = self.loop(node.for_stmt)
+            var = self.name(node.for_stmt.var)
+            back = self.goto(-node.for_stmt.line_number, line_number)
+            message = f"{node.for_stmt}, NEXT before its FOR ran"
+            return [f"if {loop}_step is None:",
+                    f"    raise Exception({message!r})",
+                    f"{var} = {var} + {loop}_step",
+                    f"if {loop}_step > 0 and {var} <= {loop}_to or {loop}_step <= 0 and {var} >= {loop}_to:"] + \
+                   ["    " + c for c in back]
+        elif isinstance(node, EndStatement):
+            return ["return"]
+        elif isinstance(node, RemStatement):
+            return []
+        raise Exception(f"can not transpile {node}")
+
+    def block(self, line_number):
+        code = []
+        while True:
+            statement = self.statement_at(line_number)
+            code.append(f"# {line_number} {self.comment(statement)}")
+            code += self.statement(statement, line_number)
+            if code[-1] in ("continue", "return") or code[-1].startswith("raise "):
+                return code
+            successor = self.successor(line_number)
+            if successor is None:
+                return code + ["return"]
+            code += self.count()
+            if successor in self.leaders:
+                return code + [f"line = {successor!r}", "continue"]
+            line_number = successor
+
+    def dispatch(self, leaders):
+        if len(leaders) == 1:
+            return [f"if line == {leaders[0]!r}:"] + ["    " + c for c in self.block(leaders[0])]
+        middle = len(leaders) // 2
+        return [f"if line < {leaders[middle]!r}:"] + \
+               ["    " + c for c in self.dispatch(leaders[:middle])] + \
+               ["else:"] + \
+               ["    " + c for c in self.dispatch(leaders[middle:])]
+
+    def transpile(self):
+        body = self.dispatch(sorted(self.leaders))
+        code = ["def program(vars, stack, input, output, _jump=_jump, _lines=_lines,",
+                "            _fmt=_fmt, _sqrt=_sqrt, _rnd=_rnd):",
+                "    write = output.write",
+                "    flush = output.flush"]
+        code += [f"    {local} = vars.get({name!r}, 0)" for name, local in self.names.items()]
+        # a loop that has not run its FOR yet has no STEP
+        code += [f"    {loop}_to = {loop}_step = None" for loop in self.loops.values()]
+        code += ["    n = 0",
+                 f"    line = {self.line_numbers[0]!r}",
+                 "    try:",
+                 "        while True:"]
+        code += ["            " + c for c in body]
+        code += ["            raise Exception(f'{line} is not a jump target')",
+                 "    finally:"]
+        code += [f"        vars[{name!r}] = {local}" for name, local in self.names.items()]
+        if not self.names:
+            code.append("        pass")
+        return "\n".join(code) + "\n"
+
+    def build(self, random):
+        source = self.transpile()
+        successors = self.successors
+        def jump(value):
+            if value < 0:
+                if -value not in successors:
+                    raise ValueError(f"{-value!r} is not in list")
+                return successors[-value]
+            elif value == 0:
+                return None
+            return aliases.get(value, value)
+        aliases = self.program.aliases
+        namespace = self.helpers(random)
+        namespace['_jump'] = jump
+        namespace['_lines'] = frozenset(self.line_numbers)
+        exec(builtins.compile(source, '<tiny basic>', 'exec'), namespace)
+        return namespace['program']
+
+
+class TraceCompiler(PythonCodegen):
+    """Compiles a recorded trace into a Python loop with guards.
+
+    A trace is the list of (index, next) pairs the interpreter went through
+    from a loop header back to it. Every IF and NEXT gets a guard that
+    leaves the loop when it goes another way than it did while recording,
+    returning the index to continue at and the updated cycle count.
+    """
+
+    def __init__(self, program, trace, max_cycles):
+        super().__init__(max_cycles)
+        self.program = program
+        self.trace = trace
+        self.loops = {}
+
+    def loop(self, for_stmt):
+        if for_stmt not in self.loops:
+            self.loops[for_stmt] = f"_f{len(self.loops)}"
+        return self.loops[for_stmt]
+
+    def exit(self, index):
+        if index == self.program.end:
+            return [f"return {index}, n"]
+        return self.count() + [f"return {index}, n"]
+
+    def guard(self, cond, expected, index, target):
+        # stay on the trace while cond leads to expected
+        if expected == target:
+            return [f"if not {cond}:"] + ["    " + c for c in self.exit(index + 1)]
+        return [f"if {cond}:"] + ["    " + c for c in self.exit(target)]
+
+    def statement(self, node, index, next):
+        if isinstance(node, LetStatement):
+            return [f"{self.name(node.var.name)} = {self.expr(node.expr)}"]
+        elif isinstance(node, PrintStatement):
+            return self.print_(node)
+        elif isinstance(node, IfStatement):
+            cond = self.expr(node.bool_expr)
+            then = node.then_statement
+            if isinstance(then, GotoStatement):
+                return self.guard(cond, next, index, self.program.jump(then.expr.value))
+            return [f"if {cond}:"] + ["    " + c for c in self.statement(then, index, next) or ["pass"]]
+        elif isinstance(node, ForStatement):
+            loop = self.loop(node)
+            return [f"_from = {self.expr(node.from_expr)}",
+                    f"_loops[{loop}] = ({self.expr(node.to_expr)}, {self.expr(node.step_expr)})",
+                    f"{self.name(node.var)} = _from"]
+        elif isinstance(node, NextStatement):
+            loop = self.loop(node.for_stmt)
+            var = self.name(node.for_stmt.var)
+            back = self.program.jump(-node.for_stmt.line_number)
+            cond = f"(_step > 0 and {var} <= _to or _step <= 0 and {var} >= _to)"
+            return [f"_to, _step = _loops[{loop}]",
+                    f"{var} = {var} + _step"] + self.guard(cond, next, index, back)
+        return []
+
+    def compile(self, vars, output, random, for_loops):
+        body = []
+        for index, next in self.trace:
+            statement = self.program.statements[index]
+            body.append(f"# {self.program.line_numbers[index]} {self.comment(statement)}")
+            body += self.statement(statement, index, next)
+            body += self.count()
+        loops = ''.join(f", {loop}={loop}" for loop in self.loops.values())
+        code = [f"def trace(n, vars=vars, write=write, flush=flush, _fmt=_fmt, _sqrt=_sqrt, _rnd=_rnd, "
+                f"_loops=_loops{loops}):"]
+        code += [f"    {local} = vars.get({name!r}, 0)" for name, local in self.names.items()]
+        code += ["    try:",
+                 "        while True:"]
+        code += ["            " + c for c in body]
+        code += ["    finally:"]
+        code += [f"        vars[{name!r}] = {local}" for name, local in self.names.items()]
+        code += ["        pass"]
+        namespace = self.helpers(random)
+        namespace.update({'vars': vars, 'write': output.write, 'flush': output.flush, '_loops': for_loops})
+        for for_stmt, loop in self.loops.items():
+            namespace[loop] = for_stmt
+        exec(builtins.compile("\n".join(code) + "\n", '<tiny basic trace>', 'exec'), namespace)
+        return namespace['trace']
+
+
+class TraceJit(object):
+    """Finds hot loops while the tree walker runs and compiles their traces.
+
+    Jumps to the same or an earlier line are counted per target. Once a
+    target was jumped to JIT_THRESHOLD times, the statements executed from
+    there are recorded until execution gets back to it, which completes
+    the trace. GOSUB, RETURN, INPUT, END and computed jumps abort the
+    recording, a header that aborted JIT_MAX_ABORTS times stays cold.
+    """
+
+    def __init__(self, program, vars, output, random, for_loops, max_cycles, threshold=JIT_THRESHOLD):
+        self.program = program
+        self.vars = vars
+        self.output = output
+        self.random = random
+        self.for_loops = for_loops
+        self.max_cycles = max_cycles
+        self.threshold = threshold
+        self.counters = {}
+        self.aborts = {}
+        self.traces = {}
+        self.header = None
+        self.recording = None
+
+    def backward(self, header):
+        if header in self.traces or self.aborts.get(header, 0) >= JIT_MAX_ABORTS:
+            return
+        self.counters[header] = self.counters.get(header, 0) + 1
+        if self.counters[header] >= self.threshold:
+            self.header = header
+            self.recording = []
+
+    def record(self, index, next):
+        statement = self.program.statements[index]
+        if next < 0 or next == self.program.end or not self.traceable(statement) \
+                or len(self.recording) >= JIT_MAX_TRACE:
+            self.aborts[self.header] = self.aborts.get(self.header, 0) + 1
+            self.counters[self.header] = 0
+            self.recording = None
+            return
+        self.recording.append((index, next))
+        if next == self.header:
+            compiler = TraceCompiler(self.program, self.recording, self.max_cycles)
+            self.traces[self.header] = compiler.compile(self.vars, self.output, self.random, self.for_loops)
+            self.recording = None
+
+    def traceable(self, node, then=False):
+        if isinstance(node, (LetStatement, PrintStatement, RemStatement)):
+            return True
+        elif isinstance(node, GotoStatement):
+            return isinstance(node.expr, Num) and self.program.jump(node.expr.value) < self.program.end
+        elif isinstance(node, (ForStatement, NextStatement)):
+            return not then
+        elif isinstance(node, IfStatement):
+            return not then and self.traceable(node.then_statement, then=True)
+        return False
+
+
+class Bytecode(object):
+    """Flat instruction list produced by BytecodeCompiler.
+
+    Every instruction is a tuple (opcode, a, b, c). Operands are register
+    numbers, registers 0-25 hold the variables A-Z and the rest hold other
+    loop variables, FOR limits and steps, constants and temporaries. Jump
+    operands are instruction indices, starts maps statement indices of the
+    linked program to the instruction their code begins with.
+    """
+
+    def __init__(self, program, code, lines, starts, registers, names):
+        self.program = program
+        self.code = code
+        self.lines = lines
+        self.starts = starts
+        self.registers = registers
+        self.names = names
+
+    def disassemble(self):
+        result = ''
+        starts = set(self.starts)
+        for pc, (op, a, b, c) in enumerate(self.code):
+            index = self.lines[pc]
+            if pc in starts and index < self.program.end:
+                statement = ''.join(c if c.isprintable() else ' ' for c in str(self.program.statements[index]))
+                result += f"; {self.program.line_numbers[index]} {statement}\n"
+            result += f"{pc:6} {OPCODE_NAMES[op]:<12} {a} {b} {c}\n"
+        return result
+
+
+BYTECODE_OPERATORS = {
+    PLUS:  OP_ADD,
+    MINUS: OP_SUB,
+    MUL:   OP_MUL,
+    DIV:   OP_DIV,
+    MOD:   OP_MOD
+}
+
+BYTECODE_FUNCTIONS = {
+    SQR: OP_SQR,
+    INT: OP_INT,
+    ABS: OP_ABS,
+    RND: OP_RND
+}
+
+BYTECODE_CONDITIONS = {
+    EQUALS:  (OP_IF_EQ, OP_UNLESS_EQ),
+    NEQUALS: (OP_IF_NE, OP_UNLESS_NE),
+    LT:      (OP_IF_LT, OP_UNLESS_LT),
+    LTE:     (OP_IF_LE, OP_UNLESS_LE),
+    GT:      (OP_IF_GT, OP_UNLESS_GT),
+    GTE:     (OP_IF_GE, OP_UNLESS_GE)
+}
+
+
+class BytecodeCompiler(object):
+    """Lowers a linked program into Bytecode for the VirtualMachine.
+
+    Constants are preloaded into registers, so every operation works on
+    registers only. Temporaries are reused from one statement to the
+    next. Every statement begins with a COUNT instruction for the cycle
+    limit, which is left out when there is no limit.
+    """
+
+    def __init__(self, program, vars, max_cycles):
+        self.program = program
+        self.max_cycles = max_cycles
+        self.registers = []
+        self.names = {}
+        for name in string.ascii_uppercase:
+            self.variable(name)
+        self.vars = vars
+        self.constants = {}
+        self.loops = {}
+        self.temps = []
+        self.temp = 0
+        self.code = []
+        self.lines = []
+        self.starts = []
+        self.fixups = []
+        self.index = 0
+
+    def variable(self, name):
+        if name not in self.names:
+            self.names[name] = self.register(0)
+        return self.names[name]
+
+    def register(self, value):
+        self.registers.append(value)
+        return len(self.registers) - 1
+
+    def loop(self, for_stmt):
+        # the TO register of a FOR, followed by its STEP, which stays None until the FOR ran
+        if for_stmt not in self.loops:
+            self.loops[for_stmt] = self.register(0)
+            self.register(None)
+        return self.loops[for_stmt]
+
+    def constant(self, value):
+        # -0.0 equals 0.0 but prints differently, so floats are also told apart by sign
+        key = (type(value), value) if type(value) is not float else (float, value, math.copysign(1.0, value))
+        if key not in self.constants:
+            self.constants[key] = self.register(value)
+        return self.constants[key]
+
+    def temporary(self):
+        if self.temp == len(self.temps):
+            self.temps.append(self.register(0))
+        self.temp += 1
+        return self.temps[self.temp - 1]
+
+    def emit(self, op, a=0, b=0, c=0):
+        self.code.append((op, a, b, c))
+        self.lines.append(self.index)
+        return len(self.code) - 1
+
+    def emit_jump(self, op, a, b, index):
+        # jump targets are statement indices until fix_jumps() runs
+        self.fixups.append(self.emit(op, a, b, index))
+
+    def patch(self, pc):
+        op, a, b, c = self.code[pc]
+        self.code[pc] = (op, a, b, len(self.code))
+
+    def fix_jumps(self):
+        for pc in self.fixups:
+            op, a, b, index = self.code[pc]
+            self.code[pc] = (op, a, b, self.starts[index])
+
+    def compile(self):
+        for self.index, statement in enumerate(self.program.statements):
+            self.starts.append(len(self.code))
+            if self.max_cycles:
+                self.emit(OP_COUNT)
+            self.temp = 0
+            self.statement(statement, self.index + 1)
+        self.index = self.program.end
+        self.starts.append(self.emit(OP_HALT))
+        self.fix_jumps()
+        for name, register in self.names.items():
+            self.registers[register] = self.vars.get(name, 0)
+        return Bytecode(self.program, self.code, self.lines, self.starts, self.registers, self.names)
+
+    def expr(self, node, target=None):
+        if isinstance(node, (Var, Num, String)):
+            if isinstance(node, Var):
+                register = self.variable(node.name)
+            else:
+                register = self.constant(node.value)
+            if target is None:
+                return register
+            self.emit(OP_MOVE, target, register)
+            return target
+        elif isinstance(node, UnOp):
+            if node.op.type != MINUS:
+                return self.expr(node.factor, target)
+            factor = self.expr(node.factor)
+            target = self.temporary() if target is None else target
+            self.emit(OP_NEG, target, factor)
+            return target
+        elif isinstance(node, Function):
+            value = self.expr(node.expr)
+            target = self.temporary() if target is None else target
+            self.emit(BYTECODE_FUNCTIONS[node.name], target, value)
+            return target
+        elif isinstance(node, BinOp):
+            left = self.expr(node.left)
+            right = self.expr(node.right)
+            target = self.temporary() if target is None else target
+            self.emit(BYTECODE_OPERATORS[node.op.type], target, left, right)
+            return target
+        raise Exception(f"can not compile {node}")
+
+    def jump(self, node, line_number=None):
+        # GOTO or GOSUB, line_number is set for GOSUB
+        if isinstance(node.expr, Num):
+            target = self.program.jump(node.expr.value)
+            if line_number is None:
+                self.emit_jump(OP_JUMP, 0, 0, target)
+            else:
+                self.emit_jump(OP_GOSUB, line_number, 0, target)
+        elif line_number is None:
+            self.emit(OP_GOTO, self.expr(node.expr))
+        else:
+            self.emit(OP_GOSUB_TO, line_number, self.expr(node.expr))
+
+    def statement(self, node, next):
+        if isinstance(node, LetStatement):
+            self.expr(node.expr, self.variable(node.var.name))
+        elif isinstance(node, PrintStatement):
+            self.print_(node)
+        elif isinstance(node, InputStatement):
+            for var in node.var_list:
+                self.emit(OP_INPUT, self.variable(var.name))
+        elif isinstance(node, IfStatement):
+            cond = node.bool_expr
+            left = self.expr(cond.left)
+            right = self.expr(cond.right)
+            if_op, unless_op = BYTECODE_CONDITIONS[cond.op.type]
+            then = node.then_statement
+            if isinstance(then, GotoStatement) and isinstance(then.expr, Num):
+                self.emit_jump(if_op, left, right, self.program.jump(then.expr.value))
+            else:
+                skip = self.emit(unless_op, left, right)
+                self.statement(then, next)
+                self.patch(skip)
+        elif isinstance(node, GotoStatement):
+            self.jump(node)
+        elif isinstance(node, GosubStatement):
+            self.jump(node, node.line_number)
+        elif isinstance(node, ReturnStatement):
+            self.emit(OP_RETURN)
+        elif isinstance(node, ForStatement):
+            loop = self.loop(node)
+            start = self.expr(node.from_expr)
+            to = self.expr(node.to_expr)
+            step = self.expr(node.step_expr)
+            self.emit(OP_MOVE, loop, to)
+            self.emit(OP_MOVE, loop + 1, step)
+            self.emit(OP_MOVE, self.variable(node.var), start)
+        elif isinstance(node, NextStatement):
+            for_stmt = node.for_stmt
+            back = self.program.jump(-for_stmt.line_number)
+            self.emit_jump(OP_NEXT, self.variable(for_stmt.var), self.loop(for_stmt), back)
+        elif isinstance(node, EndStatement):
+            self.emit(OP_HALT)
+        elif isinstance(node, RemStatement):
+            pass
+        else:
+            raise Exception(f"can not compile {node}")
+
+    def print_(self, node):
+        for kind, value in node.parts:
+            if kind == STRING:
+                self.emit(OP_PRINT_STR, self.constant(value))
+            elif kind == TAB:
+                self.emit(OP_PRINT_TAB, self.expr(value))
+            elif kind == INTEGER:
+                self.emit(OP_PRINT_INT, self.expr(value))
+            else:
+                self.emit(OP_PRINT_VALUE, self.expr(value))
+            self.temp = 0
+        self.emit(OP_PRINT_END)
+
+
+class VirtualMachine(object):
+    """Runs Bytecode in a single dispatch loop."""
+
+    def __init__(self, bytecode, vars, stack, input, output, random, max_cycles):
+        self.bytecode = bytecode
+        self.vars = vars
+        self.stack = stack
+        self.input = input
+        self.output = output
+        self.random = random
+        self.max_cycles = max_cycles or math.inf
+        self.pc = 0
+
+    def run(self):
+        bytecode = self.bytecode
+        code, starts, program = bytecode.code, bytecode.starts, bytecode.program
+        r = list(bytecode.registers)
+        stack, input, output = self.stack, self.input, self.output
+        write, flush = output.write, output.flush
+        rnd = self.random.random
+        max_cycles = self.max_cycles
+        executed = -1
+        line = ''
+        pc = 0
+        try:
+            while True:
+                op, a, b, c = code[pc]
+                pc += 1
+                if op == OP_COUNT:
+                    executed += 1
+                    if executed >= max_cycles:
+                        raise Exception(f"cycles exceeded.")
+                elif op == OP_ADD:
+                    r[a] = r[b] + r[c]
+                elif op == OP_SUB:
+                    r[a] = r[b] - r[c]
+                elif op == OP_MUL:
+                    r[a] = r[b] * r[c]
+                elif op == OP_MOVE:
+                    r[a] = r[b]
+                elif op == OP_JUMP:
+                    pc = c
+                elif op < OP_JUMP and op >= OP_IF_EQ:
+                    left, right = r[a], r[b]
+                    if   op == OP_IF_LT: cond = left < right
+                    elif op == OP_IF_GT: cond = left > right
+                    elif op == OP_IF_EQ: cond = left == right
+                    elif op == OP_IF_NE: cond = left != right
+                    elif op == OP_IF_LE: cond = left <= right
+                    elif op == OP_IF_GE: cond = left >= right
+                    elif op == OP_UNLESS_LT: cond = not left < right
+                    elif op == OP_UNLESS_GT: cond = not left > right
+                    elif op == OP_UNLESS_EQ: cond = not left == right
+                    elif op == OP_UNLESS_NE: cond = not left != right
+                    elif op == OP_UNLESS_LE: cond = not left <= right
+                    else: cond = not left >= right
+                    if cond:
+                        pc = c
+                elif op == OP_NEXT:
+                    step = r[b + 1]
+                    if step is None:
+                        for_stmt = ProgramStore.loop(program.statements[bytecode.lines[pc - 1]]).for_stmt
+                        raise Exception(f"{for_stmt}, NEXT before its FOR ran")
+                    v = r[a] = r[a] + step
+                    if step > 0 and v <= r[b] or step <= 0 and v >= r[b]:
+                        pc = c
+                elif op == OP_DIV:
+                    r[a] = r[b] / r[c]
+                elif op == OP_MOD:
+                    r[a] = r[b] % r[c]
+                elif op == OP_NEG:
+                    r[a] = -r[b]
+                elif op == OP_INT:
+                    r[a] = int(r[b])
+                elif op == OP_ABS:
+                    r[a] = abs(r[b])
+                elif op == OP_SQR:
+                    r[a] = math.sqrt(r[b])
+                elif op == OP_RND:
+                    r[a] = rnd()
+                elif op == OP_PRINT_STR:
+                    line += r[a]
+                elif op == OP_PRINT_VALUE:
+                    res = r[a]
+                    if isinstance(res, float):
+                        line += "{:.2f}".format(res)
+                    else:
+                        line += str(res)
+                elif op == OP_PRINT_INT:
+                    line += str(r[a])
+                elif op == OP_PRINT_TAB:
+                    line += " " * (int(r[a]) - len(line))
+                elif op == OP_PRINT_END:
+                    write(line)
+                    flush()
+                    line = ''
+                elif op == OP_GOSUB:
+                    stack.append(a)
+                    pc = c
+                elif op == OP_RETURN or op == OP_GOTO or op == OP_GOSUB_TO:
+                    if op == OP_RETURN:
+                        index = program.jump(-stack.pop())
+                    elif op == OP_GOTO:
+                        index = program.jump(r[a])
+                    else:
+                        stack.append(a)
+                        index = program.jump(r[b])
+                    if index < 0:
+                        executed += 1
+                        if executed >= max_cycles:
+                            raise Exception(f"cycles exceeded.")
+                        statement = program.statements[bytecode.lines[pc - 1]]
+                        raise Exception(f"{statement}, line number not found")
+                    pc = starts[index]
+                elif op == OP_INPUT:
+                    write("?")
+                    flush()
+                    value = input.readline()
+                    if value == '':
+                        raise EOFError("no input")
+                    try:
+                        r[a] = int(value.strip())
+                    except:
+                        raise Exception(f"not an int: {value}")
+                elif op == OP_HALT:
+                    break
+        finally:
+            if line:
+                # the start of a PRINT line whose value raised
+                write(line)
+                flush()
+            self.pc = pc
+            for name, register in bytecode.names.items():
+                self.vars[name] = r[register]
+
+
+class Profiler(object):
+    """Counts and times the lines of a program run by TinyBasic.run_profile().
+
+    The self time of a line is the time its statement took. The cumulative
+    time of a line that called a subroutine also covers the subroutine up
+    to its RETURN, which subroutines records per subroutine line as well.
+    A call is not counted again while the same line or subroutine is
+    already running, so recursion does not add up twice.
+    """
+
+    def __init__(self, program, memory):
+        self.program = program
+        self.memory = memory
+        self.counts = [0] * program.end
+        self.self_times = [0.0] * program.end
+        self.cumulative = [0.0] * program.end
+        self.subroutines = {}
+        self.calls = []
+        self.active = {}
+        self.elapsed = 0.0
+
+    def line(self, index, elapsed):
+        self.counts[index] += 1
+        self.self_times[index] += elapsed
+        self.cumulative[index] += elapsed
+
+    def call(self, index, line_number, now):
+        self.calls.append((index, line_number, now))
+        for key in (index, line_number):
+            self.active[key] = self.active.get(key, 0) + 1
+
+    def ret(self, now):
+        if not self.calls:
+            return
+        index, line_number, start = self.calls.pop()
+        self.active[index] -= 1
+        self.active[line_number] -= 1
+        subroutine = self.subroutines.setdefault(line_number, [0, 0.0])
+        subroutine[0] += 1
+        if not self.active[index]:
+            self.cumulative[index] += now - start
+        if not self.active[line_number]:
+            subroutine[1] += now - start
+
+    def lines(self):
+        # (line number, count, self time, cumulative time, source) of the lines that ran, slowest first
+        result = []
+        for index, count in enumerate(self.counts):
+            if count:
+                line_number = self.program.line_numbers[index]
+                result.append((line_number, count, self.self_times[index], self.cumulative[index],
+                               str(self.memory.get(line_number, self.program.statements[index]))))
+        result.sort(key=lambda line: (-line[2], line[0]))
+        return result
+
+    def report(self):
+        total = self.elapsed or 1.0
+        result = f"profile: {self.elapsed * 1000:.3f} ms\n"
+        result += f"{'line':>6} {'count':>10} {'self ms':>12} {'self %':>7} {'cum ms':>12}  statement\n"
+        for line_number, count, self_time, cumulative, source in self.lines():
+            result += f"{line_number:>6} {count:>10} {self_time * 1000:>12.3f} {self_time * 100 / total:>7.2f} " \
+                      f"{cumulative * 1000:>12.3f}  {source}\n"
+        if self.subroutines:
+            result += f"{'gosub':>6} {'calls':>10} {'total ms':>12}\n"
+            for line_number, (calls, elapsed) in sorted(self.subroutines.items(), key=lambda s: -s[1][1]):
+                result += f"{line_number:>6} {calls:>10} {elapsed * 1000:>12.3f}\n"
+        return result
+
+    def save(self, filename):
+        lines = [{'line': line_number, 'count': count, 'self': self_time, 'cumulative': cumulative,
+                  'source': source} for line_number, count, self_time, cumulative, source in self.lines()]
+        subroutines = [{'line': line_number, 'calls': calls, 'time': elapsed}
+                       for line_number, (calls, elapsed) in sorted(self.subroutines.items())]
+        with open(filename, 'w') as file:
+            json.dump({'elapsed': self.elapsed, 'lines': lines, 'subroutines': subroutines}, file, indent=2)
+
+
+class Sampler(object):
+    """Samples where a running program is from a background thread.
+
+    Every interval seconds the thread records the line a TinyBasic is at
+    together with its GOSUB return stack. The tree walker keeps line_number
+    up to date, a FOR loop it runs natively counts as its FOR line. The
+    samples of every run are kept and save() writes them as collapsed
+    stacks, one line per stack with the frames separated by ';' and the
+    number of samples last, which flamegraph tools read.
+    """
+
+    def __init__(self, tiny_basic, filename, interval=SAMPLE_INTERVAL):
+        self.tiny_basic = tiny_basic
+        self.filename = filename
+        self.interval = interval
+        self.samples = {}
+        self.labels = {}
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def sample(self):
+        tiny_basic, samples = self.tiny_basic, self.samples
+        while not self.stopped.wait(self.interval):
+            key = (tuple(tiny_basic.stack), tiny_basic.line_number)
+            samples[key] = samples.get(key, 0) + 1
+
+    def label(self, line_number):
+        if line_number not in self.labels:
+            statement = self.tiny_basic.memory.get(line_number)
+            label = str(line_number) if statement is None else f"{line_number} {statement}"
+            self.labels[line_number] = label.replace(';', ',').replace('\n', ' ')
+        return self.labels[line_number]
+
+    def collapsed(self):
+        result = ''
+        for (stack, line_number), count in sorted(self.samples.items()):
+            frames = [self.label(n) for n in stack] + [self.label(line_number)]
+            result += f"{';'.join(frames)} {count}\n"
+        return result
+
+    def save(self):
+        with open(self.filename, 'w') as file:
+            file.write(self.collapsed())
+
+
+class RandomBuffer(object):
+    """A generator for RND that draws its numbers from numpy, size at a time.
+
+    random() hands out the numbers of the current block one by one, with
+    no Python code in between, and draws the next block once they run out.
+    The state is that of numpy's generator before the current block and
+    how many numbers of it are left, so setstate() draws the block again
+    and skips the numbers already handed out.
+    """
+
+    def __init__(self, seed=None, size=RND_BUFFER):
+        global numpy
+        if numpy is None:
+            try:
+                import numpy
+            except ImportError:
+                raise Exception("--rnd-buffer needs numpy")
+        self.size = size
+        self.seed(seed)
+
+    def seed(self, seed=None):
+        self.generator = numpy.random.default_rng(seed)
+        self.fill()
+
+    def fill(self):
+        self.state = self.generator.bit_generator.state
+        self.block = iter(self.generator.random(self.size).tolist())
+        self.random = itertools.chain.from_iterable(self.blocks()).__next__
+
+    def blocks(self):
+        while True:
+            yield self.block
+            self.state = self.generator.bit_generator.state
+            self.block = iter(self.generator.random(self.size).tolist())
+
+    def getstate(self):
+        return {'generator': self.state, 'left': operator.length_hint(self.block)}
+
+    def setstate(self, state):
+        self.generator.bit_generator.state = state['generator']
+        self.fill()
+        for i in range(self.size - state['left']):
+            self.random()
+
+
+class Checkpoint(object):
+    """Saves the state of a running program to a file and resumes from it.
+
+    The state is all the statements keep between two lines: the variables,
+    the GOSUB stack, the line to run next, the statements run so far, the
+    loop state of every FOR that ran and the state of RND, so a resumed
+    run goes on exactly as if it had not stopped. It is written as JSON,
+    to a temporary file first, which then replaces the last one. The
+    program is identified by its listing, a checkpoint of another program
+    or of the same one with a different -O is not resumed.
+
+    run_checkpointed() saves every `every` statements and whenever a
+    SIGUSR1 arrives, after SIGTERM it saves and stops the program. Output
+    is written out before every save, what the program prints after the
+    last save is printed again when it resumes. The file is removed once
+    the program reaches its end.
+    """
+
+    def __init__(self, filename, every=0, resume=False):
+        self.filename = filename
+        self.every = every
+        self.resume = resume
+        self.requested = False
+        self.stopping = False
+        self.handlers = {}
+
+    def request(self, signum, frame):
+        self.requested = True
+        self.stopping = self.stopping or signum == signal.SIGTERM
+
+    def install(self):
+        # SIGUSR1 and SIGTERM request a save, signals are only handled in the main thread
+        if threading.current_thread() is not threading.main_thread():
+            return
+        for name in ('SIGUSR1', 'SIGTERM'):
+            signum = getattr(signal, name, None)
+            if signum is not None:
+                self.handlers[signum] = signal.signal(signum, self.request)
+
+    def uninstall(self):
+        for signum, handler in self.handlers.items():
+            signal.signal(signum, handler)
+        self.handlers = {}
+
+    def key(self, tiny_basic):
+        import hashlib
+        listing = ''.join(f"{line_number} {tiny_basic.memory[line_number]}\n" for line_number in tiny_basic.memory)
+        return hashlib.sha256(f"{tiny_basic.optimize}\n{listing}".encode('utf-8', 'surrogatepass')).hexdigest()
+
+    @staticmethod
+    def loops(program):
+        # the FORs of a linked program by line number
+        fors = {}
+        for statement in program.statements:
+            node = ProgramStore.loop(statement)
+            if isinstance(node, NextStatement):
+                node = node.for_stmt
+            if node is not None:
+                fors[node.line_number] = node
+        return fors
+
+    def save(self, tiny_basic, program, index, executed):
+        drain = getattr(tiny_basic.output, 'drain', tiny_basic.output.flush)
+        drain()
+        state = {
+            'program': self.key(tiny_basic),
+            'line_number': program.line_numbers[index],
+            'executed': executed,
+            'vars': tiny_basic.vars,
+            'stack': tiny_basic.stack,
+            'loops': {line_number: list(tiny_basic.for_loops[node])
+                      for line_number, node in self.loops(program).items() if node in tiny_basic.for_loops},
+            'random': tiny_basic.random.getstate()
+        }
+        temp = f"{self.filename}.{os.getpid()}.tmp"
+        with open(temp, 'w') as file:
+            json.dump(state, file, separators=(',', ':'))
+        os.replace(temp, self.filename)
+        self.requested = False
+
+    def load(self, tiny_basic, program):
+        # index and statements run so far to go on from, (0, 0) without a checkpoint to resume
+        if not self.resume or not os.path.exists(self.filename):
+            return 0, 0
+        try:
+            with open(self.filename) as file:
+                state = json.load(file)
+            if state['program'] != self.key(tiny_basic):
+                raise Exception("it is of another program")
+            index = program.index[state['line_number']]
+            loops = self.loops(program)
+            tiny_basic.for_loops.clear()
+            for line_number, (current_to, current_step) in state['loops'].items():
+                tiny_basic.for_loops[loops[int(line_number)]] = (current_to, current_step)
+            saved = state['random']
+            if isinstance(tiny_basic.random, random.Random):
+                version, internal, gauss = saved
+                saved = (version, tuple(internal), gauss)
+            tiny_basic.random.setstate(saved)
+            tiny_basic.vars.clear()
+            tiny_basic.vars.update(state['vars'])
+            tiny_basic.stack[:] = state['stack']
+            return index, state['executed']
+        except Exception as e:
+            raise Exception(f"can not resume from {self.filename}: {e}")
+
+    def finish(self):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+
+class PrintCounter(object):
+    """Output of a hooked run, counting the bytes written."""
+
+    def __init__(self, output):
+        self.output = output
+        self.written = 0
+
+    def write(self, s):
+        self.written += len(s.encode())
+        self.output.write(s)
+
+    def flush(self):
+        self.output.flush()
+
+
+class Metrics(object):
+    """A hook counting the events of runs, written out in the Prometheus text format."""
+
+    COUNTERS = [
+        ('statements_total', 'statement', 'Statements executed.'),
+        ('gosub_calls_total', 'gosub', 'GOSUB calls.'),
+        ('gosub_returns_total', 'return', 'RETURNs from a GOSUB.')
+    ]
+
+    def __init__(self):
+        self.counts = collections.Counter()
+        self.writes = collections.Counter()
+        self.print_bytes = 0
+
+    def __call__(self, events):
+        self.counts.update(kind for kind, line_number, value in events)
+        for kind, line_number, value in events:
+            if kind == 'write':
+                self.writes[value[0]] += 1
+            elif kind == 'print':
+                self.print_bytes += value
+
+    def text(self):
+        result = ''
+        for name, kind, description in self.COUNTERS:
+            result += f"# HELP tinybasic_{name} {description}\n# TYPE tinybasic_{name} counter\n" \
+                      f"tinybasic_{name} {self.counts[kind]}\n"
+        result += "# HELP tinybasic_variable_writes_total Assignments to a variable.\n" \
+                  "# TYPE tinybasic_variable_writes_total counter\n"
+        for name in sorted(self.writes):
+            result += f"tinybasic_variable_writes_total{{variable=\"{name}\"}} {self.writes[name]}\n"
+        result += "# HELP tinybasic_print_bytes_total Bytes written by PRINT.\n" \
+                  "# TYPE tinybasic_print_bytes_total counter\n" \
+                  f"tinybasic_print_bytes_total {self.print_bytes}\n"
+        return result
+
+    def save(self, filename):
+        with open(filename, 'w') as file:
+            file.write(self.text())
+
+
+class OutputBuffer(object):
+    """Collects program output and passes it on in larger writes.
+
+    flush() is what every PRINT calls, it only writes the pending output
+    once OUTPUT_BUFFER_SIZE characters are collected or OUTPUT_BUFFER_TIME
+    seconds passed since the last write, unless the stream is a terminal,
+    which still sees every line at once. drain() always writes.
+    """
+
+    def __init__(self, stream, size=OUTPUT_BUFFER_SIZE, interval=OUTPUT_BUFFER_TIME):
+        self.stream = stream
+        self.size = size
+        self.interval = interval
+        self.interactive = stream.isatty()
+        self.pending = []
+        self.length = 0
+        self.last = time.monotonic()
+
+    def write(self, s):
+        self.pending.append(s)
+        self.length += len(s)
+
+    def flush(self):
+        if self.interactive or self.length >= self.size or time.monotonic() - self.last >= self.interval:
+            self.drain()
+
+    def drain(self):
+        if self.pending:
+            self.stream.write(''.join(self.pending))
+            self.pending = []
+            self.length = 0
+        self.stream.flush()
+        self.last = time.monotonic()
+
+
+class BufferedInput(object):
+    """Input that drains an OutputBuffer before a line is read, so prompts show."""
+
+    def __init__(self, stream, output):
+        self.stream = stream
+        self.output = output
+
+    def readline(self):
+        self.output.drain()
+        return self.stream.readline()
+
+    def __iter__(self):
+        return iter(self.readline, '')
+
+
+class Batch(object):
+    """Runs a program for many input sets at once, one lane per set.
+
+    Every variable is a numpy array with a value for each lane, so all
+    lanes at the same line evaluate it together, an IF splits them by a
+    mask of the lanes its condition holds for. The lanes at the lowest
+    line always go first, so lanes that went separate ways run together
+    again once they reach the same line. Values are floats with a mask of
+    those that are ints, which are exact below EXACT.
+
+    A lane for which a line cannot be evaluated exactly as the ast engine
+    does, like a division by zero, an int reaching EXACT, a RETURN
+    without GOSUB or input that is not such an int, leaves the batch
+    before that line and runs on alone through the statements' own
+    visit(), which also raise the errors. RND draws from numpy in the
+    batch and from the interpreter's generator alone, so it is the one
+    thing that does not give what a run of the lane by itself gives.
+
+    inputs has a list of the lines INPUT reads for every lane. The batch
+    is the input and output of the interpreter whose program it runs,
+    that is how a lane running alone reads its input and writes its output.
+    """
+
+    EXACT = 2 ** 53
+    MAX_DEPTH = 64
+    FINISHED = 2 ** 62
+
+    def __init__(self, inputs, seed=None):
+        global numpy
+        if numpy is None:
+            try:
+                import numpy
+            except ImportError:
+                raise Exception("batch mode needs numpy")
+        self.inputs = inputs
+        self.random = numpy.random.default_rng(seed)
+        self.lanes = n = len(self.inputs)
+        width = max([len(lines) for lines in self.inputs] + [1])
+        self.lengths = numpy.array([len(lines) for lines in self.inputs], dtype=numpy.int64)
+        self.values = numpy.zeros((n, width))
+        self.valid = numpy.zeros((n, width), dtype=bool)
+        for column in range(width):
+            parsed = self.parse_column([lines[column] if column < len(lines) else None for lines in self.inputs])
+            self.valid[:, column] = [value is not None for value in parsed]
+            self.values[:, column] = [value or 0 for value in parsed]
+        self.lane = None
+        self.written = []
+
+    @staticmethod
+    def read(filename):
+        # the input sets in a file, one per line with the values separated by commas or spaces
+        with open(filename) as file:
+            return [line.replace(',', ' ').split() for line in file]
+
+    def parse_column(self, lines):
+        # the values of input lines as INPUT reads them, None for a line that is missing or not an int below EXACT
+        try:
+            values = [int(line) for line in lines]
+            if -self.EXACT < min(values) and max(values) < self.EXACT:
+                return values
+        except (TypeError, ValueError):
+            pass
+        return [self.parse(line) for line in lines]
+
+    def parse(self, line):
+        try:
+            value = int(line.strip())
+        except (AttributeError, ValueError):
+            return None
+        return value if abs(value) < self.EXACT else None
+
+    def readline(self):
+        lines = self.inputs[self.lane]
+        position = int(self.position[self.lane])
+        if position >= len(lines):
+            return ''
+        self.position[self.lane] = position + 1
+        return lines[position] + "\n"
+
+    def write(self, s):
+        self.written.append(s)
+
+    def flush(self):
+        pass
+
+    def run(self, tiny_basic):
+        # (output, error) of every lane, error is None for a lane that ran to its end
+        self.tiny_basic = tiny_basic
+        try:
+            self.program = program = tiny_basic.link()
+        except Exception as e:
+            raise Exception(tiny_basic.explain(str(e))) from None
+        self.max_cycles = tiny_basic.max_cycles or math.inf
+        n = self.lanes
+        self.vars = {}
+        self.loops = {}
+        self.pc = numpy.zeros(n, dtype=numpy.int64)
+        self.executed = numpy.zeros(n, dtype=numpy.int64)
+        self.position = numpy.zeros(n, dtype=numpy.int64)
+        self.stack = numpy.zeros((n, 0), dtype=numpy.int64)
+        self.depth = numpy.zeros(n, dtype=numpy.int64)
+        self.failed = numpy.zeros(n, dtype=bool)
+        self.running = n
+        self.printed = []
+        self.errors = [None] * n
+        self.alone = []
+        lanes, index = numpy.arange(n), 0
+        with numpy.errstate(all='ignore'):
+            while len(lanes):
+                lanes, index = self.step(index, lanes)
+        outputs = [''] * n
+        for lanes, texts in self.printed:
+            if len(lanes) == n:
+                if isinstance(texts, str):
+                    outputs = [output + texts for output in outputs]
+                else:
+                    outputs = [output + text for output, text in zip(outputs, texts)]
+            elif isinstance(texts, str):
+                for lane in lanes.tolist():
+                    outputs[lane] += texts
+            else:
+                for lane, text in zip(lanes.tolist(), texts):
+                    outputs[lane] += text
+        for lane, index in self.alone:
+            outputs[lane] += self.run_alone(lane, index)
+        errors = [None if error is None else tiny_basic.explain(error) for error in self.errors]
+        return list(zip(outputs, errors))
+
+    def step(self, index, lanes):
+        # runs the line at index for lanes, the lanes to run next and their index
+        statement = self.program.statements[index]
+        targets = self.execute(statement, index, lanes)
+        failed = self.failed[lanes]
+        if failed.any():
+            self.failed[lanes[failed]] = False
+            self.pc[lanes[failed]] = self.FINISHED
+            self.alone += [(lane, index) for lane in lanes[failed].tolist()]
+            self.running -= int(failed.sum())
+            lanes, targets = lanes[~failed], targets[~failed]
+        counted = targets != self.program.end
+        executed = self.executed[lanes] + counted
+        self.executed[lanes] = executed
+        over = counted & (executed >= self.max_cycles)
+        self.stop(lanes[over], "cycles exceeded.")
+        missing = counted & ~over & (targets < 0)
+        self.stop(lanes[missing], f"{statement}, line number not found")
+        done = ~counted | over | missing
+        if done.any():
+            targets[done] = self.FINISHED
+            self.running -= int(done.sum())
+            self.pc[lanes] = targets
+            lanes, targets = lanes[~done], targets[~done]
+        else:
+            self.pc[lanes] = targets
+        if len(lanes) and len(lanes) == self.running and targets.min() == targets.max():
+            return lanes, int(targets[0])
+        if not self.running:
+            return lanes[:0], 0
+        index = int(self.pc.min())
+        return numpy.flatnonzero(self.pc == index), index
+
+    def stop(self, lanes, error):
+        for lane in lanes.tolist():
+            self.errors[lane] = error
+
+    def fail(self, lanes, mask=None):
+        # lanes leave the batch before the current line, for all of them if there is no mask
+        if mask is None:
+            self.failed[lanes] = True
+        elif mask.any():
+            self.failed[lanes[mask]] = True
+
+    def execute(self, statement, index, lanes):
+        # the index each lane goes on to, the lanes that failed are not changed
+        targets = numpy.full(len(lanes), index + 1, dtype=numpy.int64)
+        if isinstance(statement, LetStatement):
+            values, ints = self.value(statement.expr, lanes)
+            self.assign(statement.var.name, lanes, values, ints)
+        elif isinstance(statement, PrintStatement):
+            self.print_line(statement, lanes)
+        elif isinstance(statement, InputStatement):
+            self.read_input(statement, lanes)
+        elif isinstance(statement, IfStatement):
+            cond = self.condition(statement.bool_expr, lanes)
+            then = numpy.flatnonzero(cond & ~self.failed[lanes])
+            if len(then):
+                targets[then] = self.execute(statement.then_statement, index, lanes[then])
+        elif isinstance(statement, GotoStatement):
+            targets = self.jump(statement.expr, lanes)
+        elif isinstance(statement, GosubStatement):
+            targets = self.jump(statement.expr, lanes)
+            self.fail(lanes, self.depth[lanes] >= self.MAX_DEPTH)
+            self.push(lanes[~self.failed[lanes]], statement.line_number)
+        elif isinstance(statement, ReturnStatement):
+            targets = self.pop(lanes)
+        elif isinstance(statement, ForStatement):
+            self.start_loop(statement, lanes)
+        elif isinstance(statement, NextStatement):
+            targets = self.next_loop(statement, index, lanes)
+        elif isinstance(statement, EndStatement):
+            targets[:] = self.program.end
+        return targets
+
+    def assign(self, name, lanes, values, ints):
+        ok = ~self.failed[lanes]
+        if name not in self.vars:
+            self.vars[name] = (numpy.zeros(self.lanes), numpy.ones(self.lanes, dtype=bool))
+        stored, stored_ints = self.vars[name]
+        stored[lanes[ok]] = values[ok]
+        stored_ints[lanes[ok]] = ints[ok]
+
+    def exact(self, lanes, values, ints):
+        # values with the ints as Python has them, lanes whose int reaches EXACT fail
+        self.fail(lanes, ints & ~(numpy.abs(values) < self.EXACT))
+        return numpy.where(ints, values + 0.0, values)
+
+    def value(self, node, lanes):
+        # the values of an expression for lanes and the mask of those that are ints
+        if isinstance(node, Num):
+            value = node.value
+            ints = not isinstance(value, float)
+            if ints and abs(value) >= self.EXACT:
+                self.fail(lanes)
+                value = 0
+            return numpy.full(len(lanes), float(value)), numpy.full(len(lanes), ints)
+        elif isinstance(node, Var):
+            if node.name not in self.vars:
+                return numpy.zeros(len(lanes)), numpy.ones(len(lanes), dtype=bool)
+            values, ints = self.vars[node.name]
+            return values[lanes], ints[lanes]
+        elif isinstance(node, BinOp):
+            left, left_ints = self.value(node.left, lanes)
+            right, right_ints = self.value(node.right, lanes)
+            ints = left_ints & right_ints
+            if node.op.type in (DIV, MOD):
+                self.fail(lanes, right == 0)
+            if node.op.type == DIV:
+                return left / right, numpy.zeros(len(lanes), dtype=bool)
+            elif node.op.type == MOD:
+                self.fail(lanes, ~(numpy.isfinite(left) & numpy.isfinite(right)))
+            return self.exact(lanes, OPERATORS[node.op.type](left, right), ints), ints
+        elif isinstance(node, UnOp):
+            values, ints = self.value(node.factor, lanes)
+            if node.op.type == MINUS:
+                values = self.exact(lanes, -values, ints)
+            return values, ints
+        elif isinstance(node, Function):
+            values, ints = self.value(node.expr, lanes)
+            if node.name == SQR:
+                self.fail(lanes, values < 0)
+                return numpy.sqrt(values), numpy.zeros(len(lanes), dtype=bool)
+            elif node.name == INT:
+                self.fail(lanes, ~numpy.isfinite(values))
+                ints = numpy.ones(len(lanes), dtype=bool)
+                return self.exact(lanes, numpy.trunc(values), ints), ints
+            elif node.name == RND:
+                return self.random.random(len(lanes)), numpy.zeros(len(lanes), dtype=bool)
+            elif node.name == ABS:
+                return numpy.abs(values), ints
+        raise Exception(f"can not run in a batch: {node}")
+
+    def condition(self, node, lanes):
+        # the lanes an IF condition holds for, as the mask cond == True
+        if isinstance(node, BinOp) and node.op.type in (EQUALS, NEQUALS, LT, LTE, GT, GTE):
+            left, left_ints = self.value(node.left, lanes)
+            right, right_ints = self.value(node.right, lanes)
+            return OPERATORS[node.op.type](left, right)
+        values, ints = self.value(node, lanes)
+        return values == 1
+
+    def target(self, value):
+        # the index a GOTO to value leads to, None where the ast engine raises
+        try:
+            return self.program.jump(int(value) if value.is_integer() else value)
+        except ValueError:
+            return None
+
+    def targets(self, lanes, values):
+        # the index of values that are line numbers, for each of lanes
+        if not len(values) or values.min() == values.max():
+            unique, inverse = values[:1], numpy.zeros(len(values), dtype=numpy.int64)
+        else:
+            unique, inverse = numpy.unique(values, return_inverse=True)
+        indices = numpy.array([self.target(value) for value in unique.tolist()], dtype=object)
+        self.fail(lanes, indices[inverse] == None)
+        return numpy.where(indices == None, -1, indices).astype(numpy.int64)[inverse]
+
+    def jump(self, expr, lanes):
+        values, ints = self.value(expr, lanes)
+        return self.targets(lanes, values)
+
+    def push(self, lanes, line_number):
+        depth = self.depth[lanes]
+        if len(lanes) and depth.max() >= self.stack.shape[1]:
+            grown = numpy.zeros((self.lanes, max(4, 2 * self.stack.shape[1])), dtype=numpy.int64)
+            grown[:, :self.stack.shape[1]] = self.stack
+            self.stack = grown
+        self.stack[lanes, depth] = line_number
+        self.depth[lanes] = depth + 1
+
+    def pop(self, lanes):
+        self.fail(lanes, self.depth[lanes] == 0)
+        ok = ~self.failed[lanes]
+        targets = numpy.zeros(len(lanes), dtype=numpy.int64)
+        depth = self.depth[lanes[ok]] - 1
+        self.depth[lanes[ok]] = depth
+        targets[ok] = self.targets(lanes[ok], -self.stack[lanes[ok], depth].astype(float))
+        return targets
+
+    def start_loop(self, statement, lanes):
+        start, start_ints = self.value(statement.from_expr, lanes)
+        to, to_ints = self.value(statement.to_expr, lanes)
+        step, step_ints = self.value(statement.step_expr, lanes)
+        if statement not in self.loops:
+            self.loops[statement] = (numpy.zeros(self.lanes), numpy.zeros(self.lanes, dtype=bool),
+                                     numpy.zeros(self.lanes), numpy.zeros(self.lanes, dtype=bool),
+                                     numpy.zeros(self.lanes, dtype=bool))
+        loop = self.loops[statement]
+        ok = ~self.failed[lanes]
+        for stored, values in zip(loop, (to, to_ints, step, step_ints, ok)):
+            stored[lanes[ok]] = values[ok]
+        self.assign(statement.var, lanes, start, start_ints)
+
+    def next_loop(self, statement, index, lanes):
+        for_stmt = statement.for_stmt
+        if for_stmt not in self.loops:
+            self.fail(lanes)
+            return numpy.zeros(len(lanes), dtype=numpy.int64)
+        to, to_ints, step, step_ints, started = [stored[lanes] for stored in self.loops[for_stmt]]
+        self.fail(lanes, ~started)
+        values, ints = self.value(Var(for_stmt.var), lanes)
+        ints = ints & step_ints
+        values = self.exact(lanes, values + step, ints)
+        self.assign(for_stmt.var, lanes, values, ints)
+        again = (step > 0) & (values <= to) | (step <= 0) & (values >= to)
+        return numpy.where(again, self.program.jump(-for_stmt.line_number), index + 1)
+
+    def read_input(self, statement, lanes):
+        count = len(statement.var_list)
+        position = self.position[lanes]
+        ok = position + count <= self.lengths[lanes]
+        columns = [numpy.minimum(position + i, self.values.shape[1] - 1) for i in range(count)]
+        for column in columns:
+            ok &= self.valid[lanes, column]
+        self.fail(lanes, ~ok)
+        ok &= ~self.failed[lanes]
+        for var, column in zip(statement.var_list, columns):
+            self.assign(var.name, lanes[ok], self.values[lanes[ok], column[ok]], numpy.ones(int(ok.sum()), dtype=bool))
+        self.position[lanes[ok]] += count
+        self.printed.append((lanes[ok], "?" * count))
+
+    def format(self, values, ints):
+        if ints.all():
+            return [str(int(value)) for value in values.tolist()]
+        elif not ints.any():
+            return ["{:.2f}".format(value) for value in values.tolist()]
+        return [str(int(value)) if exact else "{:.2f}".format(value)
+                for value, exact in zip(values.tolist(), ints.tolist())]
+
+    def print_line(self, statement, lanes):
+        columns = []
+        for kind, value in statement.parts:
+            if kind == STRING:
+                columns.append(value)
+            else:
+                values, ints = self.value(value, lanes)
+                if kind == TAB:
+                    self.fail(lanes, ~numpy.isfinite(values))
+                columns.append((kind, values, ints))
+        ok = ~self.failed[lanes]
+        if all(isinstance(column, str) for column in columns):
+            self.printed.append((lanes[ok], ''.join(columns)))
+            return
+        if not any(kind == TAB for kind, value in statement.parts):
+            columns = [itertools.repeat(column) if isinstance(column, str) else self.format(column[1][ok], column[2][ok])
+                       for column in columns]
+            self.printed.append((lanes[ok], [''.join(row) for row in zip(*columns)]))
+            return
+        texts = [''] * int(ok.sum())
+        for column in columns:
+            if isinstance(column, str):
+                texts = [text + column for text in texts]
+                continue
+            kind, values, ints = column
+            if kind == TAB:
+                texts = [text.ljust(int(value)) for text, value in zip(texts, values[ok].tolist())]
+            else:
+                texts = [text + value for text, value in zip(texts, self.format(values[ok], ints[ok]))]
+        self.printed.append((lanes[ok], texts))
+
+    def run_alone(self, lane, index):
+        # runs a lane that left the batch from index on by itself, its output from there
+        tiny_basic, program = self.tiny_basic, self.program
+        tiny_basic.vars.clear()
+        for name, (values, ints) in self.vars.items():
+            tiny_basic.vars[name] = int(values[lane]) if ints[lane] else float(values[lane])
+        tiny_basic.stack[:] = self.stack[lane, :self.depth[lane]].tolist()
+        for statement in program.statements:
+            for_stmt = statement.for_stmt if isinstance(statement, NextStatement) else statement
+            if not isinstance(for_stmt, ForStatement):
+                continue
+            loop = self.loops.get(for_stmt)
+            if loop is not None and loop[4][lane]:
+                to, to_ints, step, step_ints, started = [stored[lane] for stored in loop]
+                tiny_basic.for_loops[for_stmt] = (int(to) if to_ints else float(to),
+                                                  int(step) if step_ints else float(step))
+            else:
+                tiny_basic.for_loops.pop(for_stmt, None)
+        self.lane = lane
+        self.written = []
+        statements, end = program.statements, program.end
+        executed = int(self.executed[lane])
+        try:
+            while True:
+                statement = statements[index]
+                result = statement.visit(tiny_basic)
+                index = index + 1 if result is None else program.jump(result)
+                if index == end: break
+                executed += 1
+                if executed >= self.max_cycles:
+                    raise Exception(f"cycles exceeded.")
+                if index < 0:
+                    raise Exception(f"{statement}, line number not found")
+        except Exception as e:
+            self.errors[lane] = str(e)
+        return ''.join(self.written)
+
+    def report(self, results, output):
+        # writes the output of every lane, each line after the number of the lane's input set
+        texts = []
+        for lane, (text, error) in enumerate(results, 1):
+            prefix = f"{lane}: "
+            if text:
+                text = text[:-1] if text.endswith("\n") else text
+                texts.append(prefix + text.replace("\n", "\n" + prefix) + "\n")
+            if error is not None:
+                error = error[:-1] if error.endswith("\n") else error
+                texts.append(f"{prefix}ERROR: " + error.replace("\n", "\n" + prefix) + "\n")
+        output.write(''.join(texts))
+
+
 class TinyBasic(object):
 
     def __init__(self, input, output, error, vars, stack, line_number, raw_lines):
@@ -763,71 +4196,504 @@ class TinyBasic(object):
         self.stack = stack
         self.line_number = line_number
         self.raw_lines = raw_lines
-        self.memory = {}
+        self.memory = ProgramStore()
         self.for_stack = []
+        self.scanner = Scanner()
+        self.engine = 'ast'
+        self.max_cycles = MAX_CYCLES
+        self.optimize = False
+        self.profile = False
+        self.profiler = None
+        self.sampler = None
+        self.checkpoint = None
+        self.memoize = False
+        self.memoizer = None
+        self.rewritten = None
+        self.program = None
+        self.hooks = []
+        self.executed = 0
+        # RND draws from random, seeded from the system unless seed() is called
+        self.random = random.Random()
+        # the TO and STEP of every FOR that ran
+        self.for_loops = {}
+
+    def seed(self, seed=None, buffered=False):
+        # a new generator for RND, drawing from numpy in blocks if buffered
+        self.random = RandomBuffer(seed) if buffered else random.Random(seed)
 
     def tokenize(self, line):
-        tokens = []
-        lexer = Lexer(line)    
-        while (True):
-            token = lexer.get_next_token()
-            if token.type == EOL:
-                break
-            tokens.append(token)
-        return tokens
+        return self.scanner.tokenize(line)
 
     def parse_line(self, raw_line):        
         tokens = raw_line.split(' ', 1)
-        if len(tokens) == 1: raise Exception("empty line?")
+        if len(tokens) == 1:
+            # a line number alone deletes the line
+            self.memory.pop(int(tokens[0]), None)
+            return
         line_number = int(tokens[0])
         raw_sub_line = tokens[1]
         if not raw_sub_line: raise Exception("empty line")
         tokens = self.tokenize(raw_sub_line)
-        parser = Parser(self.input, self.output, line_number, tokens, self.vars, self.stack, self.for_stack)
+        parser = Parser(line_number, tokens, None)
         node = parser.parse_statement()
         self.memory[line_number] = node
 
-    def parse_all(self):
-        for raw_line in self.raw_lines:
+    def scan_lines(self, scanner, raw_lines):
+        # one token stream for raw_lines, each line starting with a LINE token
+        tokens = []
+        lines = []
+        for raw_line in raw_lines:
             if not raw_line.strip(): continue
             try:
-                self.parse_line(raw_line)
+                space = raw_line.find(' ')
+                if space < 0: raise Exception("empty line?")
+                line_number = int(raw_line[:space])
+                if space + 1 == len(raw_line): raise Exception("empty line")
+                line_tokens = scanner.tokenize(raw_line, space + 1)
             except Exception as e:
-                raise Exception(f"{raw_line}, {e}")
-
-    def get_next_line_number(self, line_number, line_numbers, current_index):
-        if line_number == None:                    # just use next line
-            next_index = line_numbers.index(current_index) + 1
-        elif line_number < 0:                      # coming from RETURN
-            next_index = line_numbers.index(-line_number) + 1
-        elif line_number == 0: return              # coming from END
-        else: return line_number                   # coming from GOTO or GOSUB              
-        if next_index >= len(line_numbers): return # last statement reached
-        return line_numbers[next_index]  
+                return tokens, lines, Exception(f"{raw_line}, {e}")
+            lines.append((raw_line, len(tokens)))
+            tokens.append(Token(LINE, line_number))
+            tokens += line_tokens
+        return tokens, lines, None
 
-    def run(self):
+    def parse_all(self):
+        # PARSE_CHUNK lines at a time, so the tokens of a large program are never all kept at once,
+        # and with a scanner of its own, whose interned tokens are dropped with the parser afterwards
+        scanner = Scanner()
+        parser = Parser(0, [], self.for_stack)
+        for first in range(0, len(self.raw_lines), PARSE_CHUNK):
+            tokens, lines, error = self.scan_lines(scanner, self.raw_lines[first:first + PARSE_CHUNK])
+            parser.line = tokens
+            ends = [pos for raw_line, pos in lines[1:]] + [len(tokens)]
+            for (raw_line, pos), end in zip(lines, ends):
+                try:
+                    self.memory[tokens[pos].value] = parser.parse_line(pos, end)
+                except Exception as e:
+                    raise Exception(f"{raw_line}, {e}")
+            if error: raise error
+
+    def link(self):
+        if self.program is not None and not self.memoize and not self.vars and not self.stack:
+            # the variables before the run and the stack are what the optimizer works with
+            program, self.rewritten = self.program.link(self.optimize)
+            return program
         if len(self.memory) == 0: raise Exception("nothing to run")
-        self.line_numbers = sorted(self.memory.keys())
-        self.line_number = self.line_numbers[0]
-        executed = 0
+        self.memory.pair()
+        if self.optimize:
+            memory, aliases = Optimizer(self.memory, computed=bool(self.stack), vars=self.vars).optimize()
+            self.rewritten = memory
+        else:
+            memory, aliases = self.memory, None
+            self.rewritten = None
+        if self.memoize:
+            self.memoizer = Memoizer(memory, aliases or {}, self.vars)
+            memory = self.memoizer.memoize()
+        return LinkedProgram(memory, aliases)
+
+    def run(self):
+        program = self.link()
+        self.line_numbers = program.line_numbers
+        statements, end = program.statements, program.end
+        max_cycles = self.max_cycles or math.inf
+        loops = program.loops
+        executed = self.executed = 0
+        index = 0
+        try:
+            while True:
+                statement = statements[index]
+                self.line_number = self.line_numbers[index]
+                loop = loops.get(index)
+                if loop is not None:
+                    executed = loop.run(self, executed, max_cycles)
+                    index = loop.stop + 1
+                else:
+                    result = statement.visit(self)
+                    if result is None:
+                        index += 1
+                    else:
+                        index = program.jump(result)
+                if index == end: break
+                executed += 1
+                if executed >= max_cycles:
+                    raise Exception(f"cycles exceeded.")
+                if index < 0:
+                    raise Exception(f"{statement}, line number not found")
+        finally:
+            # the statements counted towards max_cycles, a native loop that stopped has counted further
+            self.executed = max(self.executed, executed)
+
+    def run_memoized(self):
+        # run() keeping the count in self.executed, where skipped subroutine calls add theirs
+        program = self.link()
+        self.line_numbers = program.line_numbers
+        statements, end = program.statements, program.end
+        max_cycles = self.max_cycles or math.inf
+        loops = program.loops
+        self.executed = 0
+        index = 0
         while True:
-            if self.line_number not in self.memory:
+            statement = statements[index]
+            self.line_number = self.line_numbers[index]
+            loop = loops.get(index)
+            if loop is not None:
+                self.executed = loop.run(self, self.executed, max_cycles)
+                index = loop.stop + 1
+            else:
+                result = statement.visit(self)
+                if result is None:
+                    index += 1
+                else:
+                    index = program.jump(result)
+            if index == end: break
+            self.executed += 1
+            if self.executed >= max_cycles:
+                raise Exception(f"cycles exceeded.")
+            if index < 0:
                 raise Exception(f"{statement}, line number not found")
-            statement = self.memory[self.line_number]
-            result = statement.visit()
-            self.line_number = self.get_next_line_number(result, self.line_numbers, self.line_number)
-            if self.line_number == None: break
+
+    def run_profile(self):
+        # run() without the native FOR loops, timing every statement for self.profiler
+        program = self.link()
+        profiler = self.profiler = Profiler(program, self.memory)
+        self.line_numbers = program.line_numbers
+        statements, end = program.statements, program.end
+        max_cycles = self.max_cycles or math.inf
+        stack = self.stack
+        clock = time.perf_counter
+        executed = 0
+        index = 0
+        started = clock()
+        try:
+            while True:
+                statement = statements[index]
+                self.line_number = self.line_numbers[index]
+                depth = len(stack)
+                start = clock()
+                result = statement.visit(self)
+                now = clock()
+                profiler.line(index, now - start)
+                if len(stack) > depth:
+                    profiler.call(index, result, now)
+                elif len(stack) < depth:
+                    profiler.ret(now)
+                if result is None:
+                    index += 1
+                else:
+                    index = program.jump(result)
+                if index == end: break
+                executed += 1
+                if executed >= max_cycles:
+                    raise Exception(f"cycles exceeded.")
+                if index < 0:
+                    raise Exception(f"{statement}, line number not found")
+        finally:
+            self.executed = executed
+            profiler.elapsed = clock() - started
+
+    def add_hook(self, hook):
+        # hook(events) is called with lists of the events of every run from now on, see run_hooked
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def deliver(self, events):
+        for hook in self.hooks:
+            hook(events)
+
+    def run_hooked(self):
+        # run() without the native FOR loops, passing the events of the run to self.hooks in lists of
+        # about HOOK_BATCH (kind, line number, value) tuples: ('statement', n, None) as a statement starts,
+        # ('write', n, (name, value)) for every variable it assigns, ('gosub', n, line) and
+        # ('return', n, line) with the line it goes to and ('print', n, bytes) for PRINT output
+        program = self.link()
+        self.line_numbers = line_numbers = program.line_numbers
+        statements, end = program.statements, program.end
+        output = self.output
+        counter = self.output = PrintCounter(output)
+        max_cycles = self.max_cycles or math.inf
+        vars, stack = self.vars, self.stack
+        assigned = {None: ()}
+        events = []
+        executed = 0
+        index = 0
+        try:
+            while True:
+                statement = statements[index]
+                line_number = self.line_number = line_numbers[index]
+                events.append(('statement', line_number, None))
+                depth = len(stack)
+                node = statement
+                while isinstance(node, IfStatement):
+                    # what IfStatement.visit does, to know whether THEN ran
+                    node = node.then_statement if node.bool_expr.visit(self) == True else None
+                result = None if node is None else node.visit(self)
+                names = assigned.get(node)
+                if names is None:
+                    names = assigned[node] = sorted(DataFlow.writes(node)[0])
+                for name in names:
+                    events.append(('write', line_number, (name, vars.get(name, 0))))
+                if len(stack) > depth:
+                    events.append(('gosub', line_number, result))
+                elif len(stack) < depth:
+                    events.append(('return', line_number, -result))
+                if isinstance(node, InputStatement):
+                    # the prompt is not PRINT output
+                    counter.written = 0
+                elif counter.written:
+                    events.append(('print', line_number, counter.written))
+                    counter.written = 0
+                if len(events) >= HOOK_BATCH:
+                    self.deliver(events)
+                    events = []
+                if result is None:
+                    index += 1
+                else:
+                    index = program.jump(result)
+                if index == end: break
+                executed += 1
+                if executed >= max_cycles:
+                    raise Exception(f"cycles exceeded.")
+                if index < 0:
+                    raise Exception(f"{statement}, line number not found")
+        finally:
+            self.executed = executed
+            self.output = output
+            if events:
+                self.deliver(events)
+
+    def run_checkpointed(self):
+        # run() without the native FOR loops, saving the state to self.checkpoint between statements
+        program = self.link()
+        checkpoint = self.checkpoint
+        self.line_numbers = program.line_numbers
+        statements, end = program.statements, program.end
+        max_cycles = self.max_cycles or math.inf
+        index, executed = checkpoint.load(self, program)
+        every = checkpoint.every or math.inf
+        save = executed + every
+        checkpoint.install()
+        try:
+            while True:
+                if executed >= save or checkpoint.requested:
+                    checkpoint.save(self, program, index, executed)
+                    save = executed + every
+                    if checkpoint.stopping:
+                        raise Exception(f"stopped, state saved to {checkpoint.filename}")
+                statement = statements[index]
+                self.line_number = self.line_numbers[index]
+                result = statement.visit(self)
+                if result is None:
+                    index += 1
+                else:
+                    index = program.jump(result)
+                if index == end: break
+                executed += 1
+                if executed >= max_cycles:
+                    raise Exception(f"cycles exceeded.")
+                if index < 0:
+                    raise Exception(f"{statement}, line number not found")
+        finally:
+            self.executed = executed
+            checkpoint.uninstall()
+        checkpoint.finish()
+
+    def run_jit(self):
+        program = self.link()
+        jit = TraceJit(program, self.vars, self.output, self.random, self.for_loops, self.max_cycles)
+        traces = jit.traces
+        self.line_numbers = program.line_numbers
+        statements, end = program.statements, program.end
+        max_cycles = self.max_cycles or math.inf
+        executed = 0
+        index = 0
+        while True:
+            if index in traces and jit.recording is None:
+                index, executed = traces[index](executed)
+                if index == end: break
+                continue
+            statement = statements[index]
+            self.line_number = self.line_numbers[index]
+            result = statement.visit(self)
+            if result is None:
+                next = index + 1
+            else:
+                next = program.jump(result)
+            if jit.recording is not None:
+                jit.record(index, next)
+            elif 0 <= next <= index:
+                jit.backward(next)
+            if next == end: break
             executed += 1
-            if executed >= MAX_CYCLES:
+            if executed >= max_cycles:
                 raise Exception(f"cycles exceeded.")
+            if next < 0:
+                raise Exception(f"{statement}, line number not found")
+            index = next
+
+    def run_closure(self):
+        program = self.link()
+        compiler = ClosureCompiler(program, self.vars, self.stack, self.input, self.output, self.random,
+                                   self.for_loops)
+        code = [compiler.compile_line(index) for index in range(program.end)]
+        self.line_numbers = program.line_numbers
+        end = program.end
+        max_cycles = self.max_cycles or math.inf
+        executed = 0
+        index = 0
+        try:
+            while True:
+                next = code[index]()
+                if next == end: break
+                executed += 1
+                if executed >= max_cycles:
+                    raise Exception(f"cycles exceeded.")
+                if next < 0:
+                    raise Exception(f"{program.statements[index]}, line number not found")
+                index = next
+        finally:
+            self.line_number = self.line_numbers[index]
+            compiler.store()
+
+    def transpile(self):
+        return PythonTranspiler(self.link(), self.max_cycles, computed=bool(self.stack))
+
+    def run_python(self):
+        transpiler = self.transpile()
+        self.line_numbers = transpiler.line_numbers
+        program = transpiler.build(self.random)
+        program(self.vars, self.stack, self.input, self.output)
+
+    def compile_bytecode(self):
+        return BytecodeCompiler(self.link(), self.vars, self.max_cycles).compile()
+
+    def run_vm(self):
+        bytecode = self.compile_bytecode()
+        self.line_numbers = bytecode.program.line_numbers
+        vm = VirtualMachine(bytecode, self.vars, self.stack, self.input, self.output, self.random, self.max_cycles)
+        vm.run()
+
+    def dump(self):
+        if self.engine == 'vm':
+            return self.compile_bytecode().disassemble()
+        return self.transpile().transpile()
+
+    def type_report(self):
+        line_numbers = self.memory.line_numbers
+        inference = TypeInference(line_numbers, [self.memory[n] for n in line_numbers], self.vars)
+        inference.infer()
+        return inference.report()
+
+    @staticmethod
+    def footprint(node, seen, classes):
+        # bytes of node and of what it refers to that is not in seen yet, added up by class in classes
+        total = 0
+        todo = [node]
+        while todo:
+            obj = todo.pop()
+            if id(obj) in seen:
+                continue
+            seen.add(id(obj))
+            size = sys.getsizeof(obj)
+            total += size
+            counts = classes[type(obj).__name__]
+            counts[0] += 1
+            counts[1] += size
+            if isinstance(obj, (list, tuple)):
+                todo += obj
+            elif isinstance(obj, (AST, Token)):
+                for cls in type(obj).__mro__:
+                    todo += [getattr(obj, name) for name in cls.__dict__.get('__slots__', ()) if hasattr(obj, name)]
+        return total
+
+    def memory_report(self):
+        # bytes of every line, where objects shared with lines before it are not counted again, and totals
+        seen = set()
+        classes = collections.defaultdict(lambda: [0, 0])
+        result = [f"{'line':>6} {'bytes':>8}  statement\n"]
+        total = 0
+        for line_number, statement in zip(self.memory.line_numbers, self.memory.statements):
+            size = self.footprint(statement, seen, classes)
+            total += size
+            result.append(f"{line_number:>6} {size:>8}  {statement}\n")
+        store = sys.getsizeof(self.memory.line_numbers) + sys.getsizeof(self.memory.statements)
+        result.append(f"\n{'class':<20} {'count':>10} {'bytes':>12}\n")
+        for name, (count, size) in sorted(classes.items(), key=lambda item: -item[1][1]):
+            result.append(f"{name:<20} {count:>10} {size:>12}\n")
+        lines = len(self.memory)
+        result.append(f"\nstatements {total} bytes, line numbers {store} bytes, total {total + store} bytes "
+                      f"for {lines} lines, {(total + store) / (lines or 1):.1f} bytes per line\n")
+        return ''.join(result)
+
+    def explain(self, message):
+        # an error about a statement the optimizer rewrote, told about the statement as it was entered
+        if not self.rewritten:
+            return message
+        line_numbers = sorted(self.rewritten, key=lambda n: n != self.line_number)
+        for line_number in line_numbers:
+            statement, source = self.rewritten[line_number], self.memory[line_number]
+            for node, original in ((statement, source), (ProgramStore.loop(statement), ProgramStore.loop(source))):
+                prefix = f"{node}, "
+                if node is not None and message.startswith(prefix):
+                    return f"{original}, {message[len(prefix):]}"
+        return message
+
+    def execute(self):
+        try:
+            return self.dispatch()
+        except Exception as e:
+            message = self.explain(str(e))
+            if type(e) is not Exception or message == str(e):
+                raise
+            raise Exception(message) from None
+
+    def modes(self):
+        # the ways of running set that have a run loop of their own on the tree walker
+        return [mode for mode, on in (('profile', self.profile), ('checkpoint', self.checkpoint is not None),
+                                      ('hooks', bool(self.hooks)), ('sample', self.sampler is not None),
+                                      ('memoize', self.memoize)) if on]
+
+    def dispatch(self):
+        modes = self.modes()
+        if len(modes) > 1:
+            raise Exception(f"{' and '.join(modes)} can not be used together")
+        if modes and self.engine != 'ast':
+            raise Exception(f"{modes[0]} only runs on the ast engine, not on {self.engine}")
+        if self.profile:
+            return self.run_profile()
+        if self.checkpoint is not None:
+            return self.run_checkpointed()
+        if self.hooks:
+            return self.run_hooked()
+        if self.sampler is None:
+            # the other engines compile GOSUB and RETURN themselves, memoized ones run on the tree walker
+            return self.run_memoized() if self.memoize else getattr(self, ENGINES[self.engine])()
+        self.sampler.start()
+        try:
+            self.run()
+        finally:
+            self.sampler.stop()
+            self.sampler.save()
+
+    def list_range(self, tokens):
+        # first and last line number of LIST n, LIST n-, LIST -m or LIST n-m, None where it is open
+        values = [token.value if token.type == NUMBER else token.type for token in tokens]
+        if MINUS in values:
+            ends = [values[:values.index(MINUS)], values[values.index(MINUS) + 1:]]
+        else:
+            ends = [values, values]
+        if any(len(end) > 1 or any(type(value) is not int for value in end) for end in ends):
+            raise Exception("LIST takes a line number or a range like 100-200")
+        return tuple(end[0] if end else None for end in ends)
 
-    def execute_immediate(self, command):
+    def execute_immediate(self, command, tokens=()):
         if command == LIST:
-            lines_numbers = sorted(self.memory.keys())
-            for line_number in lines_numbers:
+            first, last = self.list_range(tokens)
+            for line_number in self.memory.range(first, last):
                 statement = self.memory[line_number]                
                 self.output.write(f"{line_number} {statement}\n")
-        elif command == RUN: self.run()
+        elif command == RUN: self.execute()
         elif command == CLEAR: self.memory.clear()
         self.output.write("OK\n")
 
@@ -843,38 +4709,539 @@ class TinyBasic(object):
                     # print(f"tokens: {tokens}")
                     token = tokens[0].value if tokens[0].value != None else tokens[0].type
                     if token.upper() in IMMEDIATE_KEYWORDS:
-                        self.execute_immediate(token.upper())
+                        self.execute_immediate(token.upper(), tokens[1:])
                     else:
-                        parser = Parser(self.input, self.output, 0, tokens, self.vars, self.stack, [])
+                        parser = Parser(0, tokens, [])
                         node = parser.parse_statement()
-                        node.visit()
+                        node.visit(self)
                         self.output.write("OK\n")
             except Exception as e:
                 print(f"ERROR: {raw_line}, {e}", file=self.error)
                 # raise e
 
-def run(source_filename):
+class Program(object):
+    """A parsed program, which runs any number of times, also at once in several threads.
+
+    Its statements are paired and frozen, the memory refuses to add,
+    replace or delete lines from then on. Everything a
+    run changes, the variables, the GOSUB stack, the TO and STEP of FOR
+    loops, RND and the input and output, belongs to the TinyBasic that
+    context() makes for each run. compile() makes a Program from source.
+
+    It is linked, and optimized with -O, once for each optimize setting,
+    and the runs that start without variables share that LinkedProgram.
+    Memoized runs are linked on their own, their caches hold the
+    variables of the run.
+    """
+
+    __slots__ = ('memory', 'linked')
+
+    def __init__(self, memory):
+        if len(memory) == 0: raise Exception("nothing to run")
+        memory.freeze()
+        object.__setattr__(self, 'memory', memory)
+        object.__setattr__(self, 'linked', {})
+
+    def link(self, optimize):
+        # the LinkedProgram of a run without variables and the lines -O rewrote, made once per optimize
+        linked = self.linked.get(optimize)
+        if linked is None:
+            tiny_basic = TinyBasic(None, None, None, {}, [], 0, None)
+            tiny_basic.memory = self.memory
+            tiny_basic.optimize = optimize
+            linked = self.linked[optimize] = (tiny_basic.link(), tiny_basic.rewritten)
+        return linked
+
+    def __setattr__(self, name, value):
+        raise AttributeError("a Program can not be changed")
+
+    def context(self, stdin=None, stdout=None, stderr=None):
+        # a new interpreter for a run, stdin is a stream or the input as a string, the others default to StringIO
+        if stdin is None or isinstance(stdin, str):
+            stdin = io.StringIO(stdin)
+        tiny_basic = TinyBasic(stdin, io.StringIO() if stdout is None else stdout,
+                               io.StringIO() if stderr is None else stderr, {}, [], 0, None)
+        tiny_basic.memory = self.memory
+        tiny_basic.program = self
+        return tiny_basic
+
+    def run(self, stdin=None, stdout=None, stderr=None, engine='ast', max_cycles=MAX_CYCLES, optimize=False,
+            seed=None):
+        # the interpreter that ran the program, with its vars and output
+        tiny_basic = self.context(stdin, stdout, stderr)
+        tiny_basic.engine = engine
+        tiny_basic.max_cycles = max_cycles
+        tiny_basic.optimize = optimize
+        tiny_basic.seed(seed)
+        tiny_basic.execute()
+        return tiny_basic
+
+    def __str__(self):
+        memory = self.memory
+        return ''.join(f"{line_number} {statement}\n" for line_number, statement in zip(memory, memory.statements))
+
+
+class ProgramCache(object):
+    """Keeps parsed programs on disk so they are not parsed on every run.
+
+    Entries are kept in CACHE_DIR, a directory of the user's own that no
+    one else may write to, never next to the source. An entry is named by
+    a hash of the source text, of this interpreter's own source and of the
+    Python version, and is signed with an HMAC over a secret only the user
+    can read. The signature is checked before anything is unpickled, so a
+    file someone else put there is ignored rather than loaded. An entry
+    that does not match or does not load is ignored and the program is
+    parsed again, so a stale or corrupt cache can only cost time.
+    """
+
+    def __init__(self, source_filename, raw_lines):
+        import hashlib
+        with open(__file__, 'rb') as file:
+            interpreter = file.read()
+        source = ''.join(raw_lines).encode('utf-8', 'surrogatepass')
+        self.key = hashlib.sha256(interpreter + sys.version.encode() + source).digest()
+        self.directory = os.path.expanduser(CACHE_DIR)
+        self.path = os.path.join(self.directory, self.key.hex() + '.pickle')
+
+    def private(self, path):
+        # whether path belongs to this user and no one else may change it
+        stat = os.lstat(path)
+        if not hasattr(os, 'getuid'):
+            return True
+        return stat.st_uid == os.getuid() and not stat.st_mode & 0o022
+
+    def secret(self, create=False):
+        # the key entries are signed with, made the first time one is saved, None if there is none to trust
+        filename = os.path.join(self.directory, 'secret')
+        if create and not os.path.exists(filename):
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            try:
+                fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            except FileExistsError:
+                pass
+            else:
+                with os.fdopen(fd, 'wb') as file:
+                    file.write(os.urandom(32))
+        if not self.private(self.directory) or not self.private(filename) or os.lstat(filename).st_mode & 0o044:
+            return None
+        with open(filename, 'rb') as file:
+            secret = file.read()
+        return secret if len(secret) == 32 else None
+
+    def load(self, tiny_basic):
+        # True if the parsed program was found, memory and for_stack are then filled in
+        import hashlib, hmac, pickle
+        try:
+            secret = self.secret()
+            if secret is None or not self.private(self.path):
+                return False
+            with open(self.path, 'rb') as file:
+                data = file.read()
+            signature, payload = data[:32], data[32:]
+            if not hmac.compare_digest(hmac.new(secret, payload, hashlib.sha256).digest(), signature):
+                return False
+            key, memory, for_stack = pickle.loads(payload)
+        except Exception:
+            return False
+        if key != self.key or type(memory) is not dict or type(for_stack) is not list:
+            return False
+        tiny_basic.memory.update(memory)
+        tiny_basic.for_stack.extend(for_stack)
+        return True
+
+    def save(self, tiny_basic):
+        import hashlib, hmac, pickle
+        try:
+            secret = self.secret(create=True)
+            if secret is None:
+                return
+            payload = pickle.dumps((self.key, dict(tiny_basic.memory), tiny_basic.for_stack),
+                                   pickle.HIGHEST_PROTOCOL)
+            temp = f"{self.path}.{os.getpid()}.tmp"
+            fd = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'wb') as file:
+                file.write(hmac.new(secret, payload, hashlib.sha256).digest() + payload)
+            os.replace(temp, self.path)
+        except (OSError, pickle.PicklingError, RecursionError):
+            pass
+
+
+class Jobs(object):
+    """Runs a manifest of programs with their input across a pool of worker processes.
+
+    Every line of a manifest names a program and optionally the file its
+    input is read from, paths relative to the manifest, # starts a
+    comment. Jobs run on the ast engine with captured output, and their
+    results come back as soon as they are done. Workers are reused, each
+    keeps the programs it parsed, so a program shared by many jobs is
+    parsed once per worker.
+    """
+
+    # the Programs parsed in this process by path, with the size and time of the source they came from
+    programs = {}
+
+    @staticmethod
+    def read(filename, seed=None):
+        # (number, program, input, seed) of every job, number being the line in the manifest
+        directory = os.path.dirname(os.path.abspath(filename))
+        jobs = []
+        with open(filename) as file:
+            for number, line in enumerate(file, 1):
+                fields = line.split('#', 1)[0].split()
+                if not fields:
+                    continue
+                if len(fields) > 2:
+                    raise Exception(f"{filename} line {number}: expected a program and an input file")
+                paths = [os.path.join(directory, field) for field in fields]
+                jobs.append((number, paths[0], paths[1] if len(paths) > 1 else None, seed))
+        return jobs
+
+    @staticmethod
+    def load(filename, cache):
+        # the Program in filename, parsed earlier in this process if the source did not change
+        stat = os.stat(filename)
+        stamp = (stat.st_size, stat.st_mtime_ns)
+        parsed = Jobs.programs.get(filename)
+        if parsed is None or parsed[0] != stamp:
+            with open(filename, 'r') as file:
+                raw_lines = file.readlines()
+            tiny_basic = TinyBasic(None, None, None, {}, [], 0, raw_lines)
+            program_cache = ProgramCache(filename, raw_lines) if cache else None
+            if program_cache is None or not program_cache.load(tiny_basic):
+                tiny_basic.parse_all()
+                if program_cache is not None:
+                    program_cache.save(tiny_basic)
+            parsed = Jobs.programs[filename] = (stamp, Program(tiny_basic.memory))
+        return parsed[1]
+
+    @staticmethod
+    def execute(settings, job):
+        # the result of one job as a dict, in a worker process
+        max_cycles, cache, optimize, rnd_buffer, text = settings
+        number, filename, input_filename, seed = job
+        output, error = io.StringIO(), io.StringIO()
+        started = time.perf_counter()
+        status = 0
+        tiny_basic = None
+        try:
+            program = Jobs.load(filename, cache)
+            input = text
+            if input_filename is not None:
+                with open(input_filename, 'r') as file:
+                    input = file.read()
+            tiny_basic = program.context(input, output, error)
+            tiny_basic.max_cycles = max_cycles
+            tiny_basic.optimize = optimize
+            tiny_basic.seed(seed, rnd_buffer)
+            tiny_basic.execute()
+        except Exception as e:
+            print(f"ERROR: {e}", file=error)
+            status = 1
+        return {
+            'job': number,
+            'program': filename,
+            'input': input_filename,
+            'seed': seed,
+            'status': status,
+            'statements': tiny_basic.executed if tiny_basic is not None else 0,
+            'seconds': time.perf_counter() - started,
+            'stdout': output.getvalue(),
+            'stderr': error.getvalue(),
+            'worker': os.getpid()
+        }
+
+    @staticmethod
+    def run(jobs, workers=None, max_cycles=MAX_CYCLES, cache=False, optimize=False, rnd_buffer=False, text='',
+            chunksize=1):
+        # the results of jobs in the order they finish, text is the input of jobs without an input file
+        import multiprocessing
+        execute = functools.partial(Jobs.execute, (max_cycles, cache, optimize, rnd_buffer, text))
+        with multiprocessing.Pool(workers or os.cpu_count()) as pool:
+            yield from pool.imap_unordered(execute, jobs, chunksize)
+
+
+class MonteCarlo(object):
+    """Runs replicas of a program, each seeded differently, on Jobs and sums up the numbers they print.
+
+    Replica i runs with seed + i, so each of them can be run again alone
+    with --seed. A line of output is known by its text without the numbers
+    in it. The last such line a replica printed counts, and every number on
+    it gets its mean, standard deviation, minimum, median and maximum over
+    the replicas that ended without an error.
+    """
+
+    NUMBER = re.compile(r'-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?')
+
+    def __init__(self, program, replicas, seed):
+        self.program = program
+        self.replicas = replicas
+        self.seed = seed
+        self.values = {}
+        self.statements = []
+        self.errors = collections.Counter()
+
+    def jobs(self):
+        return [(i, self.program, None, self.seed + i) for i in range(self.replicas)]
+
+    def add(self, result):
+        if result['status'] != 0:
+            self.errors[result['stderr'].strip()] += 1
+            return
+        self.statements.append(result['statements'])
+        last = {}
+        for line in result['stdout'].splitlines():
+            numbers = self.NUMBER.findall(line)
+            if numbers:
+                last[self.NUMBER.sub('#', line).strip()] = numbers
+        for line, numbers in last.items():
+            for position, number in enumerate(numbers):
+                self.values.setdefault((line, position), []).append(float(number))
+
+    @staticmethod
+    def summary(values):
+        import statistics
+        stdev = statistics.stdev(values) if len(values) > 1 else 0.0
+        return f"{len(values):>8} {statistics.fmean(values):>12.6g} {stdev:>12.6g} {min(values):>12.6g} " \
+               f"{statistics.median(values):>12.6g} {max(values):>12.6g}"
+
+    def report(self, seconds):
+        failed = sum(self.errors.values())
+        result = f"{self.replicas} replicas of {self.program}, seeds {self.seed} to {self.seed + self.replicas - 1}, " \
+                 f"{failed} failed, {seconds:.3f} seconds\n"
+        result += f"{'replicas':>8} {'mean':>12} {'stdev':>12} {'min':>12} {'median':>12} {'max':>12}  # line\n"
+        if self.statements:
+            result += f"{self.summary(self.statements)}    statements\n"
+        for (line, position), values in sorted(self.values.items()):
+            result += f"{self.summary(values)}  {position + 1} {line}\n"
+        for error, count in self.errors.most_common():
+            result += f"{count:>8} failed: {error}\n"
+        return result
+
+
+def compile(source):
+    # the Program of source, the text of a program or a list of its lines
+    raw_lines = source.splitlines(True) if isinstance(source, str) else list(source)
+    tiny_basic = TinyBasic(None, None, None, {}, [], 0, raw_lines)
+    tiny_basic.parse_all()
+    return Program(tiny_basic.memory)
+
+
+def run(source_filename, engine='ast', max_cycles=MAX_CYCLES, dump=False, cache=False, optimize=False,
+        types=False, profile=False, profile_json=None, sample=None, checkpoint=None, memoize=False,
+        metrics=None, mem_report=False, seed=None, rnd_buffer=False):
     with open(source_filename, 'r') as file:
         raw_lines = file.readlines()
-    tiny_basic = TinyBasic(sys.stdin, sys.stdout, sys.stderr, {}, [], 0, raw_lines)
+    output = OutputBuffer(sys.stdout)
+    tiny_basic = TinyBasic(BufferedInput(sys.stdin, output), output, sys.stderr, {}, [], 0, raw_lines)
+    tiny_basic.engine = engine
+    tiny_basic.max_cycles = max_cycles
+    tiny_basic.optimize = optimize
+    tiny_basic.profile = profile or profile_json is not None
+    if sample is not None:
+        tiny_basic.sampler = Sampler(tiny_basic, sample)
+    tiny_basic.checkpoint = checkpoint
+    tiny_basic.memoize = memoize
+    tiny_basic.seed(seed, rnd_buffer)
+    counters = None if metrics is None else Metrics()
+    if counters is not None:
+        tiny_basic.add_hook(counters)
+    program_cache = ProgramCache(source_filename, raw_lines) if cache else None
+    try:
+        if program_cache is None or not program_cache.load(tiny_basic):
+            tiny_basic.parse_all()
+            if program_cache is not None:
+                program_cache.save(tiny_basic)
+        if dump:
+            sys.stdout.write(tiny_basic.dump())
+            return
+        if types:
+            sys.stdout.write(tiny_basic.type_report())
+            return
+        if mem_report:
+            sys.stdout.write(tiny_basic.memory_report())
+            return
+        tiny_basic.execute()
+    except Exception as e:
+        output.drain()
+        print(f"ERROR: {e}", file=sys.stderr)
+    finally:
+        output.drain()
+        if tiny_basic.profiler is not None:
+            sys.stderr.write(tiny_basic.profiler.report())
+            if profile_json is not None:
+                tiny_basic.profiler.save(profile_json)
+        if tiny_basic.memoizer is not None:
+            sys.stderr.write(tiny_basic.memoizer.report())
+        if counters is not None:
+            counters.save(metrics)
+
+
+def run_batch(source_filename, batch_filename, max_cycles=MAX_CYCLES, cache=False, optimize=False, seed=None,
+              rnd_buffer=False):
+    output = OutputBuffer(sys.stdout)
+    try:
+        with open(source_filename, 'r') as file:
+            raw_lines = file.readlines()
+        batch = Batch(Batch.read(batch_filename), seed)
+        tiny_basic = TinyBasic(batch, batch, sys.stderr, {}, [], 0, raw_lines)
+        tiny_basic.max_cycles = max_cycles
+        tiny_basic.optimize = optimize
+        tiny_basic.seed(seed, rnd_buffer)
+        program_cache = ProgramCache(source_filename, raw_lines) if cache else None
+        if program_cache is None or not program_cache.load(tiny_basic):
+            tiny_basic.parse_all()
+            if program_cache is not None:
+                program_cache.save(tiny_basic)
+        batch.report(batch.run(tiny_basic), output)
+    except Exception as e:
+        output.drain()
+        print(f"ERROR: {e}", file=sys.stderr)
+    finally:
+        output.drain()
+
+
+def run_jobs(manifest_filename, workers=None, max_cycles=MAX_CYCLES, cache=False, optimize=False, seed=None,
+             rnd_buffer=False):
+    # every result as a JSON line as soon as its job is done, how many failed to stderr at the end
+    try:
+        jobs = Jobs.read(manifest_filename, seed)
+        started = time.perf_counter()
+        failed = 0
+        for result in Jobs.run(jobs, workers, max_cycles, cache, optimize, rnd_buffer):
+            failed += result['status'] != 0
+            sys.stdout.write(json.dumps(result) + '\n')
+            sys.stdout.flush()
+        print(f"{len(jobs)} jobs, {failed} failed, {time.perf_counter() - started:.3f} seconds", file=sys.stderr)
+    except Exception as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+
+
+def run_replicas(source_filename, replicas, seed=None, workers=None, max_cycles=MAX_CYCLES, cache=False,
+                 optimize=False, rnd_buffer=False, input_filename=None):
+    # statistics of what the replicas print, all reading the same input from input_filename, - for stdin
     try:
-        tiny_basic.parse_all()
-        tiny_basic.run()
+        text = ''
+        if input_filename == '-':
+            text = sys.stdin.read()
+        elif input_filename is not None:
+            with open(input_filename, 'r') as file:
+                text = file.read()
+        seed = random.randrange(2 ** 32) if seed is None else seed
+        monte_carlo = MonteCarlo(source_filename, replicas, seed)
+        started = time.perf_counter()
+        chunksize = max(1, replicas // ((workers or os.cpu_count()) * 4))
+        for result in Jobs.run(monte_carlo.jobs(), workers, max_cycles, cache, optimize, rnd_buffer, text, chunksize):
+            monte_carlo.add(result)
+        sys.stdout.write(monte_carlo.report(time.perf_counter() - started))
     except Exception as e:
         print(f"ERROR: {e}", file=sys.stderr)
 
 
-def repl():
+def repl(engine='ast', max_cycles=MAX_CYCLES, optimize=False, sample=None, seed=None, rnd_buffer=False):
     tiny_basic = TinyBasic(sys.stdin, sys.stdout, sys.stderr, {}, [], 0, None)
+    tiny_basic.engine = engine
+    tiny_basic.max_cycles = max_cycles
+    tiny_basic.optimize = optimize
+    tiny_basic.seed(seed, rnd_buffer)
+    if sample is not None:
+        tiny_basic.sampler = Sampler(tiny_basic, sample)
     tiny_basic.repl()
 
 def main(argv):
-    print("Tiny Basic v0.1")
-    if len(argv) == 1:
-        run(argv[0])
+    parser = argparse.ArgumentParser(prog='tb.py', description='Tiny Basic interpreter')
+    parser.add_argument('filename', nargs='?', help='program to run, starts the repl if omitted')
+    parser.add_argument('--engine', choices=ENGINES, default='ast',
+                        help='execution engine, ast walks the parse tree, closure compiles it first, '
+                             'python translates the whole program into one Python function, '
+                             'vm compiles it to bytecode for a register machine, '
+                             'jit walks the tree and compiles hot loops')
+    parser.add_argument('--dump', action='store_true',
+                        help='print the bytecode of the vm engine or the Python source of the python engine '
+                             'instead of running the program')
+    parser.add_argument('--max-cycles', type=int, default=MAX_CYCLES,
+                        help=f'statements to execute before giving up, 0 for no limit (default {MAX_CYCLES})')
+    parser.add_argument('-O', '--optimize', action='store_true',
+                        help='fold constants, leave out REM lines and shorten GOTO chains before running, '
+                             'REM lines and skipped GOTOs then no longer count as cycles')
+    parser.add_argument('--types', action='store_true',
+                        help='print the type of every variable and why it is not an int instead of running '
+                             'the program, -O specializes arithmetic and PRINT on ints')
+    parser.add_argument('--mem-report', action='store_true',
+                        help='print the bytes the parsed program takes per line and in total instead of running it')
+    parser.add_argument('--profile', action='store_true',
+                        help='run the program on the ast engine, timing every line, and print the lines '
+                             'by time spent to stderr when it ends')
+    parser.add_argument('--profile-json', metavar='FILE',
+                        help='like --profile, also writes the profile to FILE as JSON')
+    parser.add_argument('--sample', metavar='FILE',
+                        help='run programs on the ast engine while a thread samples the current line and '
+                             'GOSUB stack, and write the samples to FILE as collapsed stacks for flamegraphs')
+    parser.add_argument('--checkpoint', metavar='FILE',
+                        help='run the program on the ast engine and save its state to FILE on SIGUSR1, on SIGTERM, '
+                             'which also stops it, and every --checkpoint-every statements')
+    parser.add_argument('--checkpoint-every', metavar='N', type=int, default=0,
+                        help='statements between two saves of --checkpoint, 0 to only save on a signal (default)')
+    parser.add_argument('--resume', action='store_true',
+                        help='go on from the state saved in the --checkpoint FILE if there is one')
+    parser.add_argument('--batch', metavar='FILE',
+                        help='run the program once for every line of FILE, whose values separated by commas or '
+                             'spaces are its input, all lines at once with numpy, and print every output line '
+                             'after the number of its line in FILE')
+    parser.add_argument('--memoize', action='store_true',
+                        help='run the program on the ast engine, skip calls to subroutines that only assign '
+                             'variables when a call with the same values was made before, and print how often '
+                             'that happened to stderr when it ends; a skipped call counts as many statements '
+                             'towards --max-cycles as it ran when it was cached')
+    parser.add_argument('--metrics', metavar='FILE',
+                        help='run the program on the ast engine counting statements, assignments to each '
+                             'variable, GOSUBs, RETURNs and PRINT bytes, and write the counters to FILE in the '
+                             'Prometheus text format when it ends')
+    parser.add_argument('--jobs', metavar='MANIFEST',
+                        help='run the jobs of MANIFEST, each line a program and the file its input is read from, '
+                             'on a pool of processes on the ast engine, and print the output, exit status, '
+                             'statements and seconds of every job as a JSON line as soon as it is done')
+    parser.add_argument('--workers', metavar='N', type=int, default=None,
+                        help='processes running --jobs or --replicas (default one per core)')
+    parser.add_argument('--seed', metavar='N', type=int, default=None,
+                        help='seed the generator RND draws from with N, so runs are repeatable')
+    parser.add_argument('--rnd-buffer', action='store_true',
+                        help=f'draw the numbers of RND from numpy, {RND_BUFFER} at a time')
+    parser.add_argument('--replicas', metavar='N', type=int, default=None,
+                        help='run N replicas of the program on a pool of processes, with seeds from --seed on, '
+                             'all reading the same --input, and print statistics of the numbers each printed '
+                             'last on every line')
+    parser.add_argument('--input', metavar='FILE', default=None,
+                        help='the input all --replicas read, - for stdin (default no input)')
+    parser.add_argument('--cache', action='store_true',
+                        help=f'keep the parsed program in {CACHE_DIR} and use it again as long as neither the '
+                             'program nor the interpreter changed')
+    args = parser.parse_args(argv)
+    # each of these runs the program in a loop of its own on the ast engine
+    modes = [flag for flag, value in (('--profile', args.profile or args.profile_json),
+                                      ('--checkpoint', args.checkpoint), ('--metrics', args.metrics),
+                                      ('--sample', args.sample), ('--memoize', args.memoize)) if value]
+    if len(modes) > 1:
+        parser.error(f"{' and '.join(modes)} can not be used together")
+    if modes and args.engine != 'ast':
+        parser.error(f"{modes[0]} only runs on the ast engine, not with --engine {args.engine}")
+    if not args.dump and not args.types and not args.mem_report and not args.jobs and not args.replicas:
+        print("Tiny Basic v0.1")
+    if args.jobs:
+        run_jobs(args.jobs, args.workers, args.max_cycles, args.cache, args.optimize, args.seed,
+                 args.rnd_buffer)
+    elif args.filename and args.replicas:
+        run_replicas(args.filename, args.replicas, args.seed, args.workers, args.max_cycles, args.cache,
+                     args.optimize, args.rnd_buffer, args.input)
+    elif args.filename and args.batch:
+        run_batch(args.filename, args.batch, args.max_cycles, args.cache, args.optimize, args.seed,
+                  args.rnd_buffer)
+    elif args.filename:
+        checkpoint = Checkpoint(args.checkpoint, args.checkpoint_every, args.resume) if args.checkpoint else None
+        run(args.filename, args.engine, args.max_cycles, args.dump, args.cache, args.optimize, args.types,
+            args.profile, args.profile_json, args.sample, checkpoint, args.memoize,
+            args.metrics, args.mem_report, args.seed, args.rnd_buffer)
     else:
-        repl()
+        repl(args.engine, args.max_cycles, args.optimize, args.sample, args.seed, args.rnd_buffer)
 
 if __name__ == '__main__':
-    import sys
     main(sys.argv[1:])
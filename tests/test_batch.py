@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+
+# tests for --batch: every lane prints and fails as the program run alone on its input does
+
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(TESTS_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+import tb
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# divides by zero, takes roots of negative numbers, makes ints of 2^53 and more, -0.0 and computed GOTOs
+MIXED = """10 INPUT A, B
+20 LET C = 0
+30 IF A > B THEN LET C = 1.5
+40 GOSUB 200
+50 FOR I = 1 TO A STEP 2
+60 LET C = C + I * B
+70 IF I MOD 3 = 0 THEN GOSUB 300
+80 NEXT
+90 PRINT "C=";C, TAB(A MOD 7 + 10);A / (B - 3)
+100 LET D = A * 1000000000 * B
+110 PRINT D, INT(C), SQR(A - 5)
+120 IF B = 7 THEN GOTO C
+130 IF B = 8 THEN GOTO A
+140 GOTO 160
+150 PRINT "skipped"
+160 LET E = -A * 0
+170 PRINT E * 1.5; ABS(-C); -E
+180 END
+200 LET C = C + A MOD (B + 0.5)
+210 RETURN
+300 PRINT "three", I
+310 RETURN
+"""
+SEED = 1
+
+
+def alone(source, lines, optimize, max_cycles):
+    # (output, error) of the program run by itself on the input lines
+    tiny_basic = tb.TinyBasic(io.StringIO(''.join(line + '\n' for line in lines)), io.StringIO(), io.StringIO(),
+                              {}, [], 0, source.splitlines(True))
+    tiny_basic.optimize = optimize
+    tiny_basic.max_cycles = max_cycles
+    tiny_basic.parse_all()
+    error = None
+    try:
+        tiny_basic.execute()
+    except Exception as e:
+        error = str(e)
+    return tiny_basic.output.getvalue(), error
+
+
+def batched(source, inputs, optimize, max_cycles):
+    batch = tb.Batch(inputs)
+    tiny_basic = tb.TinyBasic(batch, batch, io.StringIO(), {}, [], 0, source.splitlines(True))
+    tiny_basic.optimize = optimize
+    tiny_basic.max_cycles = max_cycles
+    tiny_basic.parse_all()
+    return batch, batch.run(tiny_basic)
+
+
+@unittest.skipIf(numpy is None, "batch mode needs numpy")
+class BatchTest(unittest.TestCase):
+
+    def check(self, source, inputs, max_cycles=tb.MAX_CYCLES):
+        for optimize in (False, True):
+            batch, results = batched(source, inputs, optimize, max_cycles)
+            self.assertEqual(len(results), len(inputs))
+            for lines, result in zip(inputs, results):
+                with self.subTest(input=lines, optimize=optimize):
+                    self.assertEqual(result, alone(source, lines, optimize, max_cycles))
+        return batch
+
+    def test_mixed(self):
+        generator = random.Random(SEED)
+        def value():
+            return str(generator.choice([generator.randint(-20, 20), generator.randint(-10 ** 6, 10 ** 6),
+                                         0, 3, 7, 8, 'x', 10 ** 17, 2 ** 53 - 1]))
+        inputs = [[value(), value()] for _ in range(200)] + [[], ['1']]
+        batch = self.check(MIXED, inputs)
+        self.assertLess(len(batch.alone), len(inputs))
+
+    def test_samples(self):
+        for name, inputs, max_cycles in [
+                ('sine', [[str(angle)] for angle in range(-720, 721, 45)], tb.MAX_CYCLES),
+                ('collatz', [[str(n)] for n in range(-3, 200, 7)], tb.MAX_CYCLES),
+                ('factorial', [[] for _ in range(3)], 20)]:
+            with open(os.path.join(ROOT_DIR, 'sample', name + '.bas')) as file:
+                source = file.read()
+            self.check(source, inputs, max_cycles)
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'inputs.txt')
+            with open(filename, 'w') as file:
+                file.write("1, 2\n9 3\nx 1\n")
+            with contextlib.redirect_stdout(io.StringIO()) as stdout:
+                tb.main(['--batch', filename, os.path.join(ROOT_DIR, 'sample', 'sine.bas')])
+        self.assertEqual(stdout.getvalue(), "Tiny Basic v0.1\n"
+                                            "1: COMPUTING SIN(X)\n1: ANGLE?SIN=0.02\n"
+                                            "2: COMPUTING SIN(X)\n2: ANGLE?SIN=0.16\n"
+                                            "3: COMPUTING SIN(X)\n3: ANGLE?\n3: ERROR: not an int: x\n")
+
+
+if __name__ == '__main__':
+    unittest.main()
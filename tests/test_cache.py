@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+
+# tests for --cache: entries are used again, and ignored when they are not the user's own or were changed
+
+import contextlib
+import io
+import os
+import pickle
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(TESTS_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+import tb
+
+COUNT = """10 FOR I = 1 TO 3
+20 PRINT I * I
+30 NEXT
+40 END
+"""
+
+
+def interpreter(source=COUNT):
+    return tb.TinyBasic(io.StringIO(), io.StringIO(), io.StringIO(), {}, [], 0, source.splitlines(True))
+
+
+@unittest.skipUnless(hasattr(os, 'getuid'), "needs file owners and modes")
+class CacheTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = os.path.join(directory.name, 'tinybasic')
+        patch = mock.patch.object(tb, 'CACHE_DIR', self.directory)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def save(self, source=COUNT):
+        tiny_basic = interpreter(source)
+        tiny_basic.parse_all()
+        cache = tb.ProgramCache('count.bas', source.splitlines(True))
+        cache.save(tiny_basic)
+        return cache
+
+    def test_used_again(self):
+        cache = self.save()
+        self.assertEqual(os.stat(self.directory).st_mode & 0o777, 0o700)
+        self.assertEqual(os.stat(os.path.join(self.directory, 'secret')).st_mode & 0o777, 0o600)
+        tiny_basic = interpreter()
+        self.assertTrue(cache.load(tiny_basic))
+        tiny_basic.execute()
+        self.assertEqual(tiny_basic.output.getvalue(), "1\n4\n9\n")
+        self.assertNotEqual(tb.ProgramCache('count.bas', ["10 END\n"]).path, cache.path)
+        self.assertFalse(tb.ProgramCache('count.bas', ["10 END\n"]).load(interpreter()))
+
+    def test_changed_entry(self):
+        cache = self.save()
+        with open(cache.path, 'rb') as file:
+            signature = file.read(32)
+        # an entry that would load, with the signature of another
+        with open(cache.path, 'wb') as file:
+            file.write(signature + pickle.dumps((cache.key, {10: tb.EndStatement()}, [])))
+        tiny_basic = interpreter()
+        self.assertFalse(cache.load(tiny_basic))
+        self.assertEqual(tiny_basic.memory, {})
+
+    def test_shared_secret(self):
+        cache = self.save()
+        os.chmod(os.path.join(self.directory, 'secret'), 0o644)
+        self.assertFalse(cache.load(interpreter()))
+        os.chmod(os.path.join(self.directory, 'secret'), 0o600)
+        os.chmod(self.directory, 0o777)
+        self.assertFalse(cache.load(interpreter()))
+        os.chmod(self.directory, 0o700)
+        os.chmod(cache.path, 0o666)
+        self.assertFalse(cache.load(interpreter()))
+
+    def test_main(self):
+        filename = os.path.join(os.path.dirname(self.directory), 'count.bas')
+        with open(filename, 'w') as file:
+            file.write(COUNT)
+        for _ in range(2):
+            with contextlib.redirect_stdout(io.StringIO()) as stdout:
+                tb.main(['--cache', filename])
+            self.assertEqual(stdout.getvalue(), "Tiny Basic v0.1\n1\n4\n9\n")
+        self.assertEqual(sorted(name.endswith('.pickle') for name in os.listdir(self.directory)), [False, True])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+#!/usr/bin/python3
+
+# tests for --checkpoint and --resume: a resumed run ends as if it had never stopped
+
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(TESTS_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+import tb
+
+WALK = """10 FOR I = 1 TO 40
+20 LET X = X + INT(RND(1) * 10)
+30 IF I MOD 10 = 0 THEN GOSUB 100
+40 NEXT
+50 END
+100 PRINT I, X
+110 RETURN
+"""
+
+
+def interpreter(checkpoint=None, max_cycles=tb.MAX_CYCLES):
+    tiny_basic = tb.TinyBasic(io.StringIO(), io.StringIO(), io.StringIO(), {}, [], 0, WALK.splitlines(True))
+    tiny_basic.checkpoint = checkpoint
+    tiny_basic.max_cycles = max_cycles
+    tiny_basic.seed(7)
+    tiny_basic.parse_all()
+    return tiny_basic
+
+
+class CheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.filename = os.path.join(directory.name, 'walk.json')
+
+    def test_resume(self):
+        plain = interpreter()
+        plain.execute()
+        stopped = interpreter(tb.Checkpoint(self.filename, 25), max_cycles=70)
+        with self.assertRaisesRegex(Exception, "cycles exceeded"):
+            stopped.execute()
+        self.assertEqual(stopped.executed, 70)
+        with open(self.filename) as file:
+            state = json.load(file)
+        self.assertEqual(state['executed'], 50)
+        self.assertEqual(state['loops'], {'10': [40, 1]})
+        resumed = interpreter(tb.Checkpoint(self.filename, 25, resume=True))
+        resumed.execute()
+        # the checkpoint at statement 50 was taken after the line for I = 10 was printed
+        printed = stopped.output.getvalue().splitlines()[:1] + resumed.output.getvalue().splitlines()
+        self.assertEqual(printed, plain.output.getvalue().splitlines())
+        self.assertEqual(resumed.executed, plain.executed)
+        self.assertFalse(os.path.exists(self.filename))
+
+    def test_other_program(self):
+        with open(self.filename, 'w') as file:
+            json.dump({'program': 'another'}, file)
+        resumed = interpreter(tb.Checkpoint(self.filename, 0, resume=True))
+        with self.assertRaisesRegex(Exception, "it is of another program"):
+            resumed.execute()
+
+    def test_loops_hold_to_and_step(self):
+        stopped = interpreter(tb.Checkpoint(self.filename, 25), max_cycles=30)
+        with self.assertRaises(Exception):
+            stopped.execute()
+        with open(self.filename) as file:
+            state = json.load(file)
+        state['loops'] = {'10': [1, 40, 1]}
+        with open(self.filename, 'w') as file:
+            json.dump(state, file)
+        with self.assertRaisesRegex(Exception, "can not resume"):
+            interpreter(tb.Checkpoint(self.filename, 25, resume=True)).execute()
+
+
+if __name__ == '__main__':
+    unittest.main()
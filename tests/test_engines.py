@@ -0,0 +1,230 @@
+#!/usr/bin/python3
+
+# differential tests for tb.py: every engine, with and without -O, prints what the ast engine prints
+
+import contextlib
+import glob
+import io
+import os
+import random
+import sys
+import unittest
+from unittest import mock
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(TESTS_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+import tb
+
+PROGRAMS = ['sample/*.bas', 'games/*.bas']
+# what tb.py printed for the programs that do not use RND before any engine but ast was written,
+# tests/golden/<name>.out is its standard output and <name>.err its standard error if it had any
+GOLDEN_DIR = os.path.join(TESTS_DIR, 'golden')
+SEED = 12345
+GENERATED = 150
+# far more than any of the programs runs, -O counts fewer statements, so none of them may get near it
+MAX_CYCLES = 100000
+
+
+def fixture(path):
+    # the scripted input for a program, bench/inputs/<name>.in
+    name = os.path.splitext(os.path.basename(path))[0]
+    filename = os.path.join(ROOT_DIR, 'bench', 'inputs', name + '.in')
+    if not os.path.exists(filename):
+        return ''
+    with open(filename) as file:
+        return file.read()
+
+
+def run_main(path, text, engine, optimize):
+    # (standard output, standard error) of tb.py running a program with text as its standard input
+    argv = ['--engine', engine] + (['-O'] if optimize else []) + [path]
+    with mock.patch.object(sys, 'stdin', io.StringIO(text)), \
+            contextlib.redirect_stdout(io.StringIO()) as stdout, contextlib.redirect_stderr(io.StringIO()) as stderr:
+        tb.main(argv)
+    return stdout.getvalue(), stderr.getvalue()
+
+
+def run(source, text, engine, optimize):
+    # (output, error) of a run, the games ask again until the scripted input runs out
+    output = io.StringIO()
+    tiny_basic = tb.TinyBasic(io.StringIO(text), output, io.StringIO(), {}, [], 0, source.splitlines(True))
+    tiny_basic.engine = engine
+    tiny_basic.max_cycles = MAX_CYCLES
+    tiny_basic.optimize = optimize
+    tiny_basic.seed(SEED)
+    error = None
+    try:
+        tiny_basic.parse_all()
+        tiny_basic.execute()
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return output.getvalue(), error
+
+
+class Generator(object):
+    """Makes random programs that always end.
+
+    GOTOs only jump forward, FOR loops have constant bounds and their
+    variables are never assigned in the body, and subroutines come after
+    the END of the main program. A GOTO may still land inside a loop, so
+    its NEXT runs before its FOR, or on a line that does not exist, and
+    expressions divide by zero, take roots of negative numbers and make
+    -0.0, so the errors are compared as well.
+    """
+
+    VARS = 'ABCDEF'
+    LOOP_VARS = 'IJK'
+    INPUT = '3\n-2\n7\n0\n'
+
+    def __init__(self, seed):
+        self.random = random.Random(seed)
+
+    def number(self):
+        return self.random.choice(['0', '1', '2', '3', '7', '10', '0.5', '1.5', '0.0', '-0.0', '-1', '-2.5'])
+
+    def expr(self, depth=0):
+        choice = self.random.random()
+        if depth > 2 or choice < 0.3:
+            return self.number()
+        if choice < 0.55:
+            return self.random.choice(self.VARS + self.LOOP_VARS)
+        if choice < 0.65:
+            name = self.random.choice(['INT', 'ABS', 'SQR', 'RND'])
+            return f"{name}({self.expr(depth + 1)})"
+        if choice < 0.7:
+            return f"-{self.expr(depth + 1)}"
+        operator = self.random.choice(['+', '-', '*', '/', 'MOD'])
+        if operator in ('/', 'MOD') and self.random.random() < 0.8:
+            # most divisions should not end the program
+            return f"({self.expr(depth + 1)} {operator} {self.random.choice(['2', '3', '0.5', '-1.5'])})"
+        return f"({self.expr(depth + 1)} {operator} {self.expr(depth + 1)})"
+
+    def condition(self):
+        operator = self.random.choice(['<', '>', '=', '<>', '<='])
+        return f"{self.expr()} {operator} {self.expr()}"
+
+    def target(self, line_numbers, i):
+        # a line after i, now and then one that does not exist
+        if self.random.random() < 0.05:
+            return line_numbers[-1] + 5
+        return self.random.choice(line_numbers[i + 1:])
+
+    def simple(self, line_numbers, i, subroutines):
+        choice = self.random.random()
+        if choice < 0.35:
+            return f"LET {self.random.choice(self.VARS)} = {self.expr()}"
+        if choice < 0.6:
+            separator = self.random.choice([', ', '; '])
+            return "PRINT " + separator.join(self.expr() for _ in range(self.random.randint(1, 3)))
+        if choice < 0.7:
+            target = self.target(line_numbers, i)
+            if self.random.random() < 0.3:
+                return f"GOTO {target} + 0 * {self.random.choice(self.VARS)}"
+            return f"GOTO {target}"
+        if choice < 0.8 and subroutines:
+            return f"GOSUB {self.random.choice(subroutines)}"
+        if choice < 0.85:
+            return f"INPUT {self.random.choice(self.VARS)}"
+        return f"IF {self.condition()} THEN {self.simple(line_numbers, i, subroutines)}"
+
+    def program(self):
+        # the source and its input
+        size = self.random.randint(5, 25)
+        line_numbers = [10 * (n + 1) for n in range(size + 1)]
+        subroutines = [line_numbers[-1] + 100 * (n + 1) for n in range(self.random.randint(0, 2))]
+        statements = [None] * size
+        open_loops = []
+        for i in range(size):
+            if len(open_loops) < len(self.LOOP_VARS) and i < size - 2 and self.random.random() < 0.15:
+                var = self.LOOP_VARS[len(open_loops)]
+                low, high = self.random.randint(-2, 2), self.random.randint(2, 5)
+                step = self.random.choice(['1', '2', '0.5', '-1'])
+                if step == '-1':
+                    low, high = high, low
+                statements[i] = f"FOR {var} = {low} TO {high} STEP {step}"
+                open_loops.append(var)
+            elif open_loops and self.random.random() < 0.3:
+                statements[i] = "NEXT"
+                open_loops.pop()
+            else:
+                statements[i] = self.simple(line_numbers, i, subroutines)
+        lines = [f"{n} {s}" for n, s in zip(line_numbers, statements)]
+        lines += [f"{line_numbers[-1] - 5 + n} NEXT" for n in range(len(open_loops))]
+        lines.append(f"{line_numbers[-1]} END")
+        for start in subroutines:
+            lines.append(f"{start} LET {self.random.choice(self.VARS)} = {self.expr()}")
+            lines.append(f"{start + 10} PRINT {self.expr()}")
+            lines.append(f"{start + 20} RETURN")
+        return "\n".join(lines) + "\n", self.INPUT
+
+
+class EngineTest(unittest.TestCase):
+
+    def check(self, name, source, text):
+        expected = run(source, text, 'ast', False)
+        for engine in tb.ENGINES:
+            for optimize in (False, True):
+                with self.subTest(program=name, engine=engine, optimize=optimize):
+                    self.assertEqual(run(source, text, engine, optimize), expected)
+
+    def test_programs(self):
+        for pattern in PROGRAMS:
+            for path in sorted(glob.glob(os.path.join(ROOT_DIR, pattern))):
+                with open(path) as file:
+                    source = file.read()
+                self.check(os.path.relpath(path, ROOT_DIR), source, fixture(path))
+
+    def test_golden(self):
+        for filename in sorted(glob.glob(os.path.join(GOLDEN_DIR, '*.out'))):
+            name = os.path.splitext(os.path.basename(filename))[0]
+            path, = [path for pattern in PROGRAMS for path in glob.glob(os.path.join(ROOT_DIR, pattern))
+                     if os.path.basename(path) == name + '.bas']
+            with open(filename) as file:
+                expected = file.read()
+            error = ''
+            if os.path.exists(os.path.join(GOLDEN_DIR, name + '.err')):
+                with open(os.path.join(GOLDEN_DIR, name + '.err')) as file:
+                    error = file.read()
+            for engine in tb.ENGINES:
+                for optimize in (False, True):
+                    with self.subTest(program=name, engine=engine, optimize=optimize):
+                        self.assertEqual(run_main(path, fixture(path), engine, optimize), (expected, error))
+
+    def test_generated(self):
+        generator = Generator(SEED)
+        for n in range(GENERATED):
+            source, text = generator.program()
+            self.check(f"generated {n}:\n{source}", source, text)
+
+    def test_next_before_for(self):
+        source = "10 GOTO 30\n20 FOR I = 1 TO 3\n30 PRINT I\n40 NEXT\n50 END\n"
+        self.check("next before for", source, '')
+        self.assertEqual(run(source, '', 'ast', False),
+                         ("0\n", "Exception: FOR I = 1 TO 3 STEP 1, NEXT before its FOR ran"))
+
+    def test_negative_zero(self):
+        source = "10 LET A = 0.0\n20 LET B = -1 * 0.0\n30 PRINT A, B\n40 PRINT 0 * -1.0, 0.0\n50 END\n"
+        self.check("negative zero", source, '')
+        source = "10 INPUT X\n20 LET A = X * 0.0\n30 LET B = X * -0.0\n40 PRINT A; B\n50 END\n"
+        self.check("negative zero subexpression", source, '1\n')
+        self.assertEqual(run(source, '1\n', 'ast', True), ("?0.00 -0.00\n", None))
+
+    def test_print_before_error(self):
+        # what a PRINT built before a value raised is still written
+        source = "10 PRINT \"AB\", SQR(-1)\n20 END\n"
+        self.check("print before error", source, '')
+        self.assertEqual(run(source, '', 'ast', False), ("AB", "ValueError: math domain error"))
+        source = "10 FOR I = 1 TO 3\n20 PRINT \"AB\"; I; TAB(9); 10 / (2 - I)\n30 NEXT\n40 END\n"
+        self.check("print tab before error", source, '')
+        self.assertEqual(run(source, '', 'ast', False),
+                         ("AB 1      10.00\nAB 2      ", "ZeroDivisionError: division by zero"))
+
+    def test_rewritten_error(self):
+        source = "10 LET Y = 5\n20 IF INT(INT(Y)) >= 1 THEN GOTO 99\n30 END\n"
+        self.check("rewritten error", source, '')
+
+
+if __name__ == '__main__':
+    unittest.main()
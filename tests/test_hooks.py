@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+
+# tests for hooks and --metrics: the events of a run, and the counters made of them
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(TESTS_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+import tb
+
+SUM = """10 FOR I = 1 TO 3
+20 GOSUB 100
+30 NEXT
+40 END
+100 LET S = S + I
+110 PRINT S
+120 RETURN
+"""
+
+
+def interpreter(*hooks, max_cycles=0):
+    tiny_basic = tb.TinyBasic(io.StringIO(), io.StringIO(), io.StringIO(), {}, [], 0, SUM.splitlines(True))
+    tiny_basic.max_cycles = max_cycles
+    for hook in hooks:
+        tiny_basic.add_hook(hook)
+    tiny_basic.parse_all()
+    return tiny_basic
+
+
+class HookTest(unittest.TestCase):
+
+    def test_events(self):
+        events = []
+        tiny_basic = interpreter(events.extend)
+        tiny_basic.execute()
+        self.assertEqual(tiny_basic.output.getvalue(), "1\n3\n6\n")
+        self.assertEqual(events[:12], [
+            ('statement', 10, None), ('write', 10, ('I', 1)),
+            ('statement', 20, None), ('gosub', 20, 100),
+            ('statement', 100, None), ('write', 100, ('S', 1)),
+            ('statement', 110, None), ('print', 110, 2),
+            ('statement', 120, None), ('return', 120, 20),
+            ('statement', 30, None), ('write', 30, ('I', 2))])
+        self.assertEqual(events[-1], ('statement', 40, None))
+
+    def test_executed(self):
+        plain = interpreter()
+        plain.execute()
+        hooked = interpreter(tb.Metrics())
+        hooked.execute()
+        self.assertEqual(hooked.executed, plain.executed)
+        stopped = interpreter(tb.Metrics(), max_cycles=5)
+        with self.assertRaisesRegex(Exception, "cycles exceeded"):
+            stopped.execute()
+        self.assertEqual(stopped.executed, 5)
+
+    def test_metrics(self):
+        metrics = tb.Metrics()
+        tiny_basic = interpreter(metrics)
+        tiny_basic.execute()
+        tiny_basic.remove_hook(metrics)
+        text = metrics.text()
+        self.assertIn("tinybasic_statements_total 17\n", text)
+        self.assertIn("tinybasic_gosub_calls_total 3\n", text)
+        self.assertIn("tinybasic_gosub_returns_total 3\n", text)
+        self.assertIn("tinybasic_variable_writes_total{variable=\"I\"} 4\n", text)
+        self.assertIn("tinybasic_variable_writes_total{variable=\"S\"} 3\n", text)
+        self.assertIn("tinybasic_print_bytes_total 6\n", text)
+        self.assertEqual(tiny_basic.hooks, [])
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as directory:
+            program = os.path.join(directory, 'sum.bas')
+            filename = os.path.join(directory, 'metrics.prom')
+            with open(program, 'w') as file:
+                file.write(SUM)
+            with contextlib.redirect_stdout(io.StringIO()) as stdout:
+                tb.main(['--metrics', filename, program])
+            with open(filename) as file:
+                text = file.read()
+        self.assertIn("1\n3\n6\n", stdout.getvalue())
+        self.assertIn("tinybasic_statements_total 17\n", text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+#!/usr/bin/python3
+
+# tests for --memoize: skipped calls give the same output, errors and statement counts as running them
+
+import contextlib
+import io
+import os
+import sys
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(TESTS_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+import tb
+
+SQUARES = """10 FOR I = 1 TO 6
+20 LET X = I MOD 3
+30 GOSUB 100
+40 PRINT I, Y
+50 NEXT
+60 END
+100 LET Y = 0
+110 FOR J = 1 TO X
+120 LET Y = Y + J * J
+130 NEXT
+140 IF Y > 3 THEN GOSUB 200
+150 RETURN
+200 LET Y = Y * 2
+210 RETURN
+"""
+
+
+def run(source, memoize, max_cycles=0):
+    tiny_basic = tb.TinyBasic(io.StringIO(), io.StringIO(), io.StringIO(), {}, [], 0, source.splitlines(True))
+    tiny_basic.memoize = memoize
+    tiny_basic.max_cycles = max_cycles
+    tiny_basic.parse_all()
+    error = None
+    try:
+        tiny_basic.execute()
+    except Exception as e:
+        error = str(e)
+    return tiny_basic, error
+
+
+class MemoizeTest(unittest.TestCase):
+
+    def test_same_output(self):
+        plain, error = run(SQUARES, False)
+        memoized, memoized_error = run(SQUARES, True)
+        self.assertIsNone(error)
+        self.assertIsNone(memoized_error)
+        self.assertEqual(memoized.output.getvalue(), plain.output.getvalue())
+        self.assertEqual(memoized.vars, plain.vars)
+        self.assertIn("GOSUB 100: 6 calls, 3 hits", memoized.memoizer.report())
+
+    def test_skipped_calls_count_as_cycles(self):
+        self.assertEqual(run(SQUARES, True)[0].executed, run(SQUARES, False)[0].executed)
+        for max_cycles in range(1, 80):
+            with self.subTest(max_cycles=max_cycles):
+                plain, error = run(SQUARES, False, max_cycles)
+                memoized, memoized_error = run(SQUARES, True, max_cycles)
+                self.assertEqual((memoized.output.getvalue(), memoized_error), (plain.output.getvalue(), error))
+
+    def test_hooks_are_refused(self):
+        tiny_basic = tb.TinyBasic(io.StringIO(), io.StringIO(), io.StringIO(), {}, [], 0, SQUARES.splitlines(True))
+        tiny_basic.memoize = True
+        tiny_basic.add_hook(tb.Metrics())
+        tiny_basic.parse_all()
+        with self.assertRaisesRegex(Exception, "hooks and memoize can not be used together"):
+            tiny_basic.execute()
+        with contextlib.redirect_stderr(io.StringIO()) as stderr, self.assertRaises(SystemExit):
+            tb.main(['--memoize', '--metrics', os.devnull, os.path.join(ROOT_DIR, 'sample', 'factorial.bas')])
+        self.assertIn("--metrics and --memoize can not be used together", stderr.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+
+# tests for the run modes with a loop of their own: they refuse each other and the other engines
+
+import contextlib
+import io
+import os
+import sys
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(TESTS_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+import tb
+
+FACTORIAL = os.path.join(ROOT_DIR, 'sample', 'factorial.bas')
+
+
+def usage_error(argv):
+    # what main prints to stderr for argv, which it has to refuse
+    with contextlib.redirect_stderr(io.StringIO()) as stderr, contextlib.redirect_stdout(io.StringIO()):
+        try:
+            tb.main(argv)
+        except SystemExit as e:
+            if e.code == 2:
+                return stderr.getvalue()
+    return None
+
+
+class ModesTest(unittest.TestCase):
+
+    def test_combinations_are_refused(self):
+        self.assertIn("--profile and --memoize can not be used together",
+                      usage_error(['--profile', '--memoize', FACTORIAL]))
+        self.assertIn("--checkpoint and --metrics can not be used together",
+                      usage_error(['--checkpoint', os.devnull, '--metrics', os.devnull, FACTORIAL]))
+        self.assertIn("--profile and --sample can not be used together",
+                      usage_error(['--profile-json', os.devnull, '--sample', os.devnull, FACTORIAL]))
+
+    def test_other_engines_are_refused(self):
+        for flags in (['--profile'], ['--memoize'], ['--sample', os.devnull], ['--metrics', os.devnull],
+                      ['--checkpoint', os.devnull]):
+            with self.subTest(flags=flags):
+                self.assertIn(f"{flags[0]} only runs on the ast engine, not with --engine vm",
+                              usage_error(flags + ['--engine', 'vm', FACTORIAL]))
+
+    def test_api(self):
+        tiny_basic = tb.TinyBasic(io.StringIO(), io.StringIO(), io.StringIO(), {}, [], 0, ["10 PRINT 1\n"])
+        tiny_basic.parse_all()
+        tiny_basic.engine = 'closure'
+        tiny_basic.profile = True
+        with self.assertRaisesRegex(Exception, "profile only runs on the ast engine, not on closure"):
+            tiny_basic.execute()
+        tiny_basic.engine = 'ast'
+        tiny_basic.execute()
+        self.assertEqual(tiny_basic.output.getvalue(), "1\n")
+
+
+if __name__ == '__main__':
+    unittest.main()
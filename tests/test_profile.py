@@ -0,0 +1,56 @@
+#!/usr/bin/python3
+
+# tests for --profile: the hot line report and the statements it counted
+
+import io
+import os
+import sys
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(TESTS_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+import tb
+
+LOOP = """10 FOR I = 1 TO 5
+20 GOSUB 100
+30 NEXT
+40 END
+100 LET S = S + I
+110 RETURN
+"""
+
+
+def interpreter(source, profile):
+    tiny_basic = tb.TinyBasic(io.StringIO(), io.StringIO(), io.StringIO(), {}, [], 0, source.splitlines(True))
+    tiny_basic.profile = profile
+    tiny_basic.parse_all()
+    return tiny_basic
+
+
+class ProfileTest(unittest.TestCase):
+
+    def test_counts(self):
+        tiny_basic = interpreter(LOOP, True)
+        tiny_basic.execute()
+        counts = {line_number: count for line_number, count, self_time, cumulative, source
+                  in tiny_basic.profiler.lines()}
+        self.assertEqual(counts, {10: 1, 20: 5, 30: 5, 40: 1, 100: 5, 110: 5})
+        self.assertEqual(tiny_basic.vars['S'], 15)
+
+    def test_executed(self):
+        plain = interpreter(LOOP, False)
+        plain.execute()
+        profiled = interpreter(LOOP, True)
+        profiled.execute()
+        self.assertEqual(profiled.executed, plain.executed)
+        stopped = interpreter(LOOP, True)
+        stopped.max_cycles = 7
+        with self.assertRaisesRegex(Exception, "cycles exceeded"):
+            stopped.execute()
+        self.assertEqual(stopped.executed, 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+
+# tests for compile() and Program: runs with fresh state that share the parsed and linked program
+
+import os
+import sys
+import threading
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(TESTS_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+import tb
+
+COUNT = """10 INPUT N
+20 FOR I = 1 TO N
+30 LET S = S + I * I
+40 NEXT
+50 PRINT S
+60 END
+"""
+
+
+class ProgramTest(unittest.TestCase):
+
+    def test_runs_have_fresh_state(self):
+        program = tb.compile(COUNT)
+        first = program.run('3\n')
+        second = program.run('4\n', engine='vm', optimize=True)
+        self.assertEqual(first.output.getvalue(), "?14\n")
+        self.assertEqual(second.output.getvalue(), "?30\n")
+        self.assertEqual(first.vars['S'], 14)
+
+    def test_linked_once(self):
+        program = tb.compile(COUNT)
+        program.run('3\n')
+        program.run('3\n', engine='closure')
+        linked, rewritten = program.link(False)
+        self.assertIs(program.link(False)[0], linked)
+        self.assertIsNone(rewritten)
+        self.assertIsNot(program.link(True)[0], linked)
+        self.assertIsInstance(linked.line_numbers, tuple)
+        self.assertIsInstance(linked.statements, tuple)
+
+    def test_frozen(self):
+        program = tb.compile(COUNT)
+        with self.assertRaises(AttributeError):
+            program.memory = None
+        with self.assertRaisesRegex(Exception, "can not be changed"):
+            program.memory[70] = tb.EndStatement()
+        with self.assertRaisesRegex(Exception, "can not be changed"):
+            del program.memory[10]
+        with self.assertRaisesRegex(Exception, "can not be changed"):
+            program.memory.clear()
+        self.assertEqual(str(program), "10 INPUT N\n20 FOR I = 1 TO N STEP 1\n30 LET S = S + I * I\n"
+                                       "40 NEXT\n50 PRINT S\n60 END\n")
+
+    def test_threads(self):
+        program = tb.compile(COUNT)
+        results = {}
+        def run(n):
+            results[n] = program.run(f"{n}\n", engine='python', optimize=n % 2 == 0).output.getvalue()
+        threads = [threading.Thread(target=run, args=(n,)) for n in range(1, 21)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, {n: f"?{sum(i * i for i in range(1, n + 1))}\n" for n in range(1, 21)})
+
+    def test_nothing_to_run(self):
+        with self.assertRaisesRegex(Exception, "nothing to run"):
+            tb.compile("")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+#!/usr/bin/python3
+
+# tests for --sample: the collapsed stacks of the lines a run was found at
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(TESTS_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+import tb
+
+CALLS = """10 FOR I = 1 TO 20000
+20 GOSUB 100
+30 NEXT
+40 PRINT "S="; S
+50 END
+100 LET S = S + I
+110 IF I MOD 2 = 0 THEN GOSUB 200
+120 RETURN
+200 LET T = T + 1
+210 RETURN
+"""
+
+
+def interpreter(source=CALLS):
+    tiny_basic = tb.TinyBasic(io.StringIO(), io.StringIO(), io.StringIO(), {}, [], 0, source.splitlines(True))
+    tiny_basic.max_cycles = 0
+    tiny_basic.parse_all()
+    return tiny_basic
+
+
+class SamplerTest(unittest.TestCase):
+
+    def test_collapsed(self):
+        tiny_basic = interpreter()
+        sampler = tb.Sampler(tiny_basic, os.devnull)
+        sampler.samples = {((), 30): 4, ((20,), 100): 3, ((20, 110), 200): 2, ((), 40): 1}
+        self.assertEqual(sampler.collapsed(),
+                         "30 NEXT 4\n"
+                         "40 PRINT \"S=\",S 1\n"
+                         "20 GOSUB 100;100 LET S = S + I 3\n"
+                         "20 GOSUB 100;110 IF I MOD 2 = 0 THEN GOSUB 200;200 LET T = T + 1 2\n")
+
+    def test_run(self):
+        plain = interpreter()
+        plain.execute()
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'calls.folded')
+            sampled = interpreter()
+            sampled.sampler = tb.Sampler(sampled, filename, 0.0005)
+            sampled.execute()
+            with open(filename) as file:
+                lines = file.read().splitlines()
+        self.assertEqual(sampled.output.getvalue(), plain.output.getvalue())
+        self.assertFalse(sampled.sampler.thread.is_alive())
+        self.assertTrue(lines)
+        labels = {sampled.sampler.label(line_number) for line_number in sampled.memory}
+        for line in lines:
+            stack, count = line.rsplit(' ', 1)
+            frames = stack.split(';')
+            self.assertGreater(int(count), 0)
+            self.assertLessEqual(set(frames), labels)
+            self.assertLessEqual(len(frames), 3)
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as directory:
+            program = os.path.join(directory, 'calls.bas')
+            filename = os.path.join(directory, 'calls.folded')
+            with open(program, 'w') as file:
+                file.write(CALLS)
+            with contextlib.redirect_stdout(io.StringIO()) as stdout:
+                tb.main(['--max-cycles', '0', '--sample', filename, program])
+            self.assertTrue(os.path.exists(filename))
+        self.assertEqual(stdout.getvalue(), "Tiny Basic v0.1\nS= 200010000\n")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+
+# tests for ProgramStore and the REPL: lines stay in order and FOR and NEXT stay paired through any edit
+
+import io
+import os
+import random
+import sys
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(TESTS_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+import tb
+
+SEED = 3
+
+
+def repl(text):
+    # (output, errors) of a REPL session
+    tiny_basic = tb.TinyBasic(io.StringIO(text), io.StringIO(), io.StringIO(), {}, [], 0, None)
+    tiny_basic.max_cycles = tb.MAX_CYCLES
+    tiny_basic.repl()
+    return tiny_basic.output.getvalue(), tiny_basic.error.getvalue()
+
+
+class StoreTest(unittest.TestCase):
+
+    def test_like_a_dict(self):
+        generator = random.Random(SEED)
+        store, expected = tb.ProgramStore(), {}
+        for _ in range(2000):
+            line_number = generator.randint(1, 300)
+            if generator.random() < 0.3 and expected:
+                line_number = generator.choice(list(expected))
+                del store[line_number]
+                del expected[line_number]
+            else:
+                statement = tb.EndStatement()
+                store[line_number] = expected[line_number] = statement
+            first, last = sorted(generator.randint(0, 310) for _ in range(2))
+            self.assertEqual(store.range(first, last), sorted(n for n in expected if first <= n <= last))
+        self.assertEqual(list(store), sorted(expected))
+        self.assertEqual(len(store), len(expected))
+        self.assertEqual({n: store[n] for n in store}, expected)
+        self.assertEqual(store.range(), sorted(expected))
+        self.assertNotIn(301, store)
+        with self.assertRaises(KeyError):
+            store[301]
+        with self.assertRaises(KeyError):
+            del store[301]
+
+    def test_pairs_after_edits(self):
+        tiny_basic = tb.TinyBasic(io.StringIO(), io.StringIO(), io.StringIO(), {}, [], 0, None)
+        for line in ["50 NEXT", "10 FOR I = 1 TO 2", "30 FOR J = 1 TO 2", "40 NEXT", "20 PRINT I"]:
+            tiny_basic.parse_line(line)
+        memory = tiny_basic.memory
+        self.assertFalse(memory.paired)
+        memory.pair()
+        self.assertIs(memory[40].for_stmt, memory[30])
+        self.assertIs(memory[50].for_stmt, memory[10])
+        del memory[30]
+        tiny_basic.parse_line("35 IF 1 = 1 THEN FOR J = 1 TO 3")
+        memory.pair()
+        self.assertIs(memory[40].for_stmt, memory[35].then_statement)
+        tiny_basic.parse_line("60 NEXT")
+        with self.assertRaisesRegex(Exception, "NEXT has no matching FOR"):
+            memory.pair()
+
+    def test_session(self):
+        output, errors = repl("30 PRINT I\n10 FOR I = 1 TO 2\n20 PRINT \"X\"\n40 NEXT\n25 PRINT \"Y\"\n"
+                              "LIST 20-30\nLIST 25-\nLIST -20\n25\nLIST\nRUN\nLIST x\n")
+        self.assertEqual(output,
+                         "20 PRINT \"X\"\n25 PRINT \"Y\"\n30 PRINT I\nOK\n"
+                         "25 PRINT \"Y\"\n30 PRINT I\n40 NEXT\nOK\n"
+                         "10 FOR I = 1 TO 2 STEP 1\n20 PRINT \"X\"\nOK\n"
+                         "10 FOR I = 1 TO 2 STEP 1\n20 PRINT \"X\"\n30 PRINT I\n40 NEXT\nOK\n"
+                         "X\n1\nX\n2\nOK\n")
+        self.assertEqual(errors, "ERROR: LIST x, LIST takes a line number or a range like 100-200\n")
+
+    def test_clear(self):
+        output, errors = repl("10 PRINT 1\nCLEAR\n20 PRINT 2\nLIST\n")
+        self.assertEqual((output, errors), ("OK\n20 PRINT 2\nOK\n", ""))
+
+
+if __name__ == '__main__':
+    unittest.main()